@@ -6,20 +6,35 @@ order to easily parse the FVS results, particularly those in the Stand & Stock t
 results are transcribed from the SQLite database into a nested python dictionary structure for easier management (for
 example, storing data on carbon density within various pools for each stand), via the sql_to_nested_dictionaries()
 function.  Summary figures are generated in matplotlib.  Other module dependencies include numpy for its basic vector
-algebra capability; statsmodels for running multiple linear regression to determine which model inputs drive key model
-results; my own analysis_tools.gen_stats() function to facilitate linear regression with significance testing; and
-my own db_tools.list_to_sql() function to facilitate uploading tabular data to a SQLite database file.
+algebra capability; the determinants module for running the linear regressions that determine which model inputs
+drive key model results; my own analysis_tools.gen_stats() function to facilitate linear regression with significance
+testing; and my own db_tools.list_to_sql() function to facilitate uploading tabular data to a SQLite database file.
 """
 
 from analysis_tools import gen_stats
+import checkpoint
 import csv
 import datetime
 from db_tools import list_to_sql
+import determinants
+import figures
+import gzip
 import matplotlib
+from matplotlib.collections import LineCollection
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import qc
+import Queue
+import resampling
 import sqlite3
+import threading
+
+try:
+    import zstandard
+    zstd_available = True
+except ImportError:
+    zstd_available = False
 
 
 # define conversion constants
@@ -27,66 +42,313 @@ _acre_to__ha = 1.0/0.40469
 st_acre_to_Mg_ha = 0.90719/0.40469
 ft2_acre_to_m2_ha = ((12.0*0.0254)**2) * (1.0/0.40469)
 
+# columns of uploaded FVS results assigned SQLite types 'TEXT' or 'INT' (all others are assigned 'REAL')
+text_columns = ['StandID', 'MgmtID', 'Species', 'DiamClass', 'CaseID']
+int_columns = ['Year', 'Forest_type']
+
+# FVS database output tables and column names that differ from those of the equivalent .csv report exports
+fvs_db_tables = {'SS': 'FVS_StdStk', 'Carbon': 'FVS_Carbon'}
+fvs_db_column_names = {'DBHClass': 'DiamClass'}
+
+# extensions of compressed FVS results files, in the order in which they are looked for when a plain .csv file is absent
+compressed_extensions = ['.gz', '.zst']
+
+
+class BackgroundReader(object):
+    """ Iterates over the lines of a binary stream (e.g., a decompressing file object), with the reading and
+    decompression done on a background thread that keeps a bounded queue of blocks ahead of the consumer.  This lets
+    decompression of large compressed results files overlap with .csv parsing and database insertion.
+    """
+
+    def __init__(self, stream, block_size=4*1024*1024, queue_blocks=8):
+        """
+        :param stream: binary file object with a read() method (file)
+        :param block_size: size of each block read from the stream, bytes (int)
+        :param queue_blocks: number of blocks the background thread may read ahead (int)
+        """
+
+        self.stream = stream
+        self.block_size = block_size
+        self.blocks = Queue.Queue(maxsize=queue_blocks)
+        self.error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._read)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read(self):
+        # read blocks until the end of the stream, then queue None to mark it
+        try:
+            while not self.stopped.is_set():
+                block = self.stream.read(self.block_size)
+                if not block:
+                    break
+                self._put(block)
+        except Exception as e:
+            self.error = e
+        self._put(None)
+
+    def _put(self, block):
+        # wait for space in the queue, giving up if the reader is closed
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(block, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def __iter__(self):
+        # lines may end in '\n', '\r\n' or '\r', as in a file opened with universal newlines ("rU"); a '\r' at the
+        # end of a block is held back until the next block shows whether it begins a '\r\n'
+        remainder = ''
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                break
+            text = remainder + block
+            held = '\r' if text.endswith('\r') else ''
+            lines = text[:len(text) - len(held)].replace('\r\n', '\n').replace('\r', '\n').split('\n')
+            remainder = lines.pop() + held
+            for line in lines:
+                yield line + '\n'
+        if self.error is not None:
+            raise self.error
+        if remainder:
+            yield remainder.replace('\r', '\n')
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.stream.close()
+
+
+def open_results_file(fpath, block_size=4*1024*1024):
+    """ Opens a .csv results file for streaming line by line, transparently decompressing gzip (.gz) and, when the
+    zstandard module is installed, zstd (.zst) files on a background thread, so that compressed exports never have to
+    be decompressed to disk.
+
+    :param fpath: full path to the plain or compressed .csv file (str)
+    :param block_size: size of the blocks decompressed ahead of parsing, bytes (int)
+    :return: iterable of lines with a close() method (file or BackgroundReader)
+    """
+
+    if fpath.endswith('.gz'):
+        return BackgroundReader(gzip.open(fpath, 'rb'), block_size=block_size)
+    if fpath.endswith('.zst'):
+        if not zstd_available:
+            raise ImportError("reading %s requires the zstandard module" % fpath)
+        raw_file = open(fpath, 'rb')
+        return BackgroundReader(zstandard.ZstdDecompressor().stream_reader(raw_file), block_size=block_size)
+    return open(fpath, "rU")
+
 
-def type_assignment_bulk_convert_upload(csv_fpath, db_fpath, table, conversion_factor=0.0):
+def results_file_path(fpath):
+    """ Locates a results file, falling back to a compressed copy (e.g., Scenario-SS.csv.gz) when the plain file named
+    does not exist.
+
+    :param fpath: full path to the plain .csv file (str)
+    :return: full path to the plain file or its first existing compressed copy (str)
+    """
+
+    if os.path.exists(fpath):
+        return fpath
+    for extension in compressed_extensions:
+        if (extension != '.zst' or zstd_available) and os.path.exists(fpath + extension):
+            return fpath + extension
+    return fpath
+
+
+def type_assignment_bulk_convert_upload(csv_fpath, db_fpath, table, conversion_factor=0.0, filter_string='',
+                                        include_stands=None, exclude_stands=None):
     """ Function facilitates uploading tabular .csv file data without a row of data types to a SQLite database.
     Rather than looking for SQLite data types as the second row in the .csv file, this routine assigns a type of 'REAL'
-    to every data column except those listed in the 'text_columns' (assigned 'TEXT') and 'int_columns' (assigned 'INT')
-    lists below.
+    to every data column except those listed in the module-level 'text_columns' (assigned 'TEXT') and 'int_columns'
+    (assigned 'INT') lists.  Rows are streamed from the .csv file into the database rather than held in memory, and
+    can be filtered as they are loaded, either by a SQLite query applied to each row or by sets of StandIDs to include
+    or exclude, so that filtered-out records are never written to the database.
 
-    :param csv_fpath: full path to .csv file to be uploaded (str)
+    :param csv_fpath: full path to .csv file to be uploaded, which may be gzip (.gz) or zstd (.zst) compressed (str)
     :param db_fpath: full path to SQLite database file to receive data (str)
     :param table: name for table to be created with the database (str)
+    :param conversion_factor: unit conversion factor applied to all REAL columns (float)
+    :param filter_string: SQLite query (e.g., WHERE StandID !='T1_MedBow_LS7') applied to each row as it is loaded
+        (str)
+    :param include_stands: if given, only rows for these StandIDs are loaded (set of str)
+    :param exclude_stands: if given, rows for these StandIDs are not loaded (set of str)
     :return:
     """
 
-    # create temporary data storage structure and open .csv file
-    data_table = []
-    open_file = open(csv_fpath, "rU")
-    csv_lines = csv.reader(open_file)
-
-    # read the .csv file header, and specify column names of data type 'TEXT' or 'INT' (rather than 'REAL')
-    header = next(csv_lines)
-    text_columns = ['StandID', 'MgmtID', 'Species', 'DiamClass', 'CaseID']
-    int_columns = ['Year', 'Forest_type']
-
-    # remove any SQLite-illegal characters from the header list (which will become SQLite column names)
-    for i in range(len(header)):
-        header[i] = header[i].translate(None, " ,.()-/")
-
-    # create a list of SQLite types corresponding to the header list
-    types = []
-    for column in header:
-        if column in text_columns:
-            types.append('TEXT')
-        elif column in int_columns:
-            types.append('INT')
+    open_file = open_results_file(csv_fpath)
+    try:
+        csv_lines = csv.reader(open_file)
+
+        # read the .csv file header, and remove any SQLite-illegal characters from it (entries will become column names)
+        header = next(csv_lines)
+        for i in range(len(header)):
+            header[i] = header[i].translate(None, " ,.()-/")
+
+        # create a list of SQLite types corresponding to the header list
+        types = []
+        for column in header:
+            if column in text_columns:
+                types.append('TEXT')
+            elif column in int_columns:
+                types.append('INT')
+            else:
+                types.append('REAL')
+
+        def typed_rows():
+            # convert each row to python values of the column types, removing excess whitespace from TEXT entries and
+            # applying the unit conversion to REAL entries, and skip rows of excluded stands
+            stand_index = header.index('StandID') if 'StandID' in header else None
+            for line in csv_lines:
+                if not line:
+                    continue
+                row = [sql_value(entry, types[e], conversion_factor) for e, entry in enumerate(line)]
+                if stand_index is not None:
+                    if include_stands is not None and row[stand_index] not in include_stands:
+                        continue
+                    if exclude_stands and row[stand_index] in exclude_stands:
+                        continue
+                yield row
+
+        # stream the rows to the database; with a filter, each row is inserted through a single-row SELECT to which the
+        # filter is applied
+        if filter_string:
+            insert = "INSERT INTO %s SELECT * FROM (SELECT %s) %s" % \
+                     (table, ', '.join('? AS %s' % column for column in header), filter_string)
         else:
-            types.append('REAL')
-
-    # copy header list, types list, and raw data to the temporary data storage structure, removing excess whitespace
-    # from all TEXT data entries
-    data_table.append(header)
-    data_table.append(types)
-    for line in csv_lines:
-        for text_column in text_columns:
-            if text_column in header:
-                text_index = header.index(text_column)
-                line[text_index] = line[text_index].replace(" ", "")
-        data_table.append(line)
-
-    # apply unit conversion to all float data
-    if conversion_factor:
-        for row in data_table[2:]:
-            for e, entry in enumerate(row):
-                if types[e] == 'REAL':
-                    row[e] = str(float(row[e]) * conversion_factor)
-
-    # transcribe temporary storage structure to SQLite database
-    list_to_sql(data_table, db_fpath, table)
+            insert = "INSERT INTO %s VALUES (%s)" % (table, ', '.join('?' * len(header)))
+        con = sqlite3.connect(db_fpath)
+        with con:
+            cur = con.cursor()
+            cur.execute("CREATE TABLE %s (%s)" % (table, ', '.join('%s %s' % pair for pair in zip(header, types))))
+            cur.executemany(insert, typed_rows())
+        con.close()
+    finally:
+        # stop the background decompression thread, and close the stream, even if the upload fails
+        open_file.close()
     return
 
 
+def sql_value(entry, sql_type, conversion_factor=0.0):
+    """ Converts a .csv text entry to the python value stored in a column of the given SQLite type.  Entries that do
+    not parse as numbers (e.g., blanks) are stored as text, as SQLite type affinity would.
+
+    :param entry: raw .csv entry (str)
+    :param sql_type: 'TEXT', 'INT' or 'REAL' (str)
+    :param conversion_factor: unit conversion factor applied to REAL entries (float)
+    :return: converted value (str, int or float)
+    """
+
+    if sql_type == 'TEXT':
+        return entry.replace(" ", "")
+    try:
+        if sql_type == 'INT':
+            return int(entry)
+        if conversion_factor:
+            return float(entry) * conversion_factor
+        return float(entry)
+    except ValueError:
+        return entry
+
+
+def stand_set_clause(include_stands=None, exclude_stands=None):
+    """ Expresses sets of StandIDs to include or exclude as a SQLite WHERE clause, quoting each StandID as a string
+    literal with any embedded quotes doubled.
+
+    :param include_stands: if given, StandIDs to be retained (set of str)
+    :param exclude_stands: if given, StandIDs to be removed (set of str)
+    :return: WHERE clause, or an empty string if neither set is given (str)
+    """
+
+    def literals(stands):
+        return ', '.join("'%s'" % stand.replace("'", "''") for stand in sorted(stands))
+
+    conditions = []
+    if include_stands is not None:
+        conditions.append("StandID IN (%s)" % literals(include_stands))
+    if exclude_stands:
+        conditions.append("StandID NOT IN (%s)" % literals(exclude_stands))
+    if conditions:
+        return "WHERE " + " AND ".join(conditions)
+    return ''
+
+
+def fvs_db_bulk_convert_upload(fvs_db_fpath, db_fpath, fvs_table, table, run_title, conversion_factor=0.0,
+                               filter_string='', include_stands=None, exclude_stands=None):
+    """ Function facilitates copying a report table directly from an FVS output database (e.g., FVSOut.db) into the
+    working SQLite database, as an alternative to exporting the report to .csv and uploading it with
+    type_assignment_bulk_convert_upload().  The FVS database is ATTACHed to the working database and the table is
+    built with a single INSERT ... SELECT, so that column typing, removal of whitespace from TEXT entries, unit
+    conversion and record filtering are all performed within SQLite and no data passes through python.
+
+    :param fvs_db_fpath: full path to FVS output database file (str)
+    :param db_fpath: full path to SQLite database file to receive data (str)
+    :param fvs_table: name of the FVS output table to be copied, e.g. 'FVS_StdStk' (str)
+    :param table: name for table to be created with the database (str)
+    :param run_title: FVS run title (FVS_Cases.RunTitle) identifying the cases to be copied (str)
+    :param conversion_factor: unit conversion factor applied to all REAL columns (float)
+    :param filter_string: SQLite query (e.g., WHERE StandID !='T1_MedBow_LS7') applied to filter the copied records
+        (str)
+    :param include_stands: if given, only records for these StandIDs are copied (set of str)
+    :param exclude_stands: if given, records for these StandIDs are not copied (set of str)
+    :return:
+    """
+
+    con = sqlite3.connect(db_fpath)
+    with con:
+        cur = con.cursor()
+        cur.execute("ATTACH DATABASE ? AS fvs", (fvs_db_fpath,))
+
+        # determine the column names, SQLite types and conversion expressions consistent with the .csv upload
+        cur.execute("PRAGMA fvs.table_info(%s)" % fvs_table)
+        columns = []
+        types = []
+        expressions = []
+        for column_tuple in cur.fetchall():
+            fvs_column = str(column_tuple[1])
+            column = fvs_db_column_names.get(fvs_column, fvs_column).translate(None, " ,.()-/")
+            columns.append(column)
+            if column in text_columns:
+                types.append('TEXT')
+                expressions.append("REPLACE(%s, ' ', '') AS %s" % (fvs_column, column))
+            elif column in int_columns:
+                types.append('INT')
+                expressions.append("%s AS %s" % (fvs_column, column))
+            else:
+                types.append('REAL')
+                if conversion_factor:
+                    expressions.append("(%s * %r) AS %s" % (fvs_column, conversion_factor, column))
+                else:
+                    expressions.append("%s AS %s" % (fvs_column, column))
+
+        # bind the StandIDs to include or exclude as parameters into temporary tables, rather than writing them into
+        # the query, so that any StandID (and any number of them) can be filtered on
+        conditions = []
+        for stand_table, operator, stands in (('include_stands', 'IN', include_stands),
+                                              ('exclude_stands', 'NOT IN', exclude_stands or None)):
+            if stands is not None:
+                cur.execute("CREATE TEMP TABLE %s (StandID TEXT PRIMARY KEY)" % stand_table)
+                cur.executemany("INSERT OR IGNORE INTO temp.%s VALUES (?)" % stand_table,
+                                ((stand,) for stand in stands))
+                conditions.append("StandID %s (SELECT StandID FROM temp.%s)" % (operator, stand_table))
+        stand_filter = "WHERE " + " AND ".join(conditions) if conditions else ''
+
+        # transcribe the selected cases, applying the filter to the converted records
+        cur.execute("CREATE TABLE %s (%s)" % (table, ', '.join('%s %s' % pair for pair in zip(columns, types))))
+        cur.execute(""" INSERT INTO %s
+                        SELECT * FROM (SELECT * FROM (SELECT %s
+                                                      FROM fvs.%s
+                                                      WHERE CaseID IN (SELECT CaseID FROM fvs.FVS_Cases
+                                                                       WHERE RunTitle=?))
+                                       %s)
+                        %s """ % (table, ', '.join(expressions), fvs_table, filter_string, stand_filter),
+                    (run_title,))
+    con.execute("DETACH DATABASE fvs")
+    con.close()
+
+
 def sql_append_unit_conversion(cursor_object, table, original_column, new_column, conversion_factor):
     """ Simple function to facilitate taking data from a column, applying a conversion factor, and saving it into a new
     column with a different name (note that SQLite lacks the capability to re-name existing columns).
@@ -223,7 +485,8 @@ def deficit(years, systemC_control_list, systemC_RX_list):
     return integrated_deficit, running_deficit
 
 
-def upload_convert_filter_process(working_path, db_file, rx_control_prefixes, site_file, filter_string=''):
+def upload_convert_filter_process(working_path, db_file, rx_control_prefixes, site_file, filter_string='',
+                                  fvs_db_file='', include_stands=None, exclude_stands=None):
     """ Function to upload raw FVS Stand & Stock table and FFE carbon results into a database, and process into new
     summary data tables.  Operations include defining input file paths; uploading files to an SQLite database, including
     bulk unit conversion for the Carbon results; performing individual column unit conversions for Stand & Stock
@@ -238,7 +501,12 @@ def upload_convert_filter_process(working_path, db_file, rx_control_prefixes, si
     :param site_file: the full name (extension included) of the file within the working_path in which contains FVS site
         data (aspect, elevation, slope, etc.) (str)
     :param filter_string: SQLite query (e.g., WHERE StandID !='T1_MedBow_LS7') to be applied to filter out specific
-        stands or other records from all input data files (str)
+        stands or other records from all input data files as they are loaded (str)
+    :param include_stands: if given, only these stands are loaded from the input data files (set of str)
+    :param exclude_stands: if given, these stands are not loaded from the input data files (set of str)
+    :param fvs_db_file: optional name of an FVS output database file (e.g., FVSOut.db) within the working_path, from
+        which Stand & Stock and Carbon results are read directly, selecting cases by run titles matching the
+        rx_control_prefixes, rather than from exported .csv files (str)
     :return: path where database file and all results files & figures will be stored (str); nested dictionary structure
         containing stand carbon density data (dict of float)
     """
@@ -248,17 +516,20 @@ def upload_convert_filter_process(working_path, db_file, rx_control_prefixes, si
     print "Uploading and converting results for scenario '%s' and control '%s'" % (analysis_name, control_name)
     print
 
-    # define paths to all input files, delete database if it already exists
-    control_SS_table = working_path + control_name + '-SS.csv'
-    rx_SS_table = working_path + analysis_name + '-SS.csv'
-    control_carbon = working_path + control_name + '-Carbon.csv'
-    rx_carbon = working_path + analysis_name + '-Carbon.csv'
+    # define paths to all input files (using compressed copies where plain .csv files are absent), delete database if
+    # it already exists
+    control_SS_table = results_file_path(working_path + control_name + '-SS.csv')
+    rx_SS_table = results_file_path(working_path + analysis_name + '-SS.csv')
+    control_carbon = results_file_path(working_path + control_name + '-Carbon.csv')
+    rx_carbon = results_file_path(working_path + analysis_name + '-Carbon.csv')
 
-    site_data = working_path + site_file
+    site_data = results_file_path(working_path + site_file)
 
-    if filter_string:
-        print "Filtering raw results based on the following SQL statement:"
+    stand_filter = stand_set_clause(include_stands, exclude_stands)
+    if filter_string or stand_filter:
+        print "Filtering raw results based on the following SQL statement(s):"
         print filter_string
+        print stand_filter
         print
         analysis_name += '_Filtered'
 
@@ -273,31 +544,37 @@ def upload_convert_filter_process(working_path, db_file, rx_control_prefixes, si
     if os.path.exists(db_fpath):
         os.remove(db_fpath)
 
-    # load FVS results to working SQLite database
-    type_assignment_bulk_convert_upload(control_SS_table, db_fpath, 'Control_StandStock')
-    type_assignment_bulk_convert_upload(rx_SS_table, db_fpath, 'RX_StandStock')
-    type_assignment_bulk_convert_upload(control_carbon, db_fpath, 'Control_Carbon', conversion_factor=st_acre_to_Mg_ha)
-    type_assignment_bulk_convert_upload(rx_carbon, db_fpath, 'RX_Carbon', conversion_factor=st_acre_to_Mg_ha)
-    type_assignment_bulk_convert_upload(site_data, db_fpath, 'site')
+    # load FVS results to working SQLite database, either directly from the FVS output database or from exported .csv
+    # files, applying any filters as the records are loaded so that filtered-out records are never written
+    filters = {'filter_string': filter_string, 'include_stands': include_stands, 'exclude_stands': exclude_stands}
+    if fvs_db_file:
+        fvs_db_fpath = working_path + fvs_db_file
+        for case, run_title in (('Control', control_name), ('RX', rx_control_prefixes[0])):
+            fvs_db_bulk_convert_upload(fvs_db_fpath, db_fpath, fvs_db_tables['SS'], case + '_StandStock', run_title,
+                                       **filters)
+            fvs_db_bulk_convert_upload(fvs_db_fpath, db_fpath, fvs_db_tables['Carbon'], case + '_Carbon', run_title,
+                                       conversion_factor=st_acre_to_Mg_ha, **filters)
+    else:
+        type_assignment_bulk_convert_upload(control_SS_table, db_fpath, 'Control_StandStock', **filters)
+        type_assignment_bulk_convert_upload(rx_SS_table, db_fpath, 'RX_StandStock', **filters)
+        type_assignment_bulk_convert_upload(control_carbon, db_fpath, 'Control_Carbon',
+                                            conversion_factor=st_acre_to_Mg_ha, **filters)
+        type_assignment_bulk_convert_upload(rx_carbon, db_fpath, 'RX_Carbon', conversion_factor=st_acre_to_Mg_ha,
+                                            **filters)
+    type_assignment_bulk_convert_upload(site_data, db_fpath, 'site', **filters)
+
+    if filter_string or stand_filter:
+        # log the filters for reference
+        metadata_fpath = archive_path + analysis_name + '-Filter_string.txt'
+        m = open(metadata_fpath, "w")
+        m.write('\n'.join(clause for clause in (filter_string, stand_filter) if clause))
+        m.close()
 
     # establish a connection to the working database
     con = sqlite3.connect(db_fpath)
     with con:
         cur = con.cursor()
 
-        if filter_string:
-            # log the filter string for reference
-            metadata_fpath = archive_path + analysis_name + '-Filter_string.txt'
-            m = open(metadata_fpath, "w")
-            m.write(filter_string)
-            m.close()
-
-            # apply the filter to each table
-            for table in ('Control_StandStock', 'RX_StandStock', 'Control_Carbon', 'RX_Carbon', 'site'):
-                cur.execute("ALTER TABLE %s RENAME TO temp" % table)
-                cur.execute(""" CREATE TABLE %s AS SELECT * FROM temp %s """ % (table, filter_string))
-                cur.execute("DROP TABLE temp")
-
         # create new columns in Stand & Stock results with metric units
         sql_append_unit_conversion(cur, 'Control_StandStock', 'LiveBA', 'LiveBA_metric', ft2_acre_to_m2_ha)
         sql_append_unit_conversion(cur, 'RX_StandStock', 'LiveBA', 'LiveBA_metric', ft2_acre_to_m2_ha)
@@ -496,83 +773,20 @@ def upload_convert_filter_process(working_path, db_file, rx_control_prefixes, si
     return archive_path, stand_C
 
 
-def summarize_data(db_fpath):
-    """ Summarizes FVS data within the SQLite database for quality control purposes, printing results to the screen for
-    manual inspection.
+def summarize_data(db_fpath, thresholds=None):
+    """ Summarizes FVS data within the SQLite database for quality control purposes.  The quality control report (see
+    qc.qc_report()) is written alongside the database as <database>-QC.json and <database>-QC.csv, and its summary and
+    threshold checks are printed to the screen.
 
     :param db_fpath: full path to SQLite database file containing FVS data (str)
-    :return:
+    :param thresholds: quality control thresholds overriding those in qc.qc_thresholds (dict)
+    :return: whether every quality control check passed (bool)
     """
 
-    # establish a connection to the working database
-    con = sqlite3.connect(db_fpath)
-    with con:
-        cur = con.cursor()
-
-        # count the number of stands included in the results
-        cur.execute("SELECT COUNT(DISTINCT StandID) FROM Control_StandStock")
-        print "The Control data contains records for %i distinct stands" % cur.fetchall()[0][0]
-        cur.execute("SELECT COUNT(DISTINCT StandID) FROM RX_StandStock")
-        print "The RX data contains records for %i distinct stands" % cur.fetchall()[0][0]
-        print
-
-        # count number of time points included for each individual stand
-        cur.execute("SELECT StandID, COUNT(DISTINCT Year) FROM Control_StandStock GROUP BY StandID ORDER BY StandID")
-        fetch_print(cur, "There are the following numbers of time points for each stand Control:")
-
-        cur.execute("SELECT StandID, COUNT(DISTINCT Year) FROM RX_StandStock GROUP BY StandID ORDER BY StandID")
-        fetch_print(cur, "There are the following numbers of time points for each stand RX:")
-
-        # determine the unique species included in the results
-        cur.execute("SELECT DISTINCT Species FROM Control_StandStock WHERE Species!='ALL' ")
-        fetch_print(cur, "The Control data includes the following species:")
-        cur.execute(""" SELECT StandID, COUNT(DISTINCT Species)
-                        FROM Control_StandStock
-                        WHERE Species!='ALL'
-                        GROUP BY StandID
-                        ORDER BY StandID """)
-        fetch_print(cur, "The number of species names present in each stand Control is as follows:")
-
-        cur.execute("SELECT DISTINCT Species FROM RX_StandStock WHERE Species!='ALL' ")
-        fetch_print(cur, "The RX data includes the following species:")
-        cur.execute("SELECT * FROM SpeciesDiversity ORDER BY StandID")
-        fetch_print(cur, "The number of species names present in each stand RX is as follows:")
-
-        # display the starting and ending year for all of the RX simulations
-        cur.execute("SELECT * FROM RX_StartEndYear ORDER BY StandID")
-        fetch_print(cur, "Here are the RX simulation starting and ending years for each stand:")
-
-        # display the initial mortality of each stand
-        cur.execute("SELECT * FROM RX_StandMortality ORDER BY StandID")
-        fetch_print(cur, "Here is the fraction of initial mortality of each stand on a BA basis:")
-
-        # display the initial BA of each stand for both the Control and RX
-        cur.execute(""" SELECT b.StandID, b.Tot_BA
-                        FROM Control_SpeciesBA b
-                        JOIN RX_StartEndYear y ON b.StandID=y.StandID AND b.Year=y.StartYear
-                        ORDER BY b.StandID """)
-        fetch_print(cur, "Here is the initial total live BA for each stand Control:")
-
-        cur.execute(""" SELECT b.StandID, b.Tot_BA
-                        FROM RX_SpeciesBA b
-                        JOIN RX_StartEndYear y ON b.StandID=y.StandID AND b.Year=y.StartYear
-                        ORDER BY b.StandID """)
-        fetch_print(cur, "Here is the initial total live BA for each stand RX (verify same as Control):")
-
-        # determine stands which become dominated by aspen
-        cur.execute(""" SELECT c.StandID, c.AS_share
-                        FROM Control_StandComposition c
-                        JOIN RX_StartEndYear sey ON c.StandID=sey.StandID AND c.Year=sey.EndYear
-                        WHERE AS_share>0.0001
-                        ORDER BY c.StandID """)
-        fetch_print(cur, "Here are the Control stands that became partially or completely dominated by ASPEN:")
-
-        cur.execute(""" SELECT c.StandID, c.AS_share
-                        FROM RX_StandComposition c
-                        JOIN RX_StartEndYear sey ON c.StandID=sey.StandID AND c.Year=sey.EndYear
-                        WHERE AS_share>0.0001
-                        ORDER BY C.StandID """)
-        fetch_print(cur, "Here are the RX stands that became partially or completely dominated by ASPEN:")
+    report = qc.qc_report(db_fpath, thresholds)
+    qc.write_qc_report(report, os.path.splitext(db_fpath)[0] + '-QC')
+    qc.print_qc_report(report)
+    return report['passed']
 
 
 def plot_deficit_detail(stand_C_dictionary, archive_path):
@@ -657,89 +871,126 @@ def plot_deficit_detail(stand_C_dictionary, archive_path):
     plt.subplots_adjust(bottom=0.1)
 
     scenario = archive_path.split('-')[-1].split('/')[0]
-    plt.savefig(archive_path + scenario + '-Normalized_ecosystem_deficit_detail.pdf')
-    plt.close()
+    figures.save(archive_path + scenario + '-Normalized_ecosystem_deficit_detail.pdf')
     print
     print
 
 
-def plot_all_deficits(stand_C_dictionary, db_fpath, archive_path):
+def stand_lines(ax, years, values, color, label=None, zorder=0, rasterized=False):
+    """ Draws the trajectories of many stands as a single LineCollection artist, rather than one Line2D artist per
+    stand, which keeps figure layout and vector file output fast for thousands of stands.
+
+    :param ax: matplotlib axes to draw on
+    :param years: years of each stand's trajectory (list of arrays of float)
+    :param values: values of each stand's trajectory (list of arrays of float)
+    :param color: line color of all stands (str)
+    :param label: legend label (str)
+    :param zorder: drawing order of the collection (int)
+    :param rasterized: render the collection as a bitmap within vector output (bool)
+    :return:
+    """
+
+    segments = [np.column_stack([x, y]) for x, y in zip(years, values)]
+    ax.add_collection(LineCollection(segments, colors=color, linewidths=1, linestyles='-', zorder=zorder,
+                                     rasterized=rasterized))
+    ax.autoscale_view()
+
+    # an empty line carries the legend entry, which then shows the line color
+    if label:
+        ax.plot([], [], label=label, marker='None', linestyle='-', linewidth=1, color=color)
+
+
+def stand_fan(ax, years, values, color, label=None, zorder=0):
+    """ Summarizes the trajectories of many stands sharing the same years as a fan chart, with the 5th-95th and
+    25th-75th percentile bands shaded around the median trajectory.
+
+    :param ax: matplotlib axes to draw on
+    :param years: years common to all stands' trajectories (array of float)
+    :param values: values of each stand's trajectory, of shape (stands, years) (array of float)
+    :param color: color of the bands and median (str)
+    :param label: legend label (str)
+    :param zorder: drawing order of the bands and median (int)
+    :return:
+    """
+
+    p5, p25, p50, p75, p95 = np.percentile(values, [5, 25, 50, 75, 95], axis=0)
+    ax.fill_between(years, p5, p95, color=color, alpha=0.2, linewidth=0, zorder=zorder)
+    ax.fill_between(years, p25, p75, color=color, alpha=0.4, linewidth=0, zorder=zorder)
+    ax.plot(years, p50, label=label, marker='None', linestyle='-', linewidth=1, color=color, zorder=zorder)
+
+
+def plot_all_deficits(stand_C_dictionary, db_fpath, archive_path, fan_stands=2000, rasterized=False):
     """ Creates an multi-panel plot illustrating the carbon deficits of harvest for all stands, showing a) aboveground
     live C vs. time and b) total ecosystem C vs. time for both the Control and RX, as well as c) the normalized carbon
-    deficit vs. time.
+    deficit vs. time.  The trajectories of each case or deficit category are drawn as a single LineCollection, or, for
+    more than fan_stands stands sharing the same years, summarized as percentile fan charts.
 
     :param stand_C_dictionary: nested dictionary structure containing stand carbon density data (dict of float)
     :param db_fpath: full path to SQLite database file containing FVS data (str)
     :param archive_path: path where database file and all results files & figures will be stored (str)
+    :param fan_stands: number of stands above which trajectories are summarized as fan charts (int)
+    :param rasterized: render the stand trajectories as bitmaps within the vector figure (bool)
     :return:
     """
 
     print "Creating plots to illustrate carbon deficits for all stands..."
     deficit_set = []
 
+    stand_IDs = stand_C_dictionary.keys()
+    years = [np.asarray(stand_C_dictionary[standID]['Year'], dtype=float) for standID in stand_IDs]
+    fan = len(stand_IDs) > fan_stands and all(np.array_equal(stand_years, years[0]) for stand_years in years)
+
+    def draw(ax, stands, values, color, label=None, zorder=0):
+        # draw the trajectories of the stands with the given indices in stand_IDs
+        if fan:
+            stand_fan(ax, years[0], np.array(values), color, label=label, zorder=zorder)
+        else:
+            stand_lines(ax, [years[i] for i in stands], values, color, label=label, zorder=zorder,
+                        rasterized=rasterized)
+
+    all_stands = range(len(stand_IDs))
+
     # plot control & RX total aboveground live carbon trajectories for all stands
     ax1 = plt.subplot2grid((2, 2), (0, 0))
-    for i, standID in enumerate(stand_C_dictionary.keys()):
-        if i == 0:
-            ax1.plot(stand_C_dictionary[standID]['Year'],
-                     stand_C_dictionary[standID]['Aboveground_Total_Live_Control'],
-                     label="Control", marker='None', linestyle='-', linewidth=1, color='r')
-            ax1.plot(stand_C_dictionary[standID]['Year'],
-                     stand_C_dictionary[standID]['Aboveground_Total_Live_RX'],
-                     label="Harvest & regen.", marker='None', linestyle='-', linewidth=1, color='g')
-        else:
-            ax1.plot(stand_C_dictionary[standID]['Year'],
-                     stand_C_dictionary[standID]['Aboveground_Total_Live_Control'],
-                     marker='None', linestyle='-', linewidth=1, color='r')
-            ax1.plot(stand_C_dictionary[standID]['Year'],
-                     stand_C_dictionary[standID]['Aboveground_Total_Live_RX'],
-                     marker='None', linestyle='-', linewidth=1, color='g')
+    draw(ax1, all_stands, [stand_C_dictionary[standID]['Aboveground_Total_Live_Control'] for standID in stand_IDs], 'r',
+         label="Control")
+    draw(ax1, all_stands, [stand_C_dictionary[standID]['Aboveground_Total_Live_RX'] for standID in stand_IDs], 'g',
+         label="Harvest & regen.")
 
     ax1.set_ylabel('Aboveground Live Carbon\n(Mg C $\mathregular{ha^{-1}}$)')
     ax1.legend(loc=4, prop={'size': 9})
 
     # plot control & RX total ecosystem carbon trajectories for all stands
     ax2 = plt.subplot2grid((2, 2), (0, 1))
-    for i, standID in enumerate(stand_C_dictionary.keys()):
-        if i == 0:
-            ax2.plot(stand_C_dictionary[standID]['Year'],
-                     stand_C_dictionary[standID]['Total_Stand_Carbon_Control'],
-                     label="Control", marker='None', linestyle='-', linewidth=1, color='r')
-            ax2.plot(stand_C_dictionary[standID]['Year'],
-                     stand_C_dictionary[standID]['Total_Stand_Carbon_RX'],
-                     label="Harvest & regen.", marker='None', linestyle='-', linewidth=1, color='g')
-        else:
-            ax2.plot(stand_C_dictionary[standID]['Year'],
-                     stand_C_dictionary[standID]['Total_Stand_Carbon_Control'],
-                     marker='None', linestyle='-', linewidth=1, color='r')
-            ax2.plot(stand_C_dictionary[standID]['Year'],
-                     stand_C_dictionary[standID]['Total_Stand_Carbon_RX'],
-                     marker='None', linestyle='-', linewidth=1, color='g')
+    draw(ax2, all_stands, [stand_C_dictionary[standID]['Total_Stand_Carbon_Control'] for standID in stand_IDs], 'r',
+         label="Control")
+    draw(ax2, all_stands, [stand_C_dictionary[standID]['Total_Stand_Carbon_RX'] for standID in stand_IDs], 'g',
+         label="Harvest & regen.")
 
     ax2.set_ylabel('Total Ecosystem Carbon\n(Mg C $\mathregular{ha^{-1}}$)')
     ax2.legend(loc=4, prop={'size': 9})
 
-    # plot and store normalized ecosystem carbon deficits for all stands
+    # plot and store normalized ecosystem carbon deficits for all stands, grouped into categories by final deficit
     ax3 = plt.subplot2grid((2, 1), (1, 0), colspan=2)
-    for i, standID in enumerate(stand_C_dictionary.keys()):
+    categories = {'y': [], 'c': [], 'm': []}
+    for i, standID in enumerate(stand_IDs):
         cumulative_harvest = np.cumsum(stand_C_dictionary[standID]['Total_Removed_Carbon_RX'])
         normalized_deficit = stand_C_dictionary[standID]['Running_deficit'] / cumulative_harvest
         stand_C_dictionary[standID]['Normalized_deficit'] = normalized_deficit
 
-        zorder = 0
         if normalized_deficit[-1] >= 1.0:
             color = 'y'
         elif normalized_deficit[-1] >= 0.0:
             color = 'c'
-            zorder += 1
         else:
             color = 'm'
-            zorder += 2
-
-        ax3.plot(stand_C_dictionary[standID]['Year'], normalized_deficit,
-                 marker='None', linestyle='-', linewidth=1, color=color, zorder=zorder)
+        categories[color].append(i)
         deficit_set.append(normalized_deficit)
 
+    for zorder, color in enumerate(['y', 'c', 'm']):
+        if categories[color]:
+            draw(ax3, categories[color], [deficit_set[i] for i in categories[color]], color, zorder=zorder)
+
     # add labels, thresholds, and legend
     ax3.axhline(0, color='k', linestyle='--', zorder=-1)
     ax3.axhline(1, color='k', linestyle='--', zorder=-1)
@@ -762,8 +1013,7 @@ def plot_all_deficits(stand_C_dictionary, db_fpath, archive_path):
     plt.subplots_adjust(bottom=0.1)
 
     scenario = archive_path.split('-')[-1].split('/')[0]
-    plt.savefig(archive_path + scenario + '-Normalized_ecosystem_C_deficit_range.pdf')
-    plt.close()
+    figures.save(archive_path + scenario + '-Normalized_ecosystem_C_deficit_range.pdf')
 
     # load deficit results to database
     deficit_upload = [['StandID', 'Integrated_deficit', 'End_normalized_deficit'],
@@ -957,12 +1207,49 @@ def plot_stand_dynamics(stand_C_dictionary, db_fpath, archive_path):
             axes[2, 1].legend(loc=10, prop={'size': 8}, bbox_to_anchor=[-0.1, 0.8], shadow=True, fancybox=True)
 
             scenario = archive_path.split('-')[-1].split('/')[0]
-            plt.savefig(archive_path + scenario + file_name)
-            plt.close()
+            figures.save(archive_path + scenario + file_name)
     print
     print
 
 
+def determinant_subplots(X, y, labels, response_label):
+    """ Creates a grid of scatterplots of one response against every regressor of the determinant design matrix, with
+    trendlines added where the univariate regression is significant.
+
+    :param X: design matrix of shape (stands, regressors), as from determinants.design_matrix() (array of float)
+    :param y: response value of each stand (array of float)
+    :param labels: axis label of each regressor (list of str)
+    :param response_label: axis label of the response (str)
+    :return:
+    """
+
+    subplot_rows = round(len(labels)**0.5)
+    subplot_columns = subplot_rows
+    for j, x_label in enumerate(labels):
+        print "Testing", x_label
+        plt.subplot(subplot_rows, subplot_columns, j+1)
+        plt.scatter(X[:, j], y)
+        significance_test(X[:, j], y)
+        plt.xlabel(x_label)
+        plt.ylabel(response_label)
+
+
+def print_multiple_regression(rows, response):
+    """ Prints the multiple regression coefficients of one response from a determinants.coefficient_table().
+
+    :param rows: rows of the coefficient table (list of lists)
+    :param response: response name (str)
+    :return:
+    """
+
+    print "Multiple regression of %s:" % response
+    print "\t".join(determinants.coefficient_columns[3:])
+    for row in rows:
+        if row[1] == response and row[2] == 'multiple':
+            print "\t".join(str(element) for element in row[3:])
+    print
+
+
 def productivity_determinants(db_fpath, archive_path):
     """ Creates scatterplots and performs multiple linear regression to help identify which simulation factors are the
     most significant determinants of productivity in both Contol and Harvest scenarios. Factors tested include:
@@ -975,108 +1262,37 @@ def productivity_determinants(db_fpath, archive_path):
         * initial stand carbon density
         * initial stand mortality (BA basis)
 
+    The regressors and responses of all stands are read as one design matrix keyed on StandID, and the regression
+    coefficients of both cases are written to a coefficient table.
+
     :param db_fpath:
     :param archive_path:
     :return:
     """
 
-    # establish a connection to the working database
-    con = sqlite3.connect(db_fpath)
-    with con:
-        cur = con.cursor()
-
-        def carbon_subplots(panel, total_panels, query, x_label, y_label):
-
-            subplot_rows = round(total_panels**0.5)
-            subplot_columns = subplot_rows
-            plt.subplot(subplot_rows, subplot_columns, panel)
-
-            cur.execute(query)
-            data_tuples = cur.fetchall()
-            data = zip(*data_tuples)
-
-            plt.scatter(data[0], data[1])
-            significance_test(data[0], data[1])
-            plt.xlabel(x_label)
-            plt.ylabel(y_label)
-
-            return data[0], data[1]
-
-        response_label = 'Year 2100 AG Live C'
-
-        for i, case in enumerate(['Control', 'RX']):
-            print "Creating plots to illustrate determinants of %s stand productivity..." % case
-
-            regressor_sets = [
-
-                ["""SELECT x.Aspect, c.Aboveground_Total_Live_%s
-                    FROM Carbon c
-                    JOIN site x ON x.StandID=c.StandID
-                    WHERE c.Year=2100 """ % case, 'site aspect'],
-
-                ["""SELECT x.Slope, c.Aboveground_Total_Live_%s
-                    FROM Carbon c
-                    JOIN site x ON x.StandID=c.StandID
-                    WHERE c.Year=2100 """ % case, 'site slope'],
-
-                ["""SELECT x.ElevFt, c.Aboveground_Total_Live_%s
-                    FROM Carbon c
-                    JOIN site x ON x.StandID=c.StandID
-                    WHERE c.Year=2100 """ % case, 'site elevation'],
-
-                ["""SELECT x.SpeciesCount, c.Aboveground_Total_Live_%s
-                    FROM Carbon c
-                    JOIN SpeciesDiversity x ON x.StandID=c.StandID
-                    WHERE c.Year=2100 """ % case, 'initial species diversity'],
-
-                ["""SELECT x.Tot_TPHA, c.Aboveground_Total_Live_%s
-                    FROM Carbon c
-                    JOIN Control_TPHA x ON x.StandID=c.StandID
-                    WHERE c.Year=2100 AND x.Year=2014 """ % case, 'initial tree density'],
-
-                ["""SELECT x.Tot_BA, c.Aboveground_Total_Live_%s
-                    FROM Carbon c
-                    JOIN Control_SpeciesBA x ON x.StandID=c.StandID
-                    WHERE c.Year=2100 AND x.Year=2014""" % case, 'initial stand live basal area'],
-
-                ["""SELECT x.Aboveground_Total_Live_Control, c.Aboveground_Total_Live_%s
-                    FROM Carbon c
-                    JOIN Carbon x ON x.StandID=c.StandID
-                    WHERE c.Year=2100 AND x.Year=2014""" % case, 'initial stand live carbon density'],
-
-                ["""SELECT x.InitialMortality, c.Aboveground_Total_Live_%s
-                    FROM Carbon c
-                    JOIN RX_StandMortality x ON x.StandID=c.StandID
-                    WHERE c.Year=2100 AND x.Year=2014""" % case, 'initial stand mortality (BA basis)']
+    stand_ids, X, Y, regressors, responses = determinants.design_matrix(
+        db_fpath, responses=['Control_productivity', 'RX_productivity'])
+    labels = [regressor[2] for regressor in determinants.determinant_regressors]
+    scenario = archive_path.split('-')[-1].split('/')[0]
+    response_label = 'Year 2100 AG Live C'
 
-            ]
+    for case in ['Control', 'RX']:
+        print "Creating plots to illustrate determinants of %s stand productivity..." % case
+        determinant_subplots(X, Y[:, responses.index(case + '_productivity')], labels, response_label)
 
-            response_data = []
-            regressor_data = []
-            for j, regressor_set in enumerate(regressor_sets):
-                query, x_label = regressor_set
-                print "Testing", x_label
-                xs, ys = carbon_subplots(j+1, len(regressor_sets), query, x_label, response_label)
-                response_data.append(xs)
-                regressor_data.append(ys)
+        matplotlib.rcParams.update({'font.size': 8})
+        plt.tight_layout()
+        plt.subplots_adjust(top=0.9)
+        plt.subplots_adjust(bottom=0.1)
+        plt.suptitle('%s stand productivity determinants' % case, fontsize=13)
 
-            matplotlib.rcParams.update({'font.size': 8})
-            plt.tight_layout()
-            plt.subplots_adjust(top=0.9)
-            plt.subplots_adjust(bottom=0.1)
-            plt.suptitle('%s stand productivity determinants' % case, fontsize=13)
+        figures.save(archive_path + scenario + '-%s_productivity_determinants.pdf' % case)
 
-            scenario = archive_path.split('-')[-1].split('/')[0]
-            plt.savefig(archive_path + scenario + '-%s_productivity_determinants.pdf' % case)
-            plt.close()
-
-            # now try some multiple regression considering all three predictors
-            import statsmodels.api as sm
-            # https://stackoverflow.com/questions/11479064/multiple-linear-regression-in-python
-            predictors = np.array(regressor_data).T
-            predictors = sm.add_constant(predictors)
-            results = sm.OLS(endog=response_data[0], exog=predictors).fit()
-            print results.summary()
+    # fit the univariate and multiple regressions of both cases together
+    rows = determinants.coefficient_table(scenario, X, Y, regressors, responses)
+    determinants.write_coefficient_table(rows, archive_path + scenario + '-productivity_determinants.csv')
+    for response in responses:
+        print_multiple_regression(rows, response)
     print
     print
 
@@ -1093,85 +1309,22 @@ def deficit_determinants(db_fpath, archive_path):
         * initial stand carbon density
         * initial stand mortality (BA basis)
 
+    The regressors and responses of all stands are read as one design matrix keyed on StandID, and the regression
+    coefficients are written to a coefficient table.
+
     :param db_fpath:
     :param archive_path:
     :return:
     """
 
-    # establish a connection to the working database
-    con = sqlite3.connect(db_fpath)
-    with con:
-        cur = con.cursor()
-
-        def deficit_subplots(panel, total_panels, query, x_label, y_label):
-
-            subplot_rows = round(total_panels**0.5)
-            subplot_columns = subplot_rows
-            plt.subplot(subplot_rows, subplot_columns, panel)
-
-            cur.execute(query)
-            data_tuples = cur.fetchall()
-            data = zip(*data_tuples)
-
-            plt.scatter(data[0], data[1])
-            significance_test(data[0], data[1])
-            plt.xlabel(x_label)
-            plt.ylabel(y_label)
-
-            return data[0], data[1]
-
-        response_label = 'End normalized C deficit'
-
-        print "Creating plots to illustrate determinants of stand integrated carbon deficit..."
-
-        regressor_sets = [
-
-        ["""SELECT x.Aspect, d.End_normalized_deficit
-            FROM Deficit d
-            JOIN site x ON x.StandID=d.StandID""", 'site aspect'],
-
-        ["""SELECT x.Slope, d.End_normalized_deficit
-            FROM Deficit d
-            JOIN site x ON x.StandID=d.StandID""", 'site slope'],
-
-        ["""SELECT x.ElevFt, d.End_normalized_deficit
-            FROM Deficit d
-            JOIN site x ON x.StandID=d.StandID""", 'site elevation'],
-
-        ["""SELECT x.SpeciesCount, d.End_normalized_deficit
-            FROM Deficit d
-            JOIN SpeciesDiversity x ON x.StandID=d.StandID""", 'initial species diversity'],
-
-        ["""SELECT x.Tot_TPHA, d.End_normalized_deficit
-            FROM Deficit d
-            JOIN Control_TPHA x ON x.StandID=d.StandID
-            WHERE x.Year=2014 """, 'initial tree density'],
-
-        ["""SELECT x.Tot_BA, d.End_normalized_deficit
-            FROM Deficit d
-            JOIN Control_SpeciesBA x ON x.StandID=d.StandID
-            WHERE x.Year=2014""", 'initial stand live basal area'],
-
-        ["""SELECT x.Aboveground_Total_Live_Control, d.End_normalized_deficit
-            FROM Deficit d
-            JOIN Carbon x ON x.StandID=d.StandID
-            WHERE x.Year=2014""", 'initial stand live carbon density'],
+    stand_ids, X, Y, regressors, responses = determinants.design_matrix(db_fpath,
+                                                                        responses=['End_normalized_deficit'])
+    labels = [regressor[2] for regressor in determinants.determinant_regressors]
+    scenario = archive_path.split('-')[-1].split('/')[0]
+    response_label = 'End normalized C deficit'
 
-        ["""SELECT x.InitialMortality, d.End_normalized_deficit
-            FROM Deficit d
-            JOIN RX_StandMortality x ON x.StandID=d.StandID
-            WHERE x.Year=2014""", 'initial stand mortality (BA basis)']
-
-    ]
-
-    response_data = []
-    regressor_data = []
-    for j, regressor_set in enumerate(regressor_sets):
-        query, x_label = regressor_set
-        print "Testing", x_label
-        xs, ys = deficit_subplots(j+1, len(regressor_sets), query, x_label, response_label)
-        response_data.append(xs)
-        regressor_data.append(ys)
+    print "Creating plots to illustrate determinants of stand integrated carbon deficit..."
+    determinant_subplots(X, Y[:, 0], labels, response_label)
 
     matplotlib.rcParams.update({'font.size': 8})
     plt.tight_layout()
@@ -1179,17 +1332,11 @@ def deficit_determinants(db_fpath, archive_path):
     plt.subplots_adjust(bottom=0.1)
     plt.suptitle('Harvest carbon deficit determinants', fontsize=13)
 
-    scenario = archive_path.split('-')[-1].split('/')[0]
-    plt.savefig(archive_path + scenario + '-deficit_determinants.pdf')
-    plt.close()
-
-    # now try some multiple regression considering all three predictors
-    import statsmodels.api as sm
-    # https://stackoverflow.com/questions/11479064/multiple-linear-regression-in-python
-    predictors = np.array(regressor_data).T
-    predictors = sm.add_constant(predictors)
-    results = sm.OLS(endog=response_data[0], exog=predictors).fit()
-    print results.summary()
+    figures.save(archive_path + scenario + '-deficit_determinants.pdf')
+
+    rows = determinants.coefficient_table(scenario, X, Y, regressors, responses)
+    determinants.write_coefficient_table(rows, archive_path + scenario + '-deficit_determinants.csv')
+    print_multiple_regression(rows, responses[0])
     print
     print
 
@@ -1214,24 +1361,88 @@ def CSF_analysis():
         ['3337tpa_rcp60_AutoEst', 'Static_Regen_control']
     ]
 
+    # name of an FVS output database within the working_path to read results from directly, rather than .csv exports
+    fvs_db_file = ''
+    # fvs_db_file = 'FVSOut.db'
+
+    # stands to exclude (or, with include_stands, the only stands to retain) as records are loaded
+    exclude_stands = None
+    # exclude_stands = set(['T1_MedBow_LS7'])
+
+    # quality control thresholds overriding those in qc.qc_thresholds; scenarios failing any check are skipped
+    qc_thresholds = {}
+    # qc_thresholds = {'max_initial_mortality': 0.5}
+
+    # number of bootstrap and permutation replicates for resampling inference on the determinant regressions of each
+    # scenario, written as a table of confidence intervals and p-values; 0 to skip the resampling analysis
+    resampling_replicates = 0
+    # resampling_replicates = 2000
+
     filter = ''
     # filter = "WHERE StandID !='T1_MedBow_LS7' "
     # filter = """ WHERE StandID NOT IN ('T1_MedBow_LS14', 'T1_MedBow_LS21', 'T1_MedBow_LS33', 'T1_MedBow_LS53',
     #                                    'T1_MedBow_LS54', 'T1_MedBow_LS58', 'T1_MedBow_LS6') """
 
+    # manifest within the working_path recording every processed scenario, so that an interrupted batch resumes with
+    # the first scenario not yet processed with the same settings; '' to process every scenario afresh
+    manifest_file = 'results/CSF_manifest.jsonl'
+
+    manifest = checkpoint.Manifest(working_path + manifest_file) if manifest_file else None
+    pending = []   # manifest entries of scenarios whose figures may still be being written
     for rx_control_file_prefixes in rx_control_file_prefix_set:
+        scenario_key = {'scenario': rx_control_file_prefixes,
+                        'fvs_db_file': fvs_db_file,
+                        'site_file': site_file,
+                        'filter': filter,
+                        'exclude_stands': sorted(exclude_stands) if exclude_stands else None,
+                        'qc_thresholds': qc_thresholds,
+                        'resampling_replicates': resampling_replicates}
+        entry = manifest.completed(scenario_key) if manifest else None
+        if entry:
+            print "Scenario '%s' was already processed (%s) in %s" % (rx_control_file_prefixes[0], entry['status'],
+                                                                     entry['archive_path'])
+            print
+            continue
+
         archive_path, stand_C_dictionary = upload_convert_filter_process(working_path,
                                                                          db_file,
                                                                          rx_control_file_prefixes,
                                                                          site_file,
-                                                                         filter_string=filter)
+                                                                         filter_string=filter,
+                                                                         fvs_db_file=fvs_db_file,
+                                                                         exclude_stands=exclude_stands)
+
+        # the previous scenario is complete once its figures, written while this one was loaded, are on disk
+        figures.wait()
+        if manifest:
+            for key, completed_entry in pending:
+                manifest.record(key, **completed_entry)
+        pending = []
+
         database_fpath = archive_path + db_file
-        summarize_data(database_fpath)
+        if not summarize_data(database_fpath, qc_thresholds):
+            print "Skipping scenario '%s', which failed quality control" % rx_control_file_prefixes[0]
+            print
+            pending.append((scenario_key, {'status': 'failed quality control', 'archive_path': archive_path}))
+            continue
         plot_deficit_detail(stand_C_dictionary, archive_path)
         plot_all_deficits(stand_C_dictionary, database_fpath, archive_path)
         plot_stand_dynamics(stand_C_dictionary, database_fpath, archive_path)
         # productivity_determinants(database_fpath, archive_path)
         # deficit_determinants(database_fpath, archive_path)
+        if resampling_replicates:
+            scenario = archive_path.split('-')[-1].split('/')[0]
+            resampling.resampling_analysis(database_fpath, scenario,
+                                           results_fpath=archive_path + scenario + '-determinants_resampling.csv',
+                                           bootstraps=resampling_replicates, permutations=resampling_replicates)
+        pending.append((scenario_key, {'status': 'complete', 'archive_path': archive_path}))
+
+    # figures are written in the background while the next scenario is processed; wait for the last of them
+    figures.wait()
+    if manifest:
+        for key, completed_entry in pending:
+            manifest.record(key, **completed_entry)
 
 
-CSF_analysis()
\ No newline at end of file
+if __name__ == '__main__':
+    CSF_analysis()
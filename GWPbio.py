@@ -1,23 +1,39 @@
+import figures
+import numpy as np
+
+
+# BERN CO2 decay model parameters: the persistent fraction a0, and the fractions a1-a3 decaying with lifetimes t1-t3
+bern_a0 = 0.217
+bern_fractions = (0.259, 0.338, 0.186)
+bern_lifetimes = (172.9, 18.52, 1.186)   # years
+
+alpha_co2 = 0.000014   # W/m2*ppb
+mass_c_conv_co2 = 1.29E-7   # ppbv/Mg
+
 
 def bern(t):
 
     from math import exp
 
-    # BERN CO2 decay model parameters
-    a0 = 0.217
-    a1 = 0.259
-    a2 = 0.338
-    a3 = 0.186
-
-    t1 = 172.9
-    t2 = 18.52
-    t3 = 1.186
+    a1, a2, a3 = bern_fractions
+    t1, t2, t3 = bern_lifetimes
 
-    f = a0 + a1 * exp((-1.0*t)/t1) + a2 * exp((-1.0*t)/t2) + a3 * exp((-1.0*t)/t3)
+    f = bern_a0 + a1 * exp((-1.0*t)/t1) + a2 * exp((-1.0*t)/t2) + a3 * exp((-1.0*t)/t3)
 
     return f
 
 
+def bern_response(duration):
+    """ Vectorized bern() over the first duration years after an emission.
+
+    :param duration: number of years (int)
+    :return: fraction of an emission remaining in the atmosphere in each year (array of float)
+    """
+
+    elapsed = np.arange(duration)
+    return bern_a0 + np.sum([a * np.exp(-1.0 * elapsed / t) for a, t in zip(bern_fractions, bern_lifetimes)], axis=0)
+
+
 def GWPbio(fluxes, basis, start_year=0, flux_plot_name='', cumulative_plot_name=''):
 
     import numpy as np
@@ -26,9 +42,6 @@ def GWPbio(fluxes, basis, start_year=0, flux_plot_name='', cumulative_plot_name=
     light_blue = (0/255.0, 205/255.0, 255/255.0)
     dark_blue = (0/255.0, 58/255.0, 73/255.0)
 
-    alpha_co2 = 0.000014   # W/m2*ppb
-    mass_c_conv_co2 = 1.29E-7   # ppbv/Mg
-
     # initialize a CO2 amount timeseries array
     co2s = []   # MgCO2
     for i in range(basis+len(fluxes)):
@@ -52,8 +65,7 @@ def GWPbio(fluxes, basis, start_year=0, flux_plot_name='', cumulative_plot_name=
         if flux_plot_name:
             plt.plot(time, trace, color=dark_blue, linewidth=0.2)
     if flux_plot_name:
-        plt.savefig(flux_plot_name)
-        plt.close()
+        figures.save(flux_plot_name)
 
     # cumulative co2 plots
     if cumulative_plot_name:
@@ -68,8 +80,7 @@ def GWPbio(fluxes, basis, start_year=0, flux_plot_name='', cumulative_plot_name=
         plt.legend(prop={'size': 12})
         plt.xlabel("Year")
         plt.ylabel("Cumulative carbon dioxide addition (MgCO2)")
-        plt.savefig(cumulative_plot_name)
-        plt.close()
+        figures.save(cumulative_plot_name)
     # translate CO2 amount timeseries to a radiative forcing timeseries
     forcings = []
     for i, co2 in enumerate(co2s):
@@ -80,5 +91,119 @@ def GWPbio(fluxes, basis, start_year=0, flux_plot_name='', cumulative_plot_name=
     return cumulative_forcing   # Wh/m2
 
 
+class ForcingOperator(object):
+    """ Linear operator form of GWPbio().  The cumulative forcing of a flux series is a weighted sum of its fluxes, the
+    weight of a flux in year i being the Bern-attenuated CO2 burden it contributes from year i until basis years after
+    the end of the series.  The weight vector is computed once for a given series length and time horizon, after which
+    the forcing of a series, or of every row of a matrix of series, is a single dot product.
+    """
+
+    def __init__(self, n, basis):
+        """
+        :param n: length of the flux series, years (int)
+        :param basis: time horizon, years (int)
+        """
+
+        self.n = n
+        self.basis = basis
+        # burden summed over the first 1, 2, ... years after an emission
+        integrated = np.cumsum(bern_response(basis + n))
+        self.weights = integrated[::-1][:n] * mass_c_conv_co2 * alpha_co2 * (24*365)   # Wh/m2 per MgCO2
+
+    def forcing(self, fluxes):
+        """ Cumulative radiative forcing, as returned by GWPbio(fluxes, basis).
+
+        :param fluxes: CO2 fluxes, MgCO2/y, with the series along the last axis (array of float)
+        :return: cumulative forcing of each series, Wh/m2 (float or array of float)
+        """
+
+        return np.dot(fluxes, self.weights)
+
+
+# forcing operators already built, keyed by (series length, time horizon)
+_forcing_operators = {}
+
+
+def forcing_operator(n, basis):
+    """ Returns the cached ForcingOperator for flux series of length n and the given time horizon, building it on first
+    use.
+    """
+
+    key = (int(n), int(basis))
+    if key not in _forcing_operators:
+        _forcing_operators[key] = ForcingOperator(*key)
+    return _forcing_operators[key]
+
+
+def reference_forcing(basis):
+    """ Cumulative forcing of a present-day emission of 1 MgCO2, equal to GWPbio([1], basis), Wh/m2 (float). """
+
+    return forcing_operator(1, basis).weights[0]
+
+
+# columns of the array returned by horizon_sweep()
+sweep_columns = ['horizon', 'cumulative_forcing', 'reference_forcing', 'biogenic_CO2eq']
+
+
+def horizon_sweep(fluxes, max_horizon):
+    """ Evaluates GWPbio(fluxes, basis) and the reference forcing GWPbio([1], basis) for every basis from 1 to
+    max_horizon in a single pass.  The attenuated CO2 burden of the flux series is computed once, out to max_horizon
+    years after its last flux, and the cumulative forcing for every horizon is read off its cumulative sum.
+
+    :param fluxes: CO2 fluxes, MgCO2/y (list or array of float)
+    :param max_horizon: longest time horizon, years (int)
+    :return: array of shape (max_horizon, 4), one row per horizon with the values listed in sweep_columns (array of
+        float)
+    """
+
+    fluxes = np.asarray(fluxes, dtype=float)
+    n = len(fluxes)
+    conversion = mass_c_conv_co2 * alpha_co2 * (24*365)
+    response = bern_response(n + max_horizon)
+    burden = np.convolve(fluxes, response)[:n + max_horizon]   # MgCO2 in the atmosphere in each year
+    horizons = np.arange(1, max_horizon + 1)
+    cumulative_forcing = np.cumsum(burden)[n - 1 + horizons] * conversion   # Wh/m2
+    reference = np.cumsum(response)[horizons] * conversion   # Wh/m2
+    return np.column_stack([horizons, cumulative_forcing, reference, cumulative_forcing / reference])
+
+
+class BernBurden(object):
+    """ Running equivalent of GWPbio(), for fluxes that arrive one year at a time.  The Bern-attenuated CO2 burden is a
+    sum of one persistent and three exponentially decaying terms, so rather than storing the flux history and
+    convolving it afterwards, the burden is carried as four running totals that are decayed and topped up each year.
+    After the last flux, cumulative_forcing() adds the remaining basis years in closed form, giving the same result as
+    GWPbio() on the full flux series with constant memory.
+    """
+
+    def __init__(self):
+        self.persistent = 0.0   # MgCO2, cumulative flux
+        self.decaying = np.zeros(len(bern_lifetimes))   # MgCO2, undecayed flux in each exponential term
+        self.decay = np.exp(-1.0 / np.array(bern_lifetimes))
+        self.burden_sum = 0.0   # MgCO2*y, attenuated CO2 burden summed over the years so far
+        self.years = 0
+
+    def add(self, flux):
+        """ Adds one year's CO2 flux and accumulates that year's attenuated burden.
+
+        :param flux: CO2 flux, MgCO2/y (float)
+        """
+
+        self.decaying = self.decaying * self.decay + flux
+        self.persistent += flux
+        self.burden_sum += bern_a0 * self.persistent + np.dot(bern_fractions, self.decaying)
+        self.years += 1
+
+    def cumulative_forcing(self, basis):
+        """ Cumulative radiative forcing of the fluxes added so far, integrated until basis years after the last one.
+
+        :param basis: time horizon, years (int)
+        :return: cumulative forcing, Wh/m2 (float)
+        """
+
+        tail = bern_a0 * self.persistent * basis + \
+            np.sum(np.array(bern_fractions) * self.decaying * self.decay * (1 - self.decay**basis) / (1 - self.decay))
+        return (self.burden_sum + tail) * mass_c_conv_co2 * alpha_co2 * (24*365)   # Wh/m2
+
+
 # fluxes = [0, 10, 12, 8, 6, 2, -1, -4, -3]   # MgCO2/y
 # GWPbio(fluxes, 100, flux_plot_name='flux_test.png', cumulative_plot_name='cumulative_test.png')
\ No newline at end of file
@@ -16,9 +16,11 @@ Structural notes:
 """
 
 import csv
+import figures
 from math import exp
 import matplotlib.pyplot as plt
 import numpy as np
+from twp import ghg_decay_params, ghg_forcing_params
 
 
 def LCA(ecosystem_Cflux_timeseries):
@@ -46,16 +48,8 @@ def LCA(ecosystem_Cflux_timeseries):
                                [['CO2', [1, 1.2, 1.4, 1.6, 1.8, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2]]]]
                       }
 
-    # format: [(a0, t0), (a1, t1)...] for c(t) = a0 * exp((-1.0*t)/t0) + a1 * exp((-1.0*t)/t1) + ...
-    ghg_decay_params = {'CO2': [(0.217, 0),
-                                (0.259, 172.9),
-                                (0.338, 18.52),
-                                (0.186, 1.186)],
-                        }
-
-    # format: (radiative forcing alpha term in W/m2*ppb, emission mass to atmospheric conversion constant in ppbv/Mg)
-    ghg_forcing_params = {'CO2': (0.000014, 1.29E-7)
-                          }
+    # species decay and forcing parameters, in the formats documented in twp.py, are read from the species registry
+    # ghg_species.csv, so emission libraries may include any species listed there (e.g. 'CH4', 'N2O' or 'BC')
 
 
     def decay(species, initial, duration):
@@ -192,7 +186,7 @@ def LCA(ecosystem_Cflux_timeseries):
     axes[2].plot([0, TWP_length-1], [1, 1], marker=None, linestyle='--', color='k', linewidth=2.0, zorder=2)
     axes[2].grid()
 
-    plt.savefig('TWP.png', dpi=300)
+    figures.save('TWP.png', dpi=300)
 
 
 lines = csv.reader(open('fluxes.csv', 'rU'))
@@ -0,0 +1,139 @@
+""" This module provides checkpointing for long-running analyses, so that a batch interrupted partway through (by
+running out of memory, a sleeping laptop or a killed job) resumes where it stopped rather than starting over.  Two
+append-only stores are provided: a CheckpointLog of binary records, holding e.g. the result arrays and random number
+generator state of every completed iteration of the dynamics.py 'uncert' analysis, and a Manifest of JSON lines,
+recording e.g. every scenario of FVS.CSF_analysis() that has been processed.  Records are only ever appended and are
+flushed to disk as they are written, so an interruption can at worst lose the record being written, which is discarded
+when the store is next read.
+"""
+
+import cPickle
+import json
+import os
+
+
+class CheckpointLog(object):
+    """ Append-only log of pickled records (e.g. dictionaries of arrays) in a single binary file.
+    """
+
+    def __init__(self, fpath):
+        """
+        :param fpath: full path to the log file, created when the first record is appended (str)
+        """
+
+        self.fpath = fpath
+
+    def load(self):
+        """ Reads every complete record in the log, truncating any partially written record at its end so that
+        further records are appended after the last complete one.
+
+        :return: records in the order they were appended (list)
+        """
+
+        records = []
+        if not os.path.exists(self.fpath):
+            return records
+        file_obj = open(self.fpath, 'r+b')
+        end = 0
+        while True:
+            try:
+                records.append(cPickle.load(file_obj))
+            except EOFError:
+                break
+            except (cPickle.UnpicklingError, ValueError, KeyError, IndexError, AttributeError):
+                print "WARNING- discarding an incomplete record at the end of checkpoint %s" % self.fpath
+                break
+            end = file_obj.tell()
+        file_obj.truncate(end)
+        file_obj.close()
+        return records
+
+    def append(self, record):
+        """ Appends a record to the log and flushes it to disk.
+
+        :param record: record to store (picklable object)
+        :return:
+        """
+
+        directory = os.path.dirname(self.fpath)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        file_obj = open(self.fpath, 'ab')
+        cPickle.dump(record, file_obj, cPickle.HIGHEST_PROTOCOL)
+        file_obj.flush()
+        os.fsync(file_obj.fileno())
+        file_obj.close()
+
+    def remove(self):
+        """ Deletes the log, once the analysis it checkpoints is complete.
+
+        :return:
+        """
+
+        if os.path.exists(self.fpath):
+            os.remove(self.fpath)
+
+
+class Manifest(object):
+    """ Append-only manifest of completed work items, stored as one JSON object per line.  Each entry identifies its
+    work item by a 'key' (any JSON-serializable value, e.g. a scenario's file prefixes and analysis settings).
+    """
+
+    def __init__(self, fpath):
+        """
+        :param fpath: full path to the manifest file, created when the first entry is recorded (str)
+        """
+
+        self.fpath = fpath
+
+    def entries(self):
+        """ Reads every complete entry in the manifest.
+
+        :return: entries in the order they were recorded (list of dict)
+        """
+
+        entries = []
+        if not os.path.exists(self.fpath):
+            return entries
+        for line in open(self.fpath, 'r'):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass   # partially written last line
+        return entries
+
+    def completed(self, key):
+        """ Looks up the latest entry recorded for a work item.
+
+        :param key: work item key (JSON-serializable)
+        :return: manifest entry, or None if the work item has not been completed (dict)
+        """
+
+        key = json.loads(json.dumps(key))   # compare in JSON form, in which tuples are read back as lists
+        matches = [entry for entry in self.entries() if entry.get('key') == key]
+        return matches[-1] if matches else None
+
+    def record(self, key, **entry):
+        """ Records the completion of a work item, flushing the entry to disk.
+
+        :param key: work item key (JSON-serializable)
+        :param entry: further fields of the entry, e.g. 'archive_path' (dict)
+        :return:
+        """
+
+        directory = os.path.dirname(self.fpath)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        entry['key'] = key
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        if os.path.exists(self.fpath) and os.path.getsize(self.fpath):
+            last = open(self.fpath, 'rb')
+            last.seek(-1, os.SEEK_END)
+            if last.read(1) != '\n':
+                line = '\n' + line   # start a new line after a partially written one
+            last.close()
+        file_obj = open(self.fpath, 'a')
+        file_obj.write(line)
+        file_obj.flush()
+        os.fsync(file_obj.fileno())
+        file_obj.close()
@@ -0,0 +1,137 @@
+""" This module provides time-varying climate drivers for the vectorized landscape engine in landscape.py, so that
+climate-change scenarios (like the FVS rcp60 runs in FVS.CSF_analysis()) can be simulated with the conceptual model.
+The annually-averaged short-wave radiation (phi_s) and temperature/moisture modifier (f_DT), constant parameters in
+dynamics.params, are replaced by one value per simulation year, or one value per year and stand.
+
+Drivers are stored on disk as .npy arrays of shape (years,) or (years, stands), alongside a small JSON header giving
+the first year, and are memory-mapped rather than read into memory: each simulation year reads only its own row, which
+is broadcast against the stand state arrays without being copied, so century-long ensembles of 10^5 stands need only
+their state arrays in memory.  NetCDF files holding phi_s and f_DT variables with a start_year attribute can be read
+instead when the netCDF4 module is installed.
+"""
+
+import json
+import os
+import numpy as np
+
+try:
+    import netCDF4
+    netcdf_available = True
+except ImportError:
+    netcdf_available = False
+
+
+# parameters replaced by climate drivers, in the dynamics.params structure
+climate_params = ['phi_s', 'f_DT']
+
+# bounds on climate-dependent parameter values after per-stand site adjustment
+site_factor_bounds = {'phi_s': (0.0, np.inf),
+                      'f_DT': (0.0, 1.0)}
+
+
+class ClimateDrivers(object):
+    """ Annual values of the climate-dependent 3-PG parameters, per year or per year and stand.
+    """
+
+    def __init__(self, start_year, drivers):
+        """
+        :param start_year: year of the first row of the drivers (int)
+        :param drivers: dictionary of arrays (e.g. memory-mapped) of shape (years,) or (years, stands), keyed by
+            parameter name from climate_params (dict of arrays)
+        """
+
+        if set(drivers) != set(climate_params):
+            raise ValueError("Climate drivers must be given for %s" % ', '.join(climate_params))
+        shapes = set(np.shape(drivers[name]) for name in climate_params)
+        if len(shapes) != 1 or len(list(shapes)[0]) not in (1, 2):
+            raise ValueError("Climate drivers must share one shape, (years,) or (years, stands)")
+        self.start_year = int(start_year)
+        self.drivers = drivers
+        self.years = np.shape(drivers[climate_params[0]])[0]
+        self.stands = np.shape(drivers[climate_params[0]])[1] if len(list(shapes)[0]) == 2 else None
+
+    def check(self, start_year, simulation_length, runs):
+        """ Raises a ValueError unless the drivers cover every simulation year and, if given per stand, every stand.
+
+        :param start_year: first simulation year (int)
+        :param simulation_length: number of simulation years (int)
+        :param runs: number of simulated stands (int)
+        :return:
+        """
+
+        if start_year < self.start_year or start_year + simulation_length > self.start_year + self.years:
+            raise ValueError("Climate drivers for %i-%i do not cover the simulation years %i-%i" %
+                             (self.start_year, self.start_year + self.years - 1, start_year,
+                              start_year + simulation_length - 1))
+        if self.stands is not None and self.stands != runs:
+            raise ValueError("Climate drivers are given for %i stands, but %i stands are simulated" %
+                             (self.stands, runs))
+
+    def year_params(self, params, year):
+        """ Returns the parameters of one simulation year, sharing every entry of params except the climate-dependent
+        ones, whose values are the drivers' row for that year (a scalar, or a view of one value per stand).  Where
+        params carries a relative per-stand site adjustment '<name>_site_factor' (as from
+        stand_params.derive_stand_params()), the value is the driver row times the site factor, within
+        site_factor_bounds, so that site heterogeneity is kept under time-varying climate.
+
+        :param params: model parameter dictionary in the dynamics.params structure (dict)
+        :param year: simulation year (int)
+        :return: parameter dictionary for the year (dict)
+        """
+
+        year_params = dict(params)
+        for name in climate_params:
+            row = self.drivers[name][year - self.start_year]
+            if name + '_site_factor' in params:
+                low, high = site_factor_bounds[name]
+                row = np.clip(row * params[name + '_site_factor'][0], low, high)
+            elif np.ndim(params[name][0]):
+                raise ValueError("Per-stand values of '%s' would be replaced by the climate drivers; give them as a "
+                                 "relative '%s_site_factor' instead" % (name, name))
+            year_params[name] = [row] + list(params[name][1:])
+        return year_params
+
+
+def write_climate_drivers(directory, start_year, phi_s, f_DT, dtype=np.float64):
+    """ Writes climate drivers as .npy arrays, with a JSON header, to a directory.
+
+    :param directory: directory receiving phi_s.npy, f_DT.npy and climate.json (str)
+    :param start_year: year of the first row (int)
+    :param phi_s: annually-averaged incoming short-wave radiation, kWh/m2/day, of shape (years,) or (years, stands)
+        (array of float)
+    :param f_DT: annually-averaged temperature/moisture modifier, of the same shape (array of float)
+    :param dtype: stored data type; np.float32 halves the size of the files, at the cost of rounding the drivers
+        (numpy dtype)
+    :return:
+    """
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    for name, values in zip(climate_params, (phi_s, f_DT)):
+        np.save(os.path.join(directory, name + '.npy'), np.asarray(values, dtype=dtype))
+    header = open(os.path.join(directory, 'climate.json'), 'w')
+    json.dump({'start_year': int(start_year), 'variables': climate_params}, header, indent=1)
+    header.close()
+
+
+def load_climate_drivers(path):
+    """ Opens climate drivers without reading them into memory: a directory written by write_climate_drivers() is
+    memory-mapped, and a NetCDF (.nc) file is read one year at a time as the simulation proceeds.
+
+    :param path: full path to the driver directory or NetCDF file (str)
+    :return: climate drivers (ClimateDrivers)
+    """
+
+    if path.endswith('.nc'):
+        if not netcdf_available:
+            raise ImportError("Reading NetCDF climate drivers requires the netCDF4 module")
+        dataset = netCDF4.Dataset(path, 'r')
+        drivers = {}
+        for name in climate_params:
+            drivers[name] = dataset.variables[name]
+            drivers[name].set_auto_mask(False)
+        return ClimateDrivers(dataset.getncattr('start_year'), drivers)
+
+    header = json.load(open(os.path.join(path, 'climate.json')))
+    drivers = dict((name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r')) for name in climate_params)
+    return ClimateDrivers(header['start_year'], drivers)
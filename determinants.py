@@ -0,0 +1,262 @@
+""" This module fits the stand-level determinant regressions of the FVS analysis (FVS.productivity_determinants() and
+FVS.deficit_determinants()) from the working SQLite database written by FVS.upload_convert_filter_process().  Rather
+than running one JOIN query per regressor and pairing up the unordered results, the full stands x regressors design
+matrix and all response variables are read with a single query keyed on StandID, so every row is guaranteed to describe
+one stand.  The univariate regressions of every response on every regressor, and the multiple regression of every
+response on all regressors, are then each solved in one vectorized least-squares pass, and the results are written as a
+tidy coefficient table with one row per scenario, response, model and term.  Like twp.py, this module can be imported
+without running an analysis.
+
+The least-squares routines accept stacks of design matrices and responses (with leading batch dimensions), so that
+many resampled refits can be solved together.
+"""
+
+import csv
+import sqlite3
+import numpy as np
+from scipy import stats
+
+
+# regressors of the determinant analyses: design matrix column name, SQL expression and axis label
+determinant_regressors = [['Aspect', 'x.Aspect', 'site aspect'],
+                          ['Slope', 'x.Slope', 'site slope'],
+                          ['ElevFt', 'x.ElevFt', 'site elevation'],
+                          ['SpeciesCount', 'sd.SpeciesCount', 'initial species diversity'],
+                          ['Tot_TPHA', 'tpha.Tot_TPHA', 'initial tree density'],
+                          ['Tot_BA', 'ba.Tot_BA', 'initial stand live basal area'],
+                          ['Initial_live_C', 'c0.Aboveground_Total_Live_Control', 'initial stand live carbon density'],
+                          ['InitialMortality', 'm.InitialMortality', 'initial stand mortality (BA basis)']]
+
+# responses of the determinant analyses: name, SQL expression and axis label; the deficit is only available once the
+# Deficit table has been written by FVS.plot_all_deficits()
+determinant_responses = [['Control_productivity', 'c1.Aboveground_Total_Live_Control', 'Control end year AG Live C'],
+                         ['RX_productivity', 'c1.Aboveground_Total_Live_RX', 'RX end year AG Live C'],
+                         ['End_normalized_deficit', 'd.End_normalized_deficit', 'End normalized C deficit']]
+
+# columns of the coefficient table
+coefficient_columns = ['Scenario', 'Response', 'Model', 'Term', 'Estimate', 'Std_error', 't_value', 'p_value',
+                       'R_squared', 'n']
+
+
+def available_responses(db_fpath):
+    """ Lists the determinant responses available in a working database: the deficit response only once the Deficit
+    table has been written.
+
+    :param db_fpath: full path to the working SQLite database (str)
+    :return: response names, in the order of determinant_responses (list of str)
+    """
+
+    con = sqlite3.connect(db_fpath)
+    with con:
+        cur = con.cursor()
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='Deficit'")
+        has_deficit = cur.fetchone() is not None
+    con.close()
+    return [response[0] for response in determinant_responses
+            if response[0] != 'End_normalized_deficit' or has_deficit]
+
+
+def response_groups(db_fpath):
+    """ Groups the available determinant responses as they are analysed (and plotted) together: the productivity
+    responses of both cases, and the deficit response.
+
+    :param db_fpath: full path to the working SQLite database (str)
+    :return: groups of response names (list of lists of str)
+    """
+
+    available = available_responses(db_fpath)
+    groups = [['Control_productivity', 'RX_productivity'], ['End_normalized_deficit']]
+    return [group for group in groups if all(name in available for name in group)]
+
+
+def design_matrix(db_fpath, initial_year=2014, end_year=2100, responses=None):
+    """ Reads the determinant regressors and responses of every stand with a single query, joining all source tables
+    on StandID.  The response tables are left-joined, so that a stand missing from one response table (e.g. Deficit)
+    is not dropped from the regressions of the other responses.  Stands with any missing or non-finite regressor, or
+    requested response, are left out, so every caller receives complete rows.
+
+    :param db_fpath: full path to the working SQLite database (str)
+    :param initial_year: year of the initial stand conditions (int)
+    :param end_year: year of the productivity responses (int)
+    :param responses: names of the responses to read, defaulting to every response available in the database (list
+        of str)
+    :return: StandIDs, in the order of the matrix rows (list of str); design matrix of shape (stands, regressors)
+        (array of float); response matrix of shape (stands, responses) (array of float); regressor names (list of str);
+        response names (list of str)
+    """
+
+    available = available_responses(db_fpath)
+    if responses is None:
+        responses = available
+    for name in responses:
+        if name not in available:
+            raise ValueError("Determinant response '%s' is not available in %s" % (name, db_fpath))
+    expressions = dict((response[0], response[1]) for response in determinant_responses)
+
+    con = sqlite3.connect(db_fpath)
+    with con:
+        cur = con.cursor()
+        query = """ SELECT x.StandID, %s
+                    FROM site x
+                    JOIN SpeciesDiversity sd ON sd.StandID=x.StandID
+                    JOIN Control_TPHA tpha ON tpha.StandID=x.StandID AND tpha.Year=:initial
+                    JOIN Control_SpeciesBA ba ON ba.StandID=x.StandID AND ba.Year=:initial
+                    JOIN Carbon c0 ON c0.StandID=x.StandID AND c0.Year=:initial
+                    JOIN RX_StandMortality m ON m.StandID=x.StandID AND m.Year=:initial
+                    LEFT JOIN Carbon c1 ON c1.StandID=x.StandID AND c1.Year=:end
+                    %s
+                    ORDER BY x.StandID """ % \
+                (', '.join([regressor[1] for regressor in determinant_regressors] +
+                           [expressions[name] for name in responses]),
+                 'LEFT JOIN Deficit d ON d.StandID=x.StandID' if 'End_normalized_deficit' in responses else '')
+        cur.execute(query, {'initial': initial_year, 'end': end_year})
+        rows = cur.fetchall()
+    con.close()
+
+    values = np.array([row[1:] for row in rows], dtype=float).reshape(len(rows), -1)
+    complete = np.all(np.isfinite(values), axis=1)
+    if not complete.all():
+        print "Omitting %i of %i stands with incomplete data from the determinant regressions of %s" % \
+              (len(complete) - complete.sum(), len(complete), ', '.join(responses))
+    stand_ids = [str(row[0]) for row, keep in zip(rows, complete) if keep]
+    values = values[complete]
+    n_regressors = len(determinant_regressors)
+    return stand_ids, values[:, :n_regressors], values[:, n_regressors:], \
+        [regressor[0] for regressor in determinant_regressors], list(responses)
+
+
+def univariate_ols(X, Y):
+    """ Fits the simple linear regression of every response on every regressor in closed form.  X and Y may carry the
+    same leading batch dimensions, e.g. one per resampled data set.
+
+    :param X: design matrix of shape (..., stands, regressors) (array of float)
+    :param Y: response matrix of shape (..., stands, responses) (array of float)
+    :return: dictionary of 'slope', 'intercept', 'slope_se', 'intercept_se', 't_value', 'p_value' (for the slope) and
+        'r_squared', each of shape (..., regressors, responses) (dict of arrays)
+    """
+
+    n = X.shape[-2]
+    x_mean = X.mean(axis=-2)
+    y_mean = Y.mean(axis=-2)
+    Xc = X - x_mean[..., None, :]
+    Yc = Y - y_mean[..., None, :]
+    Sxx = (Xc**2).sum(axis=-2)[..., :, None]
+    Syy = (Yc**2).sum(axis=-2)[..., None, :]
+    Sxy = np.einsum('...ij,...ik->...jk', Xc, Yc)
+
+    slope = Sxy / Sxx
+    intercept = y_mean[..., None, :] - slope * x_mean[..., :, None]
+    residual_variance = np.maximum(Syy - slope * Sxy, 0.0) / (n - 2)
+    slope_se = np.sqrt(residual_variance / Sxx)
+    intercept_se = np.sqrt(residual_variance * (1.0/n + x_mean[..., :, None]**2 / Sxx))
+    t_value = slope / slope_se
+    return {'slope': slope,
+            'intercept': intercept,
+            'slope_se': slope_se,
+            'intercept_se': intercept_se,
+            't_value': t_value,
+            'p_value': 2 * stats.t.sf(np.abs(t_value), n - 2),
+            'r_squared': Sxy**2 / (Sxx * Syy)}
+
+
+def multiple_ols(X, Y):
+    """ Fits the multiple linear regression (with intercept) of every response on all regressors, solving the normal
+    equations of all responses, and of all leading batch dimensions, together.
+
+    :param X: design matrix of shape (..., stands, regressors) (array of float)
+    :param Y: response matrix of shape (..., stands, responses) (array of float)
+    :return: dictionary of 'coefficients', 'std_error', 't_value' and 'p_value', each of shape
+        (..., 1 + regressors, responses) with the intercept first, and 'r_squared' of shape (..., responses) (dict of
+        arrays)
+    """
+
+    n = X.shape[-2]
+    A = np.concatenate([np.ones(X.shape[:-1] + (1,)), X], axis=-1)
+    AtA = np.einsum('...ij,...ik->...jk', A, A)
+    AtY = np.einsum('...ij,...ik->...jk', A, Y)
+    coefficients = np.linalg.solve(AtA, AtY)
+
+    residuals = Y - np.einsum('...ij,...jk->...ik', A, coefficients)
+    degrees_of_freedom = n - A.shape[-1]
+    residual_variance = (residuals**2).sum(axis=-2) / degrees_of_freedom
+    unscaled = np.diagonal(np.linalg.inv(AtA), axis1=-2, axis2=-1)
+    std_error = np.sqrt(unscaled[..., :, None] * residual_variance[..., None, :])
+    t_value = coefficients / std_error
+    total = ((Y - Y.mean(axis=-2)[..., None, :])**2).sum(axis=-2)
+    return {'coefficients': coefficients,
+            'std_error': std_error,
+            't_value': t_value,
+            'p_value': 2 * stats.t.sf(np.abs(t_value), degrees_of_freedom),
+            'r_squared': 1 - (residuals**2).sum(axis=-2) / total}
+
+
+def coefficient_table(scenario, X, Y, regressors, responses):
+    """ Fits the univariate and multiple regressions and tabulates every coefficient.
+
+    :param scenario: scenario name recorded in every row (str)
+    :param X: design matrix of shape (stands, regressors) (array of float)
+    :param Y: response matrix of shape (stands, responses) (array of float)
+    :param regressors: regressor names (list of str)
+    :param responses: response names (list of str)
+    :return: rows of the coefficient table, in the order of coefficient_columns (list of lists)
+    """
+
+    n = X.shape[0]
+    univariate = univariate_ols(X, Y)
+    multiple = multiple_ols(X, Y)
+    terms = ['Intercept'] + list(regressors)
+
+    rows = []
+    for k, response in enumerate(responses):
+        for j, regressor in enumerate(regressors):
+            rows.append([scenario, response, 'univariate:' + regressor, 'Intercept', univariate['intercept'][j, k],
+                         univariate['intercept_se'][j, k],
+                         univariate['intercept'][j, k] / univariate['intercept_se'][j, k],
+                         2 * stats.t.sf(abs(univariate['intercept'][j, k] / univariate['intercept_se'][j, k]), n - 2),
+                         univariate['r_squared'][j, k], n])
+            rows.append([scenario, response, 'univariate:' + regressor, regressor, univariate['slope'][j, k],
+                         univariate['slope_se'][j, k], univariate['t_value'][j, k], univariate['p_value'][j, k],
+                         univariate['r_squared'][j, k], n])
+        for t, term in enumerate(terms):
+            rows.append([scenario, response, 'multiple', term, multiple['coefficients'][t, k],
+                         multiple['std_error'][t, k], multiple['t_value'][t, k], multiple['p_value'][t, k],
+                         multiple['r_squared'][k], n])
+    return rows
+
+
+def write_coefficient_table(rows, results_fpath):
+    """ Writes coefficient table rows, as from coefficient_table(), to a .csv file with a header row.
+
+    :param rows: rows of the coefficient table (list of lists)
+    :param results_fpath: full path to the .csv file (str)
+    :return:
+    """
+
+    file_obj = open(results_fpath, "wb")
+    c = csv.writer(file_obj)
+    c.writerow(coefficient_columns)
+    for row in rows:
+        c.writerow(row)
+    file_obj.close()
+
+
+def determinant_analysis(db_fpath, scenario, results_fpath=None, initial_year=2014, end_year=2100):
+    """ Runs the univariate and multiple determinant regressions of Control and RX productivity and (where the Deficit
+    table exists) end normalized carbon deficit for one scenario database.  Each group of response_groups() is fitted
+    to the stands complete for that group.
+
+    :param db_fpath: full path to the working SQLite database (str)
+    :param scenario: scenario name recorded in the coefficient table (str)
+    :param results_fpath: optional full path to a .csv file receiving the coefficient table (str)
+    :param initial_year: year of the initial stand conditions (int)
+    :param end_year: year of the productivity responses (int)
+    :return: rows of the coefficient table, in the order of coefficient_columns (list of lists)
+    """
+
+    rows = []
+    for group in response_groups(db_fpath):
+        stand_ids, X, Y, regressors, responses = design_matrix(db_fpath, initial_year, end_year, responses=group)
+        rows += coefficient_table(scenario, X, Y, regressors, responses)
+    if results_fpath:
+        write_coefficient_table(rows, results_fpath)
+    return rows
@@ -4,13 +4,18 @@ considering stand growth and response to stochastic fire, insect, and harvest di
 """
 
 
+from checkpoint import CheckpointLog
 import csv
-from GWPbio import GWPbio
+import figures
+from GWPbio import GWPbio, forcing_operator, reference_forcing
 from LCA import LCA
+from landscape import landscape_settings
 import matplotlib.gridspec as gridspec
 import matplotlib.pyplot as plt
 import numpy as np
+import os
 from random import *
+from result_cache import ResultCache
 
 
 print """
@@ -34,6 +39,12 @@ params = {'age_max': [150, 'years', 'estimated maximum stand age'],
           'microbial_efficiency': [0.25, '-', 'Fraction of C entering soil that gets stabilized']
           }
 
+# random number seed of the land() analyses, iteration i drawing from land_seed+i-1; seeded analyses are reproducible,
+# and their results are cached on disk, keyed by everything that determines them.  None for unseeded analyses.
+land_seed = None
+land_version = 1   # version of the land() simulation, included in cache keys so that stale results are never reused
+land_cache = ResultCache('land_cache', max_bytes=64*1024*1024)
+
 
 def beers_law_scalar(beers_k, LAI):
     return np.exp(-1 * beers_k * LAI)   # http://www2.geog.ucl.ac.uk/~mdisney/teaching/GEOGG121/diff/prac/
@@ -183,16 +194,115 @@ def fire(param_dictionary, state_dictionary):
     state_dictionary['interception'].append(0)
 
 
+def land_description(iteration, settings):
+    """ Describes everything that determines the results of one land() analysis iteration, for use as its result cache
+    key (seeded iterations) or to identify the checkpoint of an 'uncert' analysis.
+
+    :param iteration: analysis iteration number (int)
+    :param settings: landscape time and disturbance settings in the landscape.landscape_settings structure (dict)
+    :return: JSON-serializable description (dict)
+    """
+
+    return {'version': land_version,
+            'params': dict((key, float(params[key][0])) for key in params),
+            'states': dict((key, float(states[key][0])) for key in states),
+            'settings': dict((key, float(settings[key])) for key in settings),
+            'seed': None if land_seed is None else land_seed + iteration - 1}
+
+
+def land_scenario(i, settings):
+    """ Simulates every stand of the landscape under the unharvested (i=0) or harvested (i=1) beetle infestation
+    scenario, one stand at a time.
+
+    :param i: scenario index (int)
+    :param settings: landscape time and disturbance settings in the landscape.landscape_settings structure (dict)
+    :return: landscape total time-series of the carbon pools, of shape (6, simulation_length+1) in the order w_f, w_s,
+        w_r, w_l, w_c, w_o (array of float); fire, infestation and harvest event series (arrays of float)
+    """
+
+    runs = int(settings['runs'])
+    start_year = int(settings['start_year'])
+    simulation_length = int(settings['simulation_length'])
+    simulation_years = range(start_year, start_year+simulation_length)
+    fire_frequency = settings['fire_frequency']   # years to a stand-replacing fire
+    infest_start = settings['infest_start']
+    infest_end = settings['infest_end']
+    descrip = ['unharvested scenario', 'harvest scenario']
+
+    # initialize arrays for total landscape carbon fractions
+    total_w_f = np.zeros(simulation_length+1)
+    total_w_s = np.zeros(simulation_length+1)
+    total_w_r = np.zeros(simulation_length+1)
+    total_w_l = np.zeros(simulation_length+1)
+    total_w_c = np.zeros(simulation_length+1)
+    total_w_o = np.zeros(simulation_length+1)
+    fires = np.zeros(simulation_length+1)
+    infestations = np.zeros(simulation_length+1)
+    harvests = np.zeros(simulation_length+1)
+
+    # for each specified stand run, create & initialize a new state variable dictionary, and run through simulation
+    # years computing 3-PG model steps and adding stochastic fire, beetle, and/or harvest events where appropriate
+    for run in range(runs):
+        print '\r   Step %i/2: simulating %s for stand %i/%i' % (i+1, descrip[i], run+1, runs),
+        # make a new initialized state variable dictionary
+        local_states = {'age': [states['age'][0]],
+                        'w_f': [states['w_f'][0]],
+                        'w_s': [states['w_s'][0]],
+                        'w_r': [states['w_r'][0]],
+                        'w_l': [states['w_l'][0]],
+                        'w_c': [states['w_c'][0]],
+                        'w_o': [states['w_o'][0]],
+                        'LAI': [states['LAI'][0]],
+                        'interception': [states['interception'][0]]
+                        }
+        # define stand starting age and stochstic variables
+        age = 0
+        infest_risk = settings['infest_probability'] / (infest_end - infest_start)
+        infested = False
+        j = 0
+        for year in simulation_years:
+            # implement infestation where appropriate.  No growth or fire occur in infestation years
+            rand = random()
+            # ToDo: include a limit on minimum stand size/age for beetle infestation
+            if not infested and (infest_start <= year <= infest_end) and (rand <= infest_risk):
+                age = 0
+                if i == 0:
+                    unharvested_infestation(params, local_states)
+                elif i == 1:
+                    harvest = harvested_infestation(params, local_states)
+                    harvests[j] -= harvest
+                infestations[j] += 1
+            else:
+                # if no infestation, proceed normally with stochastic fire events or 3-PG growth step
+                fire_risk = (1.0/fire_frequency) * (((local_states['w_l'][-1] * 1) + (local_states['w_c'][-1] * 1.1))/20)
+                rand = random()
+                if rand <= fire_risk:
+                    age = 0
+                    fire(params, local_states)
+                    fires[j] += 1
+                else:
+                    three_PG(age, params, local_states)
+                age += 1
+            j += 1
+        total_w_f += np.array(local_states['w_f'])
+        total_w_s += np.array(local_states['w_s'])
+        total_w_r += np.array(local_states['w_r'])
+        total_w_l += np.array(local_states['w_l'])
+        total_w_c += np.array(local_states['w_c'])
+        total_w_o += np.array(local_states['w_o'])
+
+    return np.array([total_w_f, total_w_s, total_w_r, total_w_l, total_w_c, total_w_o]), fires, infestations, harvests
+
+
 def land(iteration, tot_iterations, detail=False):
     # time parameters
-    runs = 1000
-    start_year = 1915
-    simulation_length = 200
+    settings = dict(landscape_settings)
+    start_year = int(settings['start_year'])
+    simulation_length = int(settings['simulation_length'])
     simulation_years = range(start_year, start_year+simulation_length)
     plot_years = range(start_year, start_year+simulation_length+1)
-    fire_frequency = 200   # years to a stand-replacing fire
-    infest_start = 2005
-    infest_end = 2015
+    infest_start = settings['infest_start']
+    infest_end = settings['infest_end']
 
     # defining plot structure
     if detail:
@@ -215,84 +325,36 @@ def land(iteration, tot_iterations, detail=False):
         ax6.set_title("Carbon deficit")
         axis_objs = [[ax1, ax2], [ax3, ax4]]
 
-    # define loops for simulating unharvested and harvested beetle infestation
-    descrip = ['unharvested scenario', 'harvest scenario']
-    landscape_totals = []
-    max_fire_freq = []
+    # simulate the unharvested and harvested beetle infestation scenarios, or, for a seeded iteration that has been
+    # simulated before, read both from the result cache
     print
     print 'Executing simulations for analysis iteration %i/%i - ' % (iteration, tot_iterations)
+    cached = None
+    if land_seed is not None:
+        seed(land_seed + iteration - 1)
+        key = land_cache.key(land_description(iteration, settings))
+        cached = land_cache.load(key)
+    if cached is not None:
+        print '   Read both scenarios from the result cache'
+    else:
+        cached = {'totals': [], 'fires': [], 'infestations': [], 'harvests': []}
+        for i in (0, 1):
+            scenario_totals, fires, infestations, harvests = land_scenario(i, settings)
+            cached['totals'].append(scenario_totals)
+            cached['fires'].append(fires)
+            cached['infestations'].append(infestations)
+            cached['harvests'].append(harvests)
+            print
+        cached = dict((name, np.array(cached[name])) for name in cached)
+        if land_seed is not None:
+            land_cache.store(key, cached)
+
+    landscape_totals = []
+    max_fire_freq = []
     for i in (0, 1):
-        # initialize lists for total landscape carbon fractions
-        total_w_f = [0]
-        total_w_s = [0]
-        total_w_r = [0]
-        total_w_l = [0]
-        total_w_c = [0]
-        total_w_o = [0]
-        fires = [0]
-        infestations = [0]
-        harvests = [0]
-        for k in range(simulation_length):
-            total_w_f.append(0)
-            total_w_s.append(0)
-            total_w_r.append(0)
-            total_w_l.append(0)
-            total_w_c.append(0)
-            total_w_o.append(0)
-            fires.append(0)
-            infestations.append(0)
-            harvests.append(0)
-
-        # for each specified stand run, create & initialize a new state variable dictionary, and run through simulation
-        # years computing 3-PG model steps and adding stochastic fire, beetle, and/or harvest events where appropriate
-        for run in range(runs):
-            print '\r   Step %i/2: simulating %s for stand %i/%i' % (i+1, descrip[i], run+1, runs),
-            # make a new initialized state variable dictionary
-            local_states = {'age': [states['age'][0]],
-                            'w_f': [states['w_f'][0]],
-                            'w_s': [states['w_s'][0]],
-                            'w_r': [states['w_r'][0]],
-                            'w_l': [states['w_l'][0]],
-                            'w_c': [states['w_c'][0]],
-                            'w_o': [states['w_o'][0]],
-                            'LAI': [states['LAI'][0]],
-                            'interception': [states['interception'][0]]
-                            }
-            # define stand starting age and stochstic variables
-            age = 0
-            infest_risk = 0.8 / (infest_end - infest_start)
-            infested = False
-            j = 0
-            for year in simulation_years:
-                # implement infestation where appropriate.  No growth or fire occur in infestation years
-                rand = random()
-                # ToDo: include a limit on minimum stand size/age for beetle infestation
-                if not infested and (infest_start <= year <= infest_end) and (rand <= infest_risk):
-                    age = 0
-                    if i == 0:
-                        unharvested_infestation(params, local_states)
-                    elif i == 1:
-                        harvest = harvested_infestation(params, local_states)
-                        harvests[j] -= harvest
-                    infestations[j] += 1
-                else:
-                    # if no infestation, proceed normally with stochastic fire events or 3-PG growth step
-                    fire_risk = (1.0/fire_frequency) * (((local_states['w_l'][-1] * 1) + (local_states['w_c'][-1] * 1.1))/20)
-                    rand = random()
-                    if rand <= fire_risk:
-                        age = 0
-                        fire(params, local_states)
-                        fires[j] += 1
-                    else:
-                        three_PG(age, params, local_states)
-                    age += 1
-                j += 1
-            total_w_f += np.array(local_states['w_f'])
-            total_w_s += np.array(local_states['w_s'])
-            total_w_r += np.array(local_states['w_r'])
-            total_w_l += np.array(local_states['w_l'])
-            total_w_c += np.array(local_states['w_c'])
-            total_w_o += np.array(local_states['w_o'])
+        total_w_f, total_w_s, total_w_r, total_w_l, total_w_c, total_w_o = cached['totals'][i]
+        fires = cached['fires'][i]
+        harvests = cached['harvests'][i]
 
         if detail:
             axis_objs[i][0].bar(plot_years, fires)
@@ -309,7 +371,6 @@ def land(iteration, tot_iterations, detail=False):
 
         landscape_total = total_w_f + total_w_s + total_w_r + total_w_l + total_w_c + total_w_o
         landscape_totals.append(landscape_total)
-        print
 
     unharv_nee = np.ediff1d(landscape_totals[0], to_begin=0)
     short_unharv_nee = np.delete(unharv_nee, range(50))   # lop off the first 80 years of data for clarity
@@ -340,8 +401,8 @@ def land(iteration, tot_iterations, detail=False):
 
     #ToDo: make this conversion exact
     relative_co2_fluxes = -3.67 * nee_difference
-    simulated_forcing = GWPbio(relative_co2_fluxes, 100)
-    CO2_reference_forcing = GWPbio([1], 100)
+    simulated_forcing = forcing_operator(len(relative_co2_fluxes), 100).forcing(relative_co2_fluxes)
+    CO2_reference_forcing = reference_forcing(100)
     biogenic_impact_ratio = (simulated_forcing/CO2_reference_forcing) / (np.sum(harvests)*-3.67)
 
     print "Simulated forcing:", simulated_forcing
@@ -379,7 +440,15 @@ while True:
 'stand' to run a stand-level simulation showing long-term growth trajectory and response to disturbance,
 'land' to run a single stochastic landscape-level analysis showing ecosystem response to beetle attack
      under harvested and unharvested management,
-'uncert' to run a set of stochastic landscape analyses in order to bound uncertainty in ecosystem response, or
+'uncert' to run a set of stochastic landscape analyses in order to bound uncertainty in ecosystem response,
+'expected' to compute the expected landscape response deterministically, as a cross-check on 'uncert',
+'spinup' to run the landscape analysis from equilibrium stands, replacing most of the burn-in period,
+'horizons' to tabulate forcing and the biogenic impact ratio for every GWPbio time horizon up to 300 years,
+'spatial' to run a landscape analysis on a raster grid with fire and beetle spread between neighbouring stands,
+'variance' to compare variance-reduced sampling modes for the harvested vs. unharvested deficit,
+'sobol' to run a global sensitivity analysis of the landscape carbon deficit and biogenic impact ratio,
+'seed' to seed 'land' and 'uncert', so that repeated analyses are read from the result cache,
+'sites' to run a landscape analysis of the FVS stand list, each stand with parameters derived from its site data, or
 'q' to quit:\n   """)
     print
 
@@ -464,12 +533,18 @@ while True:
         plt.text(40, -50, "Fire", horizontalalignment='center', verticalalignment='center')
         plt.text(80, -50, "Beetles", horizontalalignment='center', verticalalignment='center')
         plt.xlim((0, simulation_length))
-        plt.savefig('stand.png')
-        plt.close()
+        figures.save('stand.png')
+
+    elif command == 'seed':
+        value = raw_input("Please specify a random number seed, or 'none' for unseeded (uncached) analyses: ")
+        if value.strip().lower() == 'none':
+            land_seed = None
+        else:
+            land_seed = int(value)
 
     elif command == 'land':
         land(1, 1, detail=True)
-        plt.savefig('land.png')
+        figures.save('land.png')
 
     elif command == 'uncert':
         import pandas as pd
@@ -478,17 +553,32 @@ while True:
         c_deficits = []
         c_harvests = []
         iterations = 20
-        for i in range(iterations):
+
+        # every completed iteration is checkpointed with the random number generator state, so that an interrupted
+        # analysis of the same model set-up resumes after its last completed iteration
+        checkpoint = CheckpointLog(os.path.join('checkpoints', 'uncert-%s.ckpt' % land_cache.key(
+            {'iterations': iterations, 'land': land_description(1, dict(landscape_settings))})))
+        completed = checkpoint.load()
+        for record in completed:
+            years = record['years']
+            c_deficits.append(record['c_deficit'])
+            c_harvests.append(record['c_harvest'])
+        if completed:
+            setstate(completed[-1]['random_state'])
+            print "Resuming from checkpoint after %i/%i completed iterations" % (len(completed), iterations)
+
+        for i in range(len(completed), iterations):
             years, c_deficit, c_harvest = land(i+1, iterations)
             plt.close()
             c_deficits.append(c_deficit)
             c_harvests.append(c_harvest)
+            checkpoint.append({'iteration': i+1, 'years': years, 'c_deficit': c_deficit, 'c_harvest': c_harvest,
+                               'random_state': getstate()})
         ax1, time, central_deficit = sns.tsplot(c_deficits, years, color='red', condition='System C deficit')
         ax2, time, central_harvest = sns.tsplot(c_harvests, years, color='blue', condition='Cumulative C harvest')
         ax1.set_xlabel('Year')
         ax2.set_ylabel('Landscape MgC')
-        plt.savefig('composite.png')
-        plt.close()
+        figures.save('composite.png')
 
         print
         print
@@ -505,7 +595,7 @@ while True:
         harvest_co2eq = c_harvest * 3.67
         print "Harvest gross CO2 equivalence:  %.1f  MgCO2eq" % harvest_co2eq
         print "Cumulative forcing:  %.8f  Wh/m2" % cumulative_forcing
-        CO2_reference_forcing = GWPbio([1], 100)
+        CO2_reference_forcing = reference_forcing(100)
         print "Reference forcing, present-day emission of 1 MgCO2:  %.8f  Wh/m2" % CO2_reference_forcing
         biogenic_CO2eq = cumulative_forcing / CO2_reference_forcing
         print "Biogenic CO2 equivalence:  %.1f  MgCO2eq" % biogenic_CO2eq
@@ -526,11 +616,80 @@ while True:
             print flux
             c.writerow([flux])
         file_obj.close()
+        # the iterations are only discarded once the composite figures are on disk
+        figures.wait()
+        checkpoint.remove()
         # LCA(flux_MJ.tolist())
 
+    elif command == 'expected':
+        from markov import expected_landscape_analysis
+        results = expected_landscape_analysis(params, states)
+        print "Expected-value landscape analysis (no sampling noise):"
+        print "Total C removal with harvest:  %.1f  MgC" % (-1 * results['cumulative_harvest'][-1])
+        print "Final system C deficit:  %.1f  MgC" % results['cumulative_deficit'][-1]
+        print "Simulated forcing:", results['simulated_forcing']
+        print "Biogenic CO2 equivalence:", results['biogenic_CO2eq']
+        print "Biogenic impact ratio:", results['biogenic_impact_ratio']
+
+    elif command == 'spinup':
+        from spinup import equilibrium_states
+        from landscape import landscape_analysis
+        equilibrium = equilibrium_states(params, states)
+        spinup_settings = {'start_year': 1995, 'simulation_length': 120}   # 10-year lead-in before infestation
+        results = landscape_analysis(params, equilibrium, settings=spinup_settings)
+        print "Landscape analysis from equilibrium initial stands:"
+        print "Mean initial stand age:  %.1f  years" % np.mean(equilibrium['age'][0])
+        print "Total C removal with harvest:  %.1f  MgC" % (-1 * results['cumulative_harvest'][-1])
+        print "Final system C deficit:  %.1f  MgC" % results['cumulative_deficit'][-1]
+        print "Biogenic impact ratio:", results['biogenic_impact_ratio']
+
+    elif command == 'horizons':
+        from GWPbio import horizon_sweep, sweep_columns
+        from landscape import landscape_analysis
+        results = landscape_analysis(params, states)
+        sweep = horizon_sweep(-3.67 * results['nee_difference'], 300)
+        harvest_co2eq = np.sum(results['scenarios'][1]['harvests']) * -3.67
+        impact_ratios = sweep[:, sweep_columns.index('biogenic_CO2eq')] / harvest_co2eq
+        np.savetxt('horizons.csv', np.column_stack([sweep, impact_ratios]), delimiter=',',
+                   header=','.join(sweep_columns + ['biogenic_impact_ratio']), comments='')
+        print "Biogenic impact ratio by GWPbio time horizon (all horizons written to horizons.csv):"
+        for horizon in (20, 50, 100, 300):
+            print "   %i years:  %.8f" % (horizon, impact_ratios[horizon-1])
+
+    elif command == 'spatial':
+        from spatial import spatial_landscape_analysis
+        results = spatial_landscape_analysis(params, states)
+        print "Spatially explicit landscape analysis (100 x 100 grid):"
+        print "Fires (ignitions + spread), unharvested scenario:  %i" % np.sum(results['scenarios'][0]['fires'])
+        print "Stands burned by spread, unharvested scenario:  %i" % np.sum(results['scenarios'][0]['spread_fires'])
+        print "Final system C deficit:  %.1f  MgC" % results['cumulative_deficit'][-1]
+        print "Biogenic impact ratio:", results['biogenic_impact_ratio']
+
+    elif command == 'variance':
+        from landscape import variance_reduction
+        for mode in ('common', 'antithetic', 'sobol'):
+            variance_reduction(params, states, sampling=mode)
+            print
+
+    elif command == 'sobol':
+        from sensitivity import sobol_analysis
+        sobol_analysis(params, states)
+
+    elif command == 'sites':
+        from stand_params import heterogeneous_landscape_analysis
+        db_fpath = raw_input("Please specify the full path to an FVS working database holding a site table: ")
+        results = heterogeneous_landscape_analysis(params, states, db_fpath)
+        print "Heterogeneous landscape analysis (%i FVS stands):" % len(results['stand_ids'])
+        for key in ('phi_s', 'f_DT', 'age_max'):
+            print "   %s range:  %.3f - %.3f  (%s)" % (key, np.min(results['stand_params'][key][0]),
+                                                    np.max(results['stand_params'][key][0]), params[key][1])
+        print "Total C removal with harvest:  %.1f  MgC" % (-1 * results['cumulative_harvest'][-1])
+        print "Final system C deficit:  %.1f  MgC" % results['cumulative_deficit'][-1]
+        print "Biogenic impact ratio:", results['biogenic_impact_ratio']
 
     elif command == 'q':
         print "   Quitting application..."
+        figures.wait()
         print
         print
         break
@@ -0,0 +1,133 @@
+""" This module moves figure rendering and file writing off the critical path of the analysis pipelines.  Figures are
+queued with a FigureWriter, and a pool of worker processes renders and writes them while the calling process moves on
+to the next scenario or iteration.  A figure can be queued either as a data bundle, i.e. a module-level plotting
+function and the data it draws (e.g. twp.plot_pathway() and one pathway's forcing), or as a figure already built with
+pyplot, which is pickled, closed in the calling process and drawn and written by a worker.  wait() is the barrier that
+guarantees every queued file has been written; it is also called when the interpreter exits.
+
+Figures are drawn with the Agg-based backends in the workers, whatever the interactive backend of the calling process.
+"""
+
+import atexit
+import cPickle
+import multiprocessing
+
+
+def _initialize_worker():
+    # render with a non-interactive backend in the workers
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+
+def _render(render, args, kwargs):
+    # worker routine calling a plotting function on its data bundle
+    render(*args, **kwargs)
+
+
+def _write_pickled(pickled_figure, fpath, savefig_kwargs):
+    # worker routine drawing and writing a pickled pyplot figure
+    import matplotlib.pyplot as plt
+    figure = cPickle.loads(pickled_figure)
+    figure.savefig(fpath, **savefig_kwargs)
+    plt.close(figure)
+
+
+class FigureWriter(object):
+    """ Queue of figures rendered and written by a pool of worker processes, created when the first figure is queued.
+    With processes=0, figures are rendered immediately in the calling process instead.
+    """
+
+    def __init__(self, processes=2, max_pending=16):
+        """
+        :param processes: number of worker processes, or 0 to render in the calling process (int)
+        :param max_pending: number of queued figures beyond which queueing another waits for the oldest to be written,
+            bounding the memory held by queued figures (int)
+        """
+
+        self.processes = processes
+        self.max_pending = max_pending
+        self.pool = None
+        self.pending = []
+
+    def submit(self, render, *args, **kwargs):
+        """ Queues a call render(*args, **kwargs) to a module-level plotting function that builds a figure from its
+        data and writes it to file.
+
+        :param render: plotting function (function)
+        :return:
+        """
+
+        if not self.processes:
+            render(*args, **kwargs)
+            return
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes, initializer=_initialize_worker)
+        while len(self.pending) >= self.max_pending:
+            self.pending.pop(0).get()
+        self.pending.append(self.pool.apply_async(_render, (render, args, kwargs)))
+
+    def save(self, fpath, figure=None, **savefig_kwargs):
+        """ Queues writing of a figure built with pyplot, in place of plt.savefig(fpath) followed by plt.close().  The
+        figure is closed in the calling process.
+
+        :param fpath: output file path (str)
+        :param figure: figure to write, defaulting to the current pyplot figure (matplotlib.figure.Figure)
+        :param savefig_kwargs: keyword arguments of savefig(), e.g. dpi (dict)
+        :return:
+        """
+
+        import matplotlib.pyplot as plt
+        if figure is None:
+            figure = plt.gcf()
+        if not self.processes:
+            figure.savefig(fpath, **savefig_kwargs)
+        else:
+            self.submit(_write_pickled, cPickle.dumps(figure, cPickle.HIGHEST_PROTOCOL), fpath, savefig_kwargs)
+        plt.close(figure)
+
+    def wait(self):
+        """ Blocks until every queued figure has been written, re-raising the first error raised in rendering.
+
+        :return:
+        """
+
+        pending, self.pending = self.pending, []
+        for result in pending:
+            result.get()
+
+    def close(self):
+        """ Waits for every queued figure, then shuts down the worker processes.
+
+        :return:
+        """
+
+        try:
+            self.wait()
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+
+# figure writer shared by the analysis modules
+writer = FigureWriter()
+atexit.register(writer.close)
+
+
+def submit(render, *args, **kwargs):
+    """ Queues a plotting function call with the shared figure writer (see FigureWriter.submit()). """
+
+    writer.submit(render, *args, **kwargs)
+
+
+def save(fpath, figure=None, **savefig_kwargs):
+    """ Queues writing of a pyplot figure with the shared figure writer (see FigureWriter.save()). """
+
+    writer.save(fpath, figure=figure, **savefig_kwargs)
+
+
+def wait():
+    """ Blocks until every figure queued with the shared figure writer has been written. """
+
+    writer.wait()
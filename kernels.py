@@ -0,0 +1,149 @@
+""" This module provides an optional compiled backend for the stand-by-stand landscape engine in landscape.py.  The
+stand-year recurrence of 3-PG growth, fire and infestation is written as a single tight loop over preallocated arrays
+and compiled with Numba, with stands split into chunks that are simulated in parallel on all cores.  Random draws are
+generated up front with landscape.stand_draws() in the same order as the NumPy engine, so both backends produce the
+same results for the same seed.  When Numba is not installed, simulate_scenario_jit() falls back to the NumPy engine.
+"""
+
+import numpy as np
+from landscape import pools, initial_stands, stand_draws, simulate_scenario
+
+try:
+    from numba import njit, prange
+    numba_available = True
+except ImportError:
+    numba_available = False
+
+    def njit(*args, **kwargs):
+        return lambda function: function
+    prange = range
+
+
+# order of the 3-PG parameters in the array passed to the compiled kernel
+kernel_params = ['age_max', 'n_age', 'phi_s', 'f_DT', 'sigma_f', 'beers_k', 'microbial_efficiency']
+
+
+@njit(parallel=True, cache=True)
+def _stand_kernel(param_values, initial_age, initial, infest_draws, fire_draws, infest_window, infest_risk,
+                  fire_frequency, harvest, chunks):
+    """ Compiled stand-year loop.  Each chunk of stands accumulates its own landscape totals and event counts, which
+    are summed once all chunks are complete, so that parallel chunks never write to shared memory.
+    """
+
+    age_max, n_age, phi_s, f_DT, sigma_f, beers_k, microbial_efficiency = param_values
+    simulation_length, runs = fire_draws.shape
+    litter_fraction = 1 - np.exp(np.log(0.5) / 2)
+    coarse_fraction = 1 - np.exp(np.log(0.5) / 20)
+    som_fraction = 1 - np.exp(np.log(0.5) / 10)
+
+    totals = np.zeros((chunks, simulation_length+1, 6))
+    events = np.zeros((chunks, simulation_length+1, 3))   # fires, infestations, harvests
+    chunk_size = (runs + chunks - 1) // chunks
+
+    for c in prange(chunks):
+        for s in range(c * chunk_size, min((c+1) * chunk_size, runs)):
+            w_f, w_s, w_r = initial[0, s], initial[1, s], initial[2, s]
+            w_l, w_c, w_o = initial[3, s], initial[4, s], initial[5, s]
+            age = initial_age[s]
+            for j in range(simulation_length):
+                if infest_window[j] and infest_draws[j, s] <= infest_risk:
+                    events[c, j, 1] += 1
+                    if harvest:
+                        events[c, j, 2] -= w_s
+                    else:
+                        w_c = w_c + w_s
+                    w_l = w_l + w_f
+                    w_o = w_o + w_r * microbial_efficiency
+                    w_f = 0.1
+                    w_s = 0.1
+                    w_r = 0.1
+                    age = 0.0
+                elif fire_draws[j, s] <= (1.0/fire_frequency) * ((w_l + (w_c * 1.1))/20):
+                    events[c, j, 0] += 1
+                    w_l = w_l * 0.5
+                    w_c = w_c * 0.5 + w_s
+                    w_o = w_o + w_r * microbial_efficiency
+                    w_f = 0.1
+                    w_s = 0.1
+                    w_r = 0.1
+                    age = 1.0
+                else:
+                    intercept_fraction = 1 - np.exp(-1 * beers_k * w_f * 0.1 * sigma_f)
+                    f_age = 1.0 / (1 + ((age / age_max)/0.95)**n_age)
+                    increment = phi_s * 3.6 * 0.5 * intercept_fraction * 1.8 * f_DT * f_age * 0.45 * 365 * 0.01
+                    litterfall = w_f * 0.20
+                    litter_turnover = w_l * litter_fraction
+                    branchfall = w_s * 0.10
+                    coarse_turnover = w_c * coarse_fraction
+                    som_turnover = w_o * som_fraction
+                    root_turnover = 0.25 * w_r
+                    w_f = w_f + (0.33 * increment) - litterfall
+                    w_s = w_s + (0.33 * increment) - branchfall
+                    w_r = w_r + (0.33 * increment) - root_turnover
+                    w_l = w_l + litterfall + (0.9 * branchfall) - litter_turnover
+                    w_c = w_c + (0.1 * branchfall) - coarse_turnover
+                    w_o = w_o + ((root_turnover + litter_turnover + coarse_turnover) * microbial_efficiency) - \
+                        som_turnover
+                    age += 1.0
+                totals[c, j+1, 0] += w_f
+                totals[c, j+1, 1] += w_s
+                totals[c, j+1, 2] += w_r
+                totals[c, j+1, 3] += w_l
+                totals[c, j+1, 4] += w_c
+                totals[c, j+1, 5] += w_o
+
+    return totals.sum(axis=0), events.sum(axis=0)
+
+
+def simulate_scenario_jit(params, states, settings, harvest, rng, sampling='independent', chunks=64, account=None,
+                          climate=None):
+    """ Compiled-backend equivalent of landscape.simulate_scenario(), with the same arguments and results structure.
+    Falls back to landscape.simulate_scenario() when Numba is not installed, or when time-varying climate drivers or
+    per-stand parameters are given, since the compiled kernel takes one constant parameter set.
+
+    :param chunks: number of stand chunks distributed across cores (int)
+    :param account: optional running carbon account, fed with the yearly landscape totals once the kernel has run
+        (landscape.RunningAccount)
+    :return: dictionary of landscape-total time-series in the simulate_scenario() structure (dict of arrays)
+    """
+
+    if not numba_available or climate is not None or any(np.ndim(params[name][0]) for name in kernel_params):
+        return simulate_scenario(params, states, settings, harvest, rng, sampling=sampling, account=account,
+                                 climate=climate)
+
+    runs = int(settings['runs'])
+    start_year = int(settings['start_year'])
+    simulation_length = int(settings['simulation_length'])
+    infest_start = settings['infest_start']
+    infest_end = settings['infest_end']
+    infest_risk = settings['infest_probability'] / (infest_end - infest_start)
+
+    # draw all random numbers up front, in the order used by the NumPy engine
+    infest_draws = np.zeros((simulation_length, runs))
+    fire_draws = np.zeros((simulation_length, runs))
+    for j in range(simulation_length):
+        infest_draws[j], fire_draws[j] = stand_draws(runs, rng, sampling)
+    years = np.arange(start_year, start_year + simulation_length)
+    infest_window = (years >= infest_start) & (years <= infest_end)
+
+    param_values = np.array([float(params[name][0]) for name in kernel_params])
+    initial_age, current = initial_stands(states, runs)
+    initial = np.array(current)
+    pool_totals, events = _stand_kernel(param_values, initial_age, initial, infest_draws, fire_draws, infest_window,
+                                        float(infest_risk), float(settings['fire_frequency']), bool(harvest),
+                                        min(int(chunks), runs))
+
+    totals = {}
+    for k, pool in enumerate(pools):
+        totals[pool] = pool_totals[:, k]
+        totals[pool][0] = initial[k].sum()
+    totals['fires'] = events[:, 0]
+    totals['infestations'] = events[:, 1]
+    totals['harvests'] = events[:, 2]
+    if account is not None:
+        landscape_total = np.sum([totals[pool] for pool in pools], axis=0)
+        account.start(landscape_total[0])
+        for j in range(simulation_length):
+            account.update(landscape_total[j+1], totals['harvests'][j])
+    return totals
+
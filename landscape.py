@@ -0,0 +1,549 @@
+""" This module provides a vectorized implementation of the landscape-level simulation performed by dynamics.land(),
+advancing every stand in the landscape simultaneously as numpy arrays rather than simulating stands one at a time.
+The growth and disturbance equations mirror three_PG(), fire(), unharvested_infestation() and harvested_infestation()
+in dynamics.py, and parameters are passed in the same [value, units, description] dictionary structure.  Because it
+can be imported without starting the interactive dynamics.py control loop, this module serves as the simulation
+engine for analyses requiring large numbers of landscape evaluations.
+"""
+
+import numpy as np
+from GWPbio import BernBurden, forcing_operator, reference_forcing
+
+
+# carbon pools tracked for each stand, in the order they are stored in the stand state arrays
+pools = ['w_f', 'w_s', 'w_r', 'w_l', 'w_c', 'w_o']
+
+# default landscape time and disturbance settings, matching the values hard-coded in dynamics.land()
+landscape_settings = {'runs': 1000,   # number of simulated stands
+                      'start_year': 1915,
+                      'simulation_length': 200,   # years
+                      'fire_frequency': 200,   # years to a stand-replacing fire
+                      'infest_start': 2005,
+                      'infest_end': 2015,
+                      'infest_probability': 0.8   # fraction of stands infested over the infestation window
+                      }
+
+# random draw schemes available to the stand-by-stand engine; all but 'independent' use common random numbers, so that
+# each stand sees the same fire and infestation draws in the unharvested and harvested scenarios
+sampling_modes = ['independent', 'common', 'antithetic', 'sobol']
+
+
+def initial_stands(states, runs):
+    """ Expands an initial state variable dictionary to per-stand arrays.  Initial values may be scalars, as in the
+    dynamics.states structure, or arrays holding one value per stand, as produced by spinup.equilibrium_states().
+
+    :param states: initial state variable dictionary (dict of lists)
+    :param runs: number of stands (int)
+    :return: stand ages (array of float); carbon pools in the order of the pools list (list of arrays of float)
+    """
+
+    age = np.zeros(runs) + states['age'][0]
+    current = [np.zeros(runs) + states[pool][0] for pool in pools]
+    return age, current
+
+
+def check_stand_params(params, runs):
+    """ Raises a ValueError unless every parameter value is either a scalar, shared by all stands, or an array of one
+    value per stand, as in the struct-of-arrays parameters of stand_params.derive_stand_params().
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param runs: number of stands (int)
+    :return: whether any parameter varies between stands (bool)
+    """
+
+    heterogeneous = False
+    for key in params:
+        shape = np.shape(params[key][0])
+        if shape not in ((), (runs,)):
+            raise ValueError("Parameter '%s' has %s values, but %i stands are simulated" % (key, shape, runs))
+        heterogeneous = heterogeneous or shape == (runs,)
+    return heterogeneous
+
+
+def three_PG_step(age, params, w_f, w_s, w_r, w_l, w_c, w_o):
+    """ Vectorized equivalent of dynamics.three_PG(), applying a single annual growth step to arrays of stand ages and
+    carbon pools.
+
+    :param age: stand age(s) since last disturbance (int or array of int)
+    :param params: model parameter dictionary in the dynamics.params structure, with scalar values or arrays of one
+        value per stand (dict)
+    :param w_f, w_s, w_r, w_l, w_c, w_o: current carbon pools, Mg/ha (arrays of float)
+    :return: tuple of updated carbon pools in the order of the pools list (arrays of float)
+    """
+
+    age_max = params['age_max'][0]
+    n_age = params['n_age'][0]
+    phi_s = params['phi_s'][0]
+    f_DT = params['f_DT'][0]
+    sigma_f = params['sigma_f'][0]
+    beers_k = params['beers_k'][0]
+    microbial_efficiency = params['microbial_efficiency'][0]
+
+    # canopy light interception and annual total biomass increment
+    LAI = w_f * (0.1 * sigma_f)
+    intercept_fraction = 1 - np.exp(-1 * beers_k * LAI)
+    phi_pa = phi_s * 3.6 * 0.5 * intercept_fraction
+    relative_age = np.asarray(age, dtype=float) / age_max
+    f_age = 1.0 / (1 + (relative_age/0.95)**n_age)
+    annual_c_increment = phi_pa * 1.8 * f_DT * f_age * 0.45 * 365 * 0.01   # Mg/ha/y
+
+    # turnover & transfer quantities
+    litterfall = w_f * 0.20
+    litter_turnover = w_l * (1 - np.exp(np.log(0.5) / 2))
+    branchfall = w_s * 0.10
+    coarse_turnover = w_c * (1 - np.exp(np.log(0.5) / 20))
+    som_turnover = w_o * (1 - np.exp(np.log(0.5) / 10))
+    root_turnover = 0.25 * w_r
+
+    # mass balance for all carbon pools
+    new_w_f = w_f + (0.33 * annual_c_increment) - litterfall
+    new_w_s = w_s + (0.33 * annual_c_increment) - branchfall
+    new_w_r = w_r + (0.33 * annual_c_increment) - root_turnover
+    new_w_l = w_l + litterfall + (0.9 * branchfall) - litter_turnover
+    new_w_c = w_c + (0.1 * branchfall) - coarse_turnover
+    new_w_o = w_o + ((root_turnover + litter_turnover + coarse_turnover) * microbial_efficiency) - som_turnover
+
+    return new_w_f, new_w_s, new_w_r, new_w_l, new_w_c, new_w_o
+
+
+def fire_step(params, w_f, w_s, w_r, w_l, w_c, w_o):
+    """ Vectorized equivalent of dynamics.fire().
+
+    :return: tuple of post-fire carbon pools in the order of the pools list (arrays of float)
+    """
+
+    microbial_efficiency = params['microbial_efficiency'][0]
+    reset = np.full_like(w_f, 0.1)
+    return reset, reset, reset, w_l * 0.5, w_c * 0.5 + w_s, w_o + (w_r * microbial_efficiency)
+
+
+def infestation_step(params, harvest, w_f, w_s, w_r, w_l, w_c, w_o):
+    """ Vectorized equivalent of dynamics.unharvested_infestation() (harvest=False) and
+    dynamics.harvested_infestation() (harvest=True).
+
+    :return: tuple of post-infestation carbon pools in the order of the pools list (arrays of float); harvested stem
+        carbon, Mg/ha (array of float)
+    """
+
+    microbial_efficiency = params['microbial_efficiency'][0]
+    reset = np.full_like(w_f, 0.1)
+    if harvest:
+        new_w_c = w_c
+        removed = w_s
+    else:
+        new_w_c = w_c + w_s
+        removed = np.zeros_like(w_s)
+    return (reset, reset, reset, w_l + w_f, new_w_c, w_o + (w_r * microbial_efficiency)), removed
+
+
+def sobol_2d(n, rng):
+    """ Returns the first n points of the two-dimensional Sobol sequence, randomized with a digital shift so that
+    every point remains uniformly distributed while the point set keeps its low-discrepancy stratification.
+
+    :param n: number of points (int)
+    :param rng: random number generator (numpy.random.RandomState)
+    :return: array of shape (2, n) of points in [0, 1) (array of float)
+    """
+
+    bits = 32
+    index = np.arange(n, dtype=np.uint64)
+    directions = np.zeros((2, bits), dtype=np.uint64)
+    directions[0] = [1 << (bits - 1 - k) for k in range(bits)]
+    directions[1, 0] = 1 << (bits - 1)
+    for k in range(1, bits):   # primitive polynomial x + 1
+        directions[1, k] = directions[1, k-1] ^ (directions[1, k-1] >> np.uint64(1))
+
+    points = np.zeros((2, n), dtype=np.uint64)
+    for k in range(bits):
+        set_bits = ((index >> np.uint64(k)) & np.uint64(1)).astype(bool)
+        points[:, set_bits] ^= directions[:, k:k+1]
+    shift = rng.randint(0, 2**bits, size=(2, 1)).astype(np.uint64)
+    return (points ^ shift) / float(2**bits)
+
+
+def stand_draws(runs, rng, sampling='independent'):
+    """ Generates one year's uniform infestation and fire draws for every stand under the chosen sampling scheme:
+    independent pseudo-random draws ('independent' and 'common'), antithetic stand pairs drawing u and 1-u
+    ('antithetic'), or a randomized Sobol point set assigned to stands in random order ('sobol').
+
+    :param runs: number of stands (int)
+    :param rng: random number generator (numpy.random.RandomState)
+    :param sampling: one of the sampling_modes (str)
+    :return: infestation draws (array of float); fire draws (array of float)
+    """
+
+    if sampling in ('independent', 'common'):
+        return rng.random_sample(runs), rng.random_sample(runs)
+    elif sampling == 'antithetic':
+        u = rng.random_sample((2, (runs + 1) // 2))
+        draws = np.concatenate([u, 1 - u], axis=1)[:, :runs]
+    elif sampling == 'sobol':
+        draws = sobol_2d(runs, rng)[:, rng.permutation(runs)]
+    else:
+        raise ValueError("Unknown sampling mode '%s'" % sampling)
+    return draws[0], draws[1]
+
+
+def simulate_scenario(params, states, settings, harvest, rng, sampling='independent', account=None, climate=None):
+    """ Simulates a full landscape of stands under either the unharvested or harvested beetle infestation scenario,
+    reproducing the stand-level logic of dynamics.land(): infestation is tested first each year, and growth or fire
+    occur only in years without infestation.
+
+    :param params: model parameter dictionary in the dynamics.params structure, with scalar values or arrays of one
+        value per stand (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param settings: landscape time and disturbance settings in the landscape_settings structure (dict)
+    :param harvest: whether infested stands are salvage-harvested (bool)
+    :param rng: random number generator (numpy.random.RandomState)
+    :param sampling: one of the sampling_modes, passed to stand_draws() (str)
+    :param account: optional running carbon account updated with the landscape totals of every year (RunningAccount)
+    :param climate: optional annual, or annual per-stand, values of phi_s and f_DT replacing those in params
+        (climate.ClimateDrivers)
+    :return: dictionary of landscape-total time-series for each carbon pool, plus 'fires', 'infestations' and
+        'harvests' event series, each of length simulation_length+1 (dict of arrays)
+    """
+
+    runs = int(settings['runs'])
+    start_year = int(settings['start_year'])
+    simulation_length = int(settings['simulation_length'])
+    infest_start = settings['infest_start']
+    infest_end = settings['infest_end']
+    fire_frequency = settings['fire_frequency']
+    infest_risk = settings['infest_probability'] / (infest_end - infest_start)
+    check_stand_params(params, runs)
+    if climate is not None:
+        climate.check(start_year, simulation_length, runs)
+
+    age, current = initial_stands(states, runs)
+
+    totals = dict((pool, np.zeros(simulation_length+1)) for pool in pools)
+    for pool, values in zip(pools, current):
+        totals[pool][0] = values.sum()
+    fires = np.zeros(simulation_length+1)
+    infestations = np.zeros(simulation_length+1)
+    harvests = np.zeros(simulation_length+1)
+    if account is not None:
+        account.start(np.sum([totals[pool][0] for pool in pools]))
+
+    for j in range(simulation_length):
+        year = start_year + j
+        infest_draw, fire_draw = stand_draws(runs, rng, sampling)
+
+        # stochastic event masks; fire risk scales with surface fuel loads as in dynamics.land()
+        if infest_start <= year <= infest_end:
+            infested = infest_draw <= infest_risk
+        else:
+            infested = np.zeros(runs, dtype=bool)
+        fire_risk = (1.0/fire_frequency) * ((current[3] + (current[4] * 1.1))/20)
+        burned = ~infested & (fire_draw <= fire_risk)
+        grown = ~(infested | burned)
+
+        year_params = params if climate is None else climate.year_params(params, year)
+        grown_pools = three_PG_step(age, year_params, *current)
+        burned_pools = fire_step(params, *current)
+        infested_pools, removed = infestation_step(params, harvest, *current)
+        current = [np.where(infested, i, np.where(burned, b, g))
+                   for g, b, i in zip(grown_pools, burned_pools, infested_pools)]
+
+        # stand age resets on disturbance, and only advances in non-infestation years
+        age = np.where(grown, age + 1, np.where(burned, 1, 0))
+
+        fires[j] = burned.sum()
+        infestations[j] = infested.sum()
+        harvests[j] = -removed[infested].sum()
+        for pool, values in zip(pools, current):
+            totals[pool][j+1] = values.sum()
+        if account is not None:
+            account.update(np.sum([totals[pool][j+1] for pool in pools]), harvests[j])
+
+    totals['fires'] = fires
+    totals['infestations'] = infestations
+    totals['harvests'] = harvests
+    return totals
+
+
+def merge_cohorts(counts, age, current, decimals=None):
+    """ Merges cohorts with identical age and carbon pools into single cohorts with combined stand counts.  When
+    decimals is given, pools are compared after rounding and the merged cohort takes the count-weighted mean pools, so
+    that total landscape carbon is conserved.
+
+    :param counts: number of stands in each cohort (array of int)
+    :param age: cohort stand ages (array of float)
+    :param current: cohort carbon pools in the order of the pools list (list of arrays of float)
+    :param decimals: number of decimal places to which pools must agree for cohorts to merge (int)
+    :return: merged counts (array of int); merged ages (array of float); merged pools (list of arrays of float)
+    """
+
+    keys = np.column_stack([age] + current)
+    if decimals is not None:
+        keys = np.round(keys, decimals)
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    merged_counts = np.bincount(inverse, weights=counts)
+    merged_current = [np.bincount(inverse, weights=counts * values) / merged_counts for values in current]
+    return merged_counts.astype(np.int64), unique_keys[:, 0], merged_current
+
+
+def simulate_cohort_scenario(params, states, settings, harvest, rng, decimals=None, account=None, climate=None):
+    """ Cohort-compressed equivalent of simulate_scenario().  Stands sharing an identical state are stored once as a
+    cohort with a multiplicity count; each year the number of stands in each cohort hit by infestation and fire is
+    drawn from binomial distributions, splitting the cohort into at most three child cohorts (grown, burned and
+    infested), and identical child cohorts are merged again.  This is statistically equivalent to simulating every
+    stand with independent draws, while memory and compute scale with the number of distinct stand histories rather
+    than the number of stands.
+
+    :param decimals: optional merge tolerance passed to merge_cohorts() (int)
+    :param account: optional running carbon account, as in simulate_scenario() (RunningAccount)
+    :param climate: optional annual values of phi_s and f_DT replacing those in params; per-stand values are not
+        available, since cohorts pool stands (climate.ClimateDrivers)
+    :return: as simulate_scenario(), with an additional 'cohorts' time-series of the number of distinct cohorts
+        (dict of arrays)
+    """
+
+    runs = int(settings['runs'])
+    start_year = int(settings['start_year'])
+    simulation_length = int(settings['simulation_length'])
+    infest_start = settings['infest_start']
+    infest_end = settings['infest_end']
+    fire_frequency = settings['fire_frequency']
+    infest_risk = settings['infest_probability'] / (infest_end - infest_start)
+    if check_stand_params(params, runs):
+        raise ValueError("Per-stand parameters are not available with the cohort engine")
+    if climate is not None:
+        climate.check(start_year, simulation_length, runs)
+        if climate.stands is not None:
+            raise ValueError("Per-stand climate drivers are not available with the cohort engine")
+
+    age, current = initial_stands(states, runs)
+    counts, age, current = merge_cohorts(np.ones(runs, dtype=np.int64), age, current, decimals=decimals)
+
+    totals = dict((pool, np.zeros(simulation_length+1)) for pool in pools)
+    for pool, values in zip(pools, current):
+        totals[pool][0] = np.dot(counts, values)
+    fires = np.zeros(simulation_length+1)
+    infestations = np.zeros(simulation_length+1)
+    harvests = np.zeros(simulation_length+1)
+    cohorts = np.zeros(simulation_length+1)
+    cohorts[0] = len(counts)
+    if account is not None:
+        account.start(np.sum([totals[pool][0] for pool in pools]))
+
+    for j in range(simulation_length):
+        year = start_year + j
+
+        # split each cohort by binomial draws of infested stands, then burned stands among those not infested
+        if infest_start <= year <= infest_end:
+            n_infested = rng.binomial(counts, min(infest_risk, 1.0))
+        else:
+            n_infested = np.zeros_like(counts)
+        fire_risk = (1.0/fire_frequency) * ((current[3] + (current[4] * 1.1))/20)
+        n_burned = rng.binomial(counts - n_infested, np.clip(fire_risk, 0.0, 1.0))
+        n_grown = counts - n_infested - n_burned
+
+        year_params = params if climate is None else climate.year_params(params, year)
+        grown_pools = three_PG_step(age, year_params, *current)
+        burned_pools = fire_step(params, *current)
+        infested_pools, removed = infestation_step(params, harvest, *current)
+
+        fires[j] = n_burned.sum()
+        infestations[j] = n_infested.sum()
+        harvests[j] = -np.dot(n_infested, removed)
+
+        # assemble the child cohorts, drop empty ones and merge those with identical states
+        counts = np.concatenate([n_grown, n_burned, n_infested])
+        age = np.concatenate([age + 1, np.ones_like(age), np.zeros_like(age)])
+        current = [np.concatenate(children) for children in zip(grown_pools, burned_pools, infested_pools)]
+        occupied = counts > 0
+        counts, age, current = merge_cohorts(counts[occupied], age[occupied], [values[occupied] for values in current],
+                                             decimals=decimals)
+
+        for pool, values in zip(pools, current):
+            totals[pool][j+1] = np.dot(counts, values)
+        if account is not None:
+            account.update(np.sum([totals[pool][j+1] for pool in pools]), harvests[j])
+        cohorts[j+1] = len(counts)
+
+    totals['fires'] = fires
+    totals['infestations'] = infestations
+    totals['harvests'] = harvests
+    totals['cohorts'] = cohorts
+    return totals
+
+
+class RunningAccount(object):
+    """ Running carbon account of one scenario, updated with the landscape carbon total and harvest of each year as the
+    simulation produces them.  The CO2 flux implied by each year's change in landscape carbon is added to a BernBurden,
+    so the forcing can be evaluated at the end of the run without the time-series that carbon_accounting() convolves.
+    """
+
+    def __init__(self):
+        self.total = 0.0   # MgC, current landscape carbon
+        self.removals = 0.0   # MgC, cumulative harvest, negative as in the 'harvests' series
+        self.years = 0
+        self.burden = BernBurden()
+
+    def start(self, total):
+        """ Records the initial landscape carbon total, MgC (float), contributing a zero flux for the initial year as
+        ediff1d(..., to_begin=0) does in carbon_accounting(). """
+
+        self.total = total
+        self.burden.add(0.0)
+
+    def update(self, total, harvest):
+        """ Records the landscape carbon total, MgC (float), and harvest, MgC (float), at the end of one year. """
+
+        self.burden.add(-3.67 * (total - self.total))
+        self.total = total
+        self.removals += harvest
+        self.years += 1
+
+
+def streaming_accounting(accounts, basis=100):
+    """ Scalar counterpart of carbon_accounting(), computed from the running accounts of the unharvested and harvested
+    scenarios.  Because forcing is linear in the flux series, the forcing of the difference between the scenarios is
+    the difference of their separately accumulated forcings.
+
+    :param accounts: unharvested and harvested scenario accounts (list of RunningAccount)
+    :param basis: GWPbio time horizon, years (int)
+    :return: dictionary of final landscape analysis results (dict of float)
+    """
+
+    unharvested, harvested = accounts
+    simulated_forcing = harvested.burden.cumulative_forcing(basis) - unharvested.burden.cumulative_forcing(basis)
+    CO2_reference_forcing = reference_forcing(basis)
+    biogenic_CO2eq = simulated_forcing / CO2_reference_forcing
+
+    return {'final_deficit': harvested.total - unharvested.total,
+            'total_harvest': harvested.removals,
+            'simulated_forcing': simulated_forcing,
+            'reference_forcing': CO2_reference_forcing,
+            'biogenic_CO2eq': biogenic_CO2eq,
+            'biogenic_impact_ratio': biogenic_CO2eq / (harvested.removals * -3.67)}
+
+
+def carbon_accounting(scenarios, settings, basis=100):
+    """ Computes the landscape carbon deficit, radiative forcing and biogenic impact ratio from the unharvested and
+    harvested scenario time-series, as done at the end of dynamics.land().
+
+    :param scenarios: unharvested and harvested scenario results in the simulate_scenario() structure (list of dict)
+    :param settings: landscape time and disturbance settings in the landscape_settings structure (dict)
+    :param basis: GWPbio time horizon, years (int)
+    :return: dictionary of landscape analysis results (dict)
+    """
+
+    landscape_totals = [np.sum([scenario[pool] for pool in pools], axis=0) for scenario in scenarios]
+    harvests = scenarios[1]['harvests']
+
+    start_year = int(settings['start_year'])
+    plot_years = np.arange(start_year, start_year + int(settings['simulation_length']) + 1)
+    nee_difference = np.ediff1d(landscape_totals[1], to_begin=0) - np.ediff1d(landscape_totals[0], to_begin=0)
+    relative_co2_fluxes = -3.67 * nee_difference
+    simulated_forcing = forcing_operator(len(relative_co2_fluxes), basis).forcing(relative_co2_fluxes)
+    CO2_reference_forcing = reference_forcing(basis)
+    biogenic_CO2eq = simulated_forcing / CO2_reference_forcing
+
+    return {'plot_years': plot_years,
+            'scenarios': scenarios,
+            'landscape_totals': landscape_totals,
+            'cumulative_deficit': landscape_totals[1] - landscape_totals[0],
+            'cumulative_harvest': np.cumsum(harvests),
+            'nee_difference': nee_difference,
+            'simulated_forcing': simulated_forcing,
+            'reference_forcing': CO2_reference_forcing,
+            'biogenic_CO2eq': biogenic_CO2eq,
+            'biogenic_impact_ratio': biogenic_CO2eq / (np.sum(harvests) * -3.67)}
+
+
+def landscape_analysis(params, states, settings=None, seed=None, basis=100, cohorts=False, merge_decimals=None,
+                       sampling='independent', backend='numpy', streaming=False, climate=None):
+    """ Vectorized equivalent of the carbon accounting in dynamics.land(), simulating the unharvested and harvested
+    scenarios and computing the landscape carbon deficit, radiative forcing and biogenic impact ratio without plotting
+    or printing.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param settings: landscape settings overriding those in landscape_settings (dict)
+    :param seed: random number generator seed (int)
+    :param basis: GWPbio time horizon, years (int)
+    :param cohorts: use the cohort-compressed engine, suited to landscapes of very many stands (bool)
+    :param merge_decimals: optional cohort merge tolerance passed to merge_cohorts() (int)
+    :param sampling: one of the sampling_modes for the stand-by-stand engine (str)
+    :param backend: 'numpy', or 'jit' for the compiled stand-by-stand engine in kernels.py, which falls back to
+        'numpy' when Numba is not installed (str)
+    :param streaming: account for carbon year by year while the scenarios run, and return only the final results of
+        streaming_accounting() (bool)
+    :param climate: optional time-varying phi_s and f_DT, e.g. from climate.load_climate_drivers(); the 'jit' backend
+        falls back to 'numpy' when drivers are given (climate.ClimateDrivers)
+    :return: dictionary of landscape analysis results (dict)
+    """
+
+    run_settings = dict(landscape_settings)
+    if settings:
+        run_settings.update(settings)
+    rng = np.random.RandomState(seed)
+    if sampling not in sampling_modes:
+        raise ValueError("Unknown sampling mode '%s'" % sampling)
+    if cohorts and sampling != 'independent':
+        raise ValueError("Sampling mode '%s' is not available with the cohort engine" % sampling)
+    if backend == 'jit':
+        from kernels import simulate_scenario_jit as engine
+    elif backend == 'numpy':
+        engine = simulate_scenario
+    else:
+        raise ValueError("Unknown backend '%s'" % backend)
+
+    if streaming:
+        accounts = [RunningAccount(), RunningAccount()]
+    else:
+        accounts = [None, None]
+
+    if sampling != 'independent':
+        # common random numbers: both scenarios replay identically-seeded streams, so year-by-year draws coincide
+        stream_seed = rng.randint(2**31)
+        scenarios = [engine(params, states, run_settings, harvest, np.random.RandomState(stream_seed),
+                            sampling=sampling, account=account, climate=climate)
+                     for harvest, account in zip((False, True), accounts)]
+    elif cohorts:
+        scenarios = [simulate_cohort_scenario(params, states, run_settings, harvest, rng, decimals=merge_decimals,
+                                              account=account, climate=climate)
+                     for harvest, account in zip((False, True), accounts)]
+    else:
+        scenarios = [engine(params, states, run_settings, harvest, rng, account=account, climate=climate)
+                     for harvest, account in zip((False, True), accounts)]
+    if streaming:
+        return streaming_accounting(accounts, basis)
+    return carbon_accounting(scenarios, run_settings, basis)
+
+
+def variance_reduction(params, states, iterations=20, sampling='common', settings=None, seed=0):
+    """ Estimates the variance reduction achieved by a sampling mode, by repeating the landscape analysis with both
+    independent draws and the chosen mode and comparing the variance of the final carbon deficit and biogenic impact
+    ratio across iterations.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param iterations: number of landscape analyses per sampling mode (int)
+    :param sampling: one of the sampling_modes to compare against independent draws (str)
+    :param settings: landscape settings overriding those in landscape_settings (dict)
+    :param seed: base random number generator seed (int)
+    :return: dictionary of variance reduction factors (independent variance / sampling mode variance) keyed by output
+        (dict of float)
+    """
+
+    outputs = {}
+    for mode in ('independent', sampling):
+        deficits = []
+        ratios = []
+        for i in range(iterations):
+            print '\r   Sampling mode %s: landscape analysis %i/%i' % (mode, i+1, iterations),
+            results = landscape_analysis(params, states, settings=settings, seed=seed+i, sampling=mode, streaming=True)
+            deficits.append(results['final_deficit'])
+            ratios.append(results['biogenic_impact_ratio'])
+        print
+        outputs[mode] = (np.var(deficits, ddof=1), np.var(ratios, ddof=1))
+
+    reduction = {'final_deficit': outputs['independent'][0] / outputs[sampling][0],
+                 'biogenic_impact_ratio': outputs['independent'][1] / outputs[sampling][1]}
+    print "Variance reduction with '%s' sampling over %i iterations:" % (sampling, iterations)
+    for key in ('final_deficit', 'biogenic_impact_ratio'):
+        print "   %s:  %.1fx fewer iterations needed for the same confidence" % (key, reduction[key])
+    return reduction
@@ -0,0 +1,177 @@
+""" This module provides a deterministic expected-value version of the landscape analysis in landscape.py.  Rather than
+sampling stochastic disturbances stand by stand, the stand state is discretized into age classes and surface fuel load
+bins (the fuel load w_l + 1.1*w_c being what drives fire risk), and the probability distribution of the landscape over
+those discrete states is propagated year by year with a sparse transition operator covering growth, fire, infestation
+and harvest.  Each discrete state also carries the expected carbon pools of the stands occupying it, so the result is
+the mean landscape carbon and deficit trajectory without sampling noise, useful as a cross-check on the Monte-Carlo
+engines.  Aggregating stands within a fuel bin is an approximation; finer bins trade speed for accuracy.
+"""
+
+import numpy as np
+from scipy import sparse
+from landscape import pools, landscape_settings, initial_stands, three_PG_step, fire_step, infestation_step, \
+    carbon_accounting
+
+
+# default upper edges of the surface fuel load bins, Mg/ha; loads beyond the last edge share the final bin
+fuel_bin_edges = np.arange(1.0, 100.0, 1.0)
+
+
+def state_index(age, fuel, n_ages, fuel_bins):
+    """ Maps stand ages and surface fuel loads to discrete state indices; ages beyond the last age class share it.
+
+    :param age: stand ages (array of float)
+    :param fuel: surface fuel loads w_l + 1.1*w_c, Mg/ha (array of float)
+    :param n_ages: number of age classes (int)
+    :param fuel_bins: upper edges of the surface fuel load bins, Mg/ha (array of float)
+    :return: state indices (array of int)
+    """
+
+    age_class = np.minimum(age, n_ages - 1).astype(np.int64)
+    return age_class * (len(fuel_bins) + 1) + np.digitize(fuel, fuel_bins)
+
+
+def initial_mass(states, n_ages, fuel_bins, weights=None):
+    """ Builds the initial state distribution from an initial state variable dictionary, whose values may be scalars
+    (a landscape of identical stands) or per-stand arrays (e.g. from spinup.equilibrium_states()).
+
+    :param weights: optional relative weight of each stand, defaulting to equal weights (array of float)
+    :return: array of shape (states, 1 + pools) holding the probability and probability-weighted carbon pools of each
+        discrete state (array of float)
+    """
+
+    n_stands = max(np.size(states[pool][0]) for pool in ['age'] + pools)
+    age, current = initial_stands(states, n_stands)
+    if weights is None:
+        weights = np.ones(n_stands)
+    weights = weights / float(np.sum(weights))
+    index = state_index(age, current[3] + current[4] * 1.1, n_ages, fuel_bins)
+    n_states = n_ages * (len(fuel_bins) + 1)
+    mass = np.zeros((n_states, len(pools) + 1))
+    mass[:, 0] = np.bincount(index, weights=weights, minlength=n_states)
+    for k, values in enumerate(current):
+        mass[:, k+1] = np.bincount(index, weights=weights * values, minlength=n_states)
+    return mass
+
+
+def markov_step(mass, params, n_ages, fuel_bins, infest_risk, fire_frequency, harvest, fuel_driven=True):
+    """ Advances the state distribution by one year.  Every occupied (age class, fuel bin) state has three outgoing
+    transitions (growth, fire and infestation), and probability and expected carbon are moved along them with a single
+    sparse operator product.
+
+    :param mass: state distribution in the initial_mass() structure (array of float)
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param n_ages: number of age classes (int)
+    :param fuel_bins: upper edges of the surface fuel load bins, Mg/ha (array of float)
+    :param infest_risk: annual infestation probability of every stand (float)
+    :param fire_frequency: years to a stand-replacing fire at the reference fuel load (float)
+    :param harvest: whether infested stands are salvage-harvested (bool)
+    :param fuel_driven: scale fire risk with surface fuel load as in dynamics.land(), rather than applying the constant
+        hazard 1/fire_frequency (bool)
+    :return: updated state distribution (array of float); expected fraction of stands burned (float); expected
+        fraction of stands infested (float); expected harvested stem carbon per stand, Mg/ha (float)
+    """
+
+    n_bins = len(fuel_bins) + 1
+    occupied = np.nonzero(mass[:, 0] > 0)[0]
+    p = mass[occupied, 0]
+    current = [mass[occupied, k+1] / p for k in range(len(pools))]
+    age = occupied // n_bins
+
+    # transition probabilities out of each occupied state
+    p_infest = np.full(len(p), infest_risk)
+    if fuel_driven:
+        fire_risk = (1.0/fire_frequency) * ((current[3] + (current[4] * 1.1))/20)
+    else:
+        fire_risk = np.full(len(p), 1.0/fire_frequency)
+    p_fire = (1 - p_infest) * np.clip(fire_risk, 0.0, 1.0)
+    p_grow = 1 - p_infest - p_fire
+
+    grown_pools = np.column_stack(three_PG_step(age, params, *current))
+    burned_pools = np.column_stack(fire_step(params, *current))
+    infested_pools, removed = infestation_step(params, harvest, *current)
+    infested_pools = np.column_stack(infested_pools)
+
+    # destination states of every transition, and the probability mass carried along each
+    outcome_pools = np.vstack([grown_pools, burned_pools, infested_pools])
+    outcome_ages = np.concatenate([age + 1, np.ones(len(p)), np.zeros(len(p))])
+    destinations = state_index(outcome_ages, outcome_pools[:, 3] + outcome_pools[:, 4] * 1.1, n_ages, fuel_bins)
+    transition_mass = np.concatenate([p_grow, p_fire, p_infest]) * np.tile(p, 3)
+
+    # sparse operator summing the mass and expected carbon of all transitions arriving at each state
+    operator = sparse.csr_matrix((np.ones(len(destinations)), (destinations, np.arange(len(destinations)))),
+                                 shape=(mass.shape[0], len(destinations)))
+    new_mass = operator.dot(np.column_stack([transition_mass, transition_mass[:, None] * outcome_pools]))
+
+    return new_mass, np.sum(p * p_fire), np.sum(p * p_infest), np.sum(p * p_infest * removed)
+
+
+def expected_scenario(params, states, settings, harvest, fuel_bins=fuel_bin_edges):
+    """ Propagates the expected landscape state distribution under either the unharvested or harvested beetle
+    infestation scenario.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param settings: landscape time and disturbance settings in the landscape_settings structure (dict)
+    :param harvest: whether infested stands are salvage-harvested (bool)
+    :param fuel_bins: upper edges of the surface fuel load bins, Mg/ha (array of float)
+    :return: dictionary of expected landscape-total time-series in the simulate_scenario() structure (dict of arrays)
+    """
+
+    runs = int(settings['runs'])
+    start_year = int(settings['start_year'])
+    simulation_length = int(settings['simulation_length'])
+    infest_start = settings['infest_start']
+    infest_end = settings['infest_end']
+    infest_risk = min(settings['infest_probability'] / (infest_end - infest_start), 1.0)
+
+    # with enough age classes to hold the oldest initial stand through the whole simulation, age classes are exact
+    # and only fuel loads are binned
+    n_ages = int(np.max(states['age'][0])) + simulation_length + 1
+    mass = initial_mass(states, n_ages, fuel_bins)
+
+    totals = dict((pool, np.zeros(simulation_length+1)) for pool in pools)
+    for k, pool in enumerate(pools):
+        totals[pool][0] = runs * np.sum(mass[:, k+1])
+    fires = np.zeros(simulation_length+1)
+    infestations = np.zeros(simulation_length+1)
+    harvests = np.zeros(simulation_length+1)
+
+    for j in range(simulation_length):
+        year = start_year + j
+        if infest_start <= year <= infest_end:
+            year_infest_risk = infest_risk
+        else:
+            year_infest_risk = 0.0
+        mass, burned, infested, removed = markov_step(mass, params, n_ages, fuel_bins, year_infest_risk,
+                                                      settings['fire_frequency'], harvest)
+        fires[j] = runs * burned
+        infestations[j] = runs * infested
+        harvests[j] = -runs * removed
+        for k, pool in enumerate(pools):
+            totals[pool][j+1] = runs * np.sum(mass[:, k+1])
+
+    totals['fires'] = fires
+    totals['infestations'] = infestations
+    totals['harvests'] = harvests
+    return totals
+
+
+def expected_landscape_analysis(params, states, settings=None, basis=100, fuel_bins=fuel_bin_edges):
+    """ Expected-value counterpart of landscape.landscape_analysis(), returning the same results structure.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param settings: landscape settings overriding those in landscape_settings (dict)
+    :param basis: GWPbio time horizon, years (int)
+    :param fuel_bins: upper edges of the surface fuel load bins, Mg/ha (array of float)
+    :return: dictionary of landscape analysis results (dict)
+    """
+
+    run_settings = dict(landscape_settings)
+    if settings:
+        run_settings.update(settings)
+
+    scenarios = [expected_scenario(params, states, run_settings, harvest, fuel_bins=fuel_bins)
+                 for harvest in (False, True)]
+    return carbon_accounting(scenarios, run_settings, basis)
@@ -0,0 +1,186 @@
+""" This module performs the quality control checks of the FVS analysis on the working SQLite database written by
+FVS.upload_convert_filter_process(), as a machine-readable report rather than printed query results.  Stand counts,
+time points, species inventories and simulation start and end years are gathered in a single grouped scan of each of
+the Control and RX Stand & Stock tables, and initial mortality, initial basal area agreement and end-of-simulation aspen
+dominance from one query each on the much smaller derived tables.  The per-stand results are written to a .csv file, and
+the summary, per-stand results and pass/fail outcome of each check against configurable thresholds to a .json file, so
+that reports can be compared between runs and batch scenario runs can stop on bad input.
+"""
+
+import csv
+import json
+import sqlite3
+
+
+# default quality control thresholds
+qc_thresholds = {'min_stands': 1,   # minimum number of stands in each case
+                 'max_stand_count_difference': 0,   # maximum difference between Control and RX stand counts
+                 'min_time_points': 2,   # minimum number of time points of every stand
+                 'max_time_point_spread': 0,   # maximum difference in the number of time points between stands
+                 'max_initial_mortality': 1.0,   # maximum initial mortality of any stand, fraction of BA
+                 'max_initial_BA_difference': 0.01,   # maximum Control vs. RX initial live BA difference, m2/ha
+                 'aspen_share': 0.0001,   # end-of-simulation aspen BA share above which a stand counts as aspen
+                 'max_aspen_stand_fraction': 1.0   # maximum fraction of stands becoming aspen in either case
+                 }
+
+# columns of the per-stand quality control table
+qc_stand_columns = ['StandID', 'Control_time_points', 'RX_time_points', 'Control_species', 'RX_species',
+                    'Start_year', 'End_year', 'Initial_mortality', 'Control_initial_BA', 'RX_initial_BA',
+                    'Control_end_AS_share', 'RX_end_AS_share']
+
+
+def stand_stock_scan(cur, table):
+    """ Gathers the number of time points, species, and the first and last simulation years of every stand, and the
+    species inventory of the whole case, in a single grouped scan of a Stand & Stock table.
+
+    :param cur: cursor object within an open connection to the working database
+    :param table: name of the Stand & Stock table (str)
+    :return: dictionary of per-stand [time points, species count, start year, end year] (dict of lists); sorted
+        species inventory (list of str)
+    """
+
+    cur.execute(""" SELECT StandID, COUNT(DISTINCT Year), COUNT(DISTINCT CASE WHEN Species!='ALL' THEN Species END),
+                           MIN(Year), MAX(Year), GROUP_CONCAT(DISTINCT CASE WHEN Species!='ALL' THEN Species END)
+                    FROM %s
+                    GROUP BY StandID """ % table)
+    stands = {}
+    species = set()
+    for stand_id, time_points, species_count, start_year, end_year, stand_species in cur:
+        stands[str(stand_id)] = [time_points, species_count, start_year, end_year]
+        if stand_species:
+            species.update(str(name) for name in stand_species.split(','))
+    return stands, sorted(species)
+
+
+def check(name, value, threshold, passed):
+    """ Records the outcome of one quality control check.
+
+    :return: dictionary of 'check', 'value', 'threshold' and 'passed' (dict)
+    """
+
+    return {'check': name, 'value': value, 'threshold': threshold, 'passed': bool(passed)}
+
+
+def qc_report(db_fpath, thresholds=None):
+    """ Computes the quality control summary, per-stand results and threshold checks of a working database.
+
+    :param db_fpath: full path to the working SQLite database (str)
+    :param thresholds: thresholds overriding those in qc_thresholds (dict)
+    :return: dictionary of 'database', 'summary', 'stands' (rows in the order of qc_stand_columns), 'checks' and
+        'passed' (dict)
+    """
+
+    limits = dict(qc_thresholds)
+    if thresholds:
+        limits.update(thresholds)
+
+    con = sqlite3.connect(db_fpath)
+    with con:
+        cur = con.cursor()
+        control, control_species = stand_stock_scan(cur, 'Control_StandStock')
+        rx, rx_species = stand_stock_scan(cur, 'RX_StandStock')
+
+        cur.execute("SELECT StandID, InitialMortality FROM RX_StandMortality")
+        mortality = dict((str(stand_id), value) for stand_id, value in cur)
+
+        cur.execute(""" SELECT y.StandID, c.Tot_BA, r.Tot_BA
+                        FROM RX_StartEndYear y
+                        LEFT JOIN Control_SpeciesBA c ON c.StandID=y.StandID AND c.Year=y.StartYear
+                        LEFT JOIN RX_SpeciesBA r ON r.StandID=y.StandID AND r.Year=y.StartYear """)
+        initial_BA = dict((str(row[0]), row[1:]) for row in cur)
+
+        cur.execute(""" SELECT y.StandID, c.AS_share, r.AS_share
+                        FROM RX_StartEndYear y
+                        LEFT JOIN Control_StandComposition c ON c.StandID=y.StandID AND c.Year=y.EndYear
+                        LEFT JOIN RX_StandComposition r ON r.StandID=y.StandID AND r.Year=y.EndYear """)
+        end_aspen = dict((str(row[0]), row[1:]) for row in cur)
+    con.close()
+
+    stands = []
+    for stand_id in sorted(set(control) | set(rx)):
+        control_stand = control.get(stand_id, [None] * 4)
+        rx_stand = rx.get(stand_id, [None] * 4)
+        stands.append([stand_id, control_stand[0], rx_stand[0], control_stand[1], rx_stand[1], rx_stand[2],
+                       rx_stand[3], mortality.get(stand_id)] + list(initial_BA.get(stand_id, (None, None))) +
+                      list(end_aspen.get(stand_id, (None, None))))
+
+    # threshold checks
+    time_points = [n for case in (control, rx) for n, species_count, start, end in case.values()]
+    BA_differences = [abs(c - r) for c, r in initial_BA.values() if c is not None and r is not None]
+    mortalities = [value for value in mortality.values() if value is not None]
+    checks = [check('Control_stands', len(control), limits['min_stands'], len(control) >= limits['min_stands']),
+              check('RX_stands', len(rx), limits['min_stands'], len(rx) >= limits['min_stands']),
+              check('stand_count_difference', abs(len(control) - len(rx)), limits['max_stand_count_difference'],
+                    abs(len(control) - len(rx)) <= limits['max_stand_count_difference']),
+              check('unmatched_stands', len(set(control) ^ set(rx)), 0, set(control) == set(rx))]
+    if time_points:
+        checks += [check('min_time_points', min(time_points), limits['min_time_points'],
+                         min(time_points) >= limits['min_time_points']),
+                   check('time_point_spread', max(time_points) - min(time_points), limits['max_time_point_spread'],
+                         max(time_points) - min(time_points) <= limits['max_time_point_spread'])]
+    checks += [check('max_initial_mortality', max(mortalities or [0.0]), limits['max_initial_mortality'],
+                     max(mortalities or [0.0]) <= limits['max_initial_mortality']),
+               check('missing_initial_mortality', len(mortality) - len(mortalities), 0,
+                     len(mortality) == len(mortalities)),
+               check('max_initial_BA_difference', max(BA_differences or [0.0]), limits['max_initial_BA_difference'],
+                     max(BA_differences or [0.0]) <= limits['max_initial_BA_difference']),
+               check('missing_initial_BA', len(initial_BA) - len(BA_differences), 0,
+                     len(initial_BA) == len(BA_differences))]
+    for c, case in enumerate(['Control', 'RX']):
+        aspen_stands = [stand_id for stand_id in end_aspen
+                        if end_aspen[stand_id][c] is not None and end_aspen[stand_id][c] > limits['aspen_share']]
+        fraction = len(aspen_stands) / float(max(len(end_aspen), 1))
+        checks.append(check('%s_aspen_stand_fraction' % case, fraction, limits['max_aspen_stand_fraction'],
+                            fraction <= limits['max_aspen_stand_fraction']))
+
+    summary = {'Control_stands': len(control),
+               'RX_stands': len(rx),
+               'Control_species': control_species,
+               'RX_species': rx_species,
+               'start_years': sorted(set(stand[2] for stand in rx.values())),
+               'end_years': sorted(set(stand[3] for stand in rx.values()))}
+    return {'database': db_fpath,
+            'summary': summary,
+            'stands': stands,
+            'checks': checks,
+            'passed': all(outcome['passed'] for outcome in checks)}
+
+
+def write_qc_report(report, fpath_prefix):
+    """ Writes a quality control report to <fpath_prefix>.json, and its per-stand results to <fpath_prefix>.csv.
+
+    :param report: report from qc_report() (dict)
+    :param fpath_prefix: full path of the report files, without extension (str)
+    :return:
+    """
+
+    json_file = open(fpath_prefix + '.json', "w")
+    json.dump(dict(report, stand_columns=qc_stand_columns), json_file, indent=1, sort_keys=True)
+    json_file.close()
+
+    file_obj = open(fpath_prefix + '.csv', "wb")
+    c = csv.writer(file_obj)
+    c.writerow(qc_stand_columns)
+    for row in report['stands']:
+        c.writerow(row)
+    file_obj.close()
+
+
+def print_qc_report(report):
+    """ Prints the summary and the outcome of every check of a quality control report.
+
+    :param report: report from qc_report() (dict)
+    :return:
+    """
+
+    summary = report['summary']
+    print "The Control data contains records for %i distinct stands" % summary['Control_stands']
+    print "The RX data contains records for %i distinct stands" % summary['RX_stands']
+    print "The Control data includes the following species: %s" % ', '.join(summary['Control_species'])
+    print "The RX data includes the following species: %s" % ', '.join(summary['RX_species'])
+    print "RX simulation starting years: %s; ending years: %s" % (summary['start_years'], summary['end_years'])
+    print
+    for outcome in report['checks']:
+        print "%s\t%s\t%s (threshold %s)" % ('PASS' if outcome['passed'] else 'FAIL', outcome['check'],
+                                              outcome['value'], outcome['threshold'])
+    print
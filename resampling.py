@@ -0,0 +1,209 @@
+""" This module provides resampling-based inference for the stand-level determinant regressions in determinants.py, as
+a robust alternative to the asymptotic p-values of ordinary least squares over a few hundred stands.  Bootstrap
+replicates resample stands with replacement, giving percentile confidence intervals and standard errors for every
+coefficient; permutation replicates give empirical p-values for the t statistic of every slope under the null hypothesis
+of no association.  The permutation scheme depends on the model:
+    * univariate slopes: the responses are shuffled relative to the regressor, which is exact for a single regressor
+    * multiple regression slopes: the Freedman-Lane scheme, in which the residuals of the reduced model leaving out the
+      tested regressor are shuffled and added back to its fitted values, so that the other (correlated) regressors keep
+      their association with the response under the null hypothesis
+Each batch of replicates is one stack of index arrays solved as a single batched least-squares problem, and batches are
+spread across a multiprocessing pool.
+"""
+
+import csv
+import multiprocessing
+import numpy as np
+from determinants import design_matrix, multiple_ols, response_groups, univariate_ols
+
+
+# columns of the resampling table
+resampling_columns = ['Scenario', 'Response', 'Model', 'Term', 'Estimate', 'CI_low', 'CI_high', 'Bootstrap_SE',
+                      'Permutation_p', 'n']
+
+
+def regression_statistics(X, Y):
+    """ Fits the univariate and multiple determinant regressions, returning the coefficients and their t statistics in
+    a common layout.  X and Y may carry the same leading batch dimensions, or Y alone may carry them.
+
+    :param X: design matrix of shape (..., stands, regressors) (array of float)
+    :param Y: response matrix of shape (..., stands, responses) (array of float)
+    :return: univariate coefficients of shape (..., 2, regressors, responses), intercept first (array of float); their t
+        statistics (array of float); multiple regression coefficients of shape (..., 1 + regressors, responses),
+        intercept first (array of float); their t statistics (array of float)
+    """
+
+    if X.ndim < Y.ndim:
+        X = np.broadcast_to(X, Y.shape[:-2] + X.shape[-2:])
+    univariate = univariate_ols(X, Y)
+    multiple = multiple_ols(X, Y)
+    univariate_estimates = np.stack([univariate['intercept'], univariate['slope']], axis=-3)
+    univariate_t = np.stack([univariate['intercept'] / univariate['intercept_se'], univariate['t_value']], axis=-3)
+    return univariate_estimates, univariate_t, multiple['coefficients'], multiple['t_value']
+
+
+def freedman_lane_t(X, Y, index):
+    """ Computes the multiple regression t statistic of every regressor under Freedman-Lane permutation: for regressor
+    j, the residuals of the reduced model on all other regressors are permuted, added back to the reduced model's
+    fitted values, and the full model is refitted to these responses.
+
+    :param X: design matrix of shape (stands, regressors) (array of float)
+    :param Y: response matrix of shape (stands, responses) (array of float)
+    :param index: permutations of the stands, of shape (replicates, stands) (array of int)
+    :return: t statistics of shape (replicates, 1 + regressors, responses), in the multiple_ols() layout with the
+        intercept, which has no permutation test, left as NaN (array of float)
+    """
+
+    replicates = index.shape[0]
+    X_replicates = np.broadcast_to(X, (replicates,) + X.shape)
+    t_value = np.full((replicates, 1 + X.shape[1], Y.shape[1]), np.nan)
+    for j in range(X.shape[1]):
+        X_reduced = np.delete(X, j, axis=1)
+        coefficients = multiple_ols(X_reduced, Y)['coefficients']
+        fitted = coefficients[0] + np.dot(X_reduced, coefficients[1:])
+        Y_replicates = fitted + (Y - fitted)[index]
+        t_value[:, j + 1] = multiple_ols(X_replicates, Y_replicates)['t_value'][:, j + 1]
+    return t_value
+
+
+def _resample_batch(arguments):
+    """ Worker routine fitting the regressions to a batch of bootstrap or permutation replicates.  Bootstrap batches
+    return the replicate coefficients.  Permutation batches return the absolute replicate t statistics: of the
+    univariate regressions with the responses permuted, and of the multiple regression with Freedman-Lane permutation
+    (see freedman_lane_t()).
+    """
+
+    X, Y, method, replicates, seed = arguments
+    rng = np.random.RandomState(seed)
+    n = X.shape[0]
+    if method == 'bootstrap':
+        index = rng.randint(0, n, size=(replicates, n))
+        univariate, univariate_t, multiple, multiple_t = regression_statistics(X[index], Y[index])
+        return univariate, multiple
+    index = np.argsort(rng.random_sample((replicates, n)), axis=1)
+    slope_t = univariate_ols(np.broadcast_to(X, (replicates,) + X.shape), Y[index])['t_value']
+    univariate_t = np.stack([np.full_like(slope_t, np.nan), slope_t], axis=-3)   # intercepts are not tested
+    return np.abs(univariate_t), np.abs(freedman_lane_t(X, Y, index))
+
+
+def resample(X, Y, method, replicates, seed=0, processes=None, batch_size=250):
+    """ Fits the regressions to bootstrap or permutation replicates of the data, in batches distributed across a pool
+    of worker processes.  Each batch draws from its own seed, derived from the seed given, so that results do not
+    depend on the number of processes.
+
+    :param X: design matrix of shape (stands, regressors) (array of float)
+    :param Y: response matrix of shape (stands, responses) (array of float)
+    :param method: 'bootstrap' or 'permutation' (str)
+    :param replicates: number of replicates (int)
+    :param seed: random number generator seed (int)
+    :param processes: number of worker processes, defaulting to the number of cores (int)
+    :param batch_size: number of replicates per worker task (int)
+    :return: replicate univariate and multiple regression coefficients (bootstrap) or absolute t statistics
+        (permutation), in the regression_statistics() layout with a leading replicate dimension (arrays of float)
+    """
+
+    batch_seeds = np.random.RandomState(seed).randint(0, 2**31 - 1, size=(replicates + batch_size - 1) // batch_size)
+    batches = [(X, Y, method, min(batch_size, replicates - b * batch_size), batch_seed)
+               for b, batch_seed in enumerate(batch_seeds)]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        univariate = []
+        multiple = []
+        for b, batch_outputs in enumerate(pool.imap(_resample_batch, batches)):
+            print '\r   Fitted %s batch %i/%i' % (method, b+1, len(batches)),
+            univariate.append(batch_outputs[0])
+            multiple.append(batch_outputs[1])
+        print
+    finally:
+        pool.close()
+        pool.join()
+    return np.concatenate(univariate), np.concatenate(multiple)
+
+
+def resampling_table(scenario, X, Y, regressors, responses, bootstraps=2000, permutations=2000, confidence=0.95,
+                     seed=0, processes=None, batch_size=250):
+    """ Tabulates every coefficient of the univariate and multiple determinant regressions with its percentile
+    bootstrap confidence interval, bootstrap standard error and empirical permutation p-value.  Univariate bootstrap
+    replicates that are degenerate (drawing a single value of the regressor) are excluded from the intervals.  The
+    permutation p-values of univariate slopes permute the responses, and those of multiple regression slopes use the
+    Freedman-Lane scheme (see freedman_lane_t()); since neither tests the intercepts, no p-value is given for them.
+
+    :param scenario: scenario name recorded in every row (str)
+    :param X: design matrix of shape (stands, regressors) (array of float)
+    :param Y: response matrix of shape (stands, responses) (array of float)
+    :param regressors: regressor names (list of str)
+    :param responses: response names (list of str)
+    :param bootstraps: number of bootstrap replicates (int)
+    :param permutations: number of permutation replicates (int)
+    :param confidence: confidence interval level (float)
+    :param seed: random number generator seed (int)
+    :param processes: number of worker processes, defaulting to the number of cores (int)
+    :param batch_size: number of replicates per worker task (int)
+    :return: rows of the resampling table, in the order of resampling_columns (list of lists)
+    """
+
+    univariate, univariate_t, multiple, multiple_t = regression_statistics(X, Y)
+    boot_univariate, boot_multiple = resample(X, Y, 'bootstrap', bootstraps, seed=seed, processes=processes,
+                                              batch_size=batch_size)
+    perm_univariate, perm_multiple = resample(X, Y, 'permutation', permutations, seed=seed + 1, processes=processes,
+                                              batch_size=batch_size)
+    tail = 100 * (1 - confidence) / 2
+
+    def summarize(term, estimate, t_value, boot, perm):
+        boot = boot[np.isfinite(boot)]
+        if term == 'Intercept':
+            p_value = ''
+        else:
+            p_value = (1.0 + np.sum(perm >= abs(t_value))) / (1.0 + len(perm))
+        return [estimate, np.percentile(boot, tail), np.percentile(boot, 100 - tail), np.std(boot, ddof=1), p_value]
+
+    n = X.shape[0]
+    terms = ['Intercept'] + list(regressors)
+    rows = []
+    for k, response in enumerate(responses):
+        for j, regressor in enumerate(regressors):
+            for i, term in enumerate(['Intercept', regressor]):
+                rows.append([scenario, response, 'univariate:' + regressor, term] +
+                            summarize(term, univariate[i, j, k], univariate_t[i, j, k], boot_univariate[:, i, j, k],
+                                      perm_univariate[:, i, j, k]) + [n])
+        for t, term in enumerate(terms):
+            rows.append([scenario, response, 'multiple', term] +
+                        summarize(term, multiple[t, k], multiple_t[t, k], boot_multiple[:, t, k],
+                                  perm_multiple[:, t, k]) + [n])
+    return rows
+
+
+def resampling_analysis(db_fpath, scenario, results_fpath=None, bootstraps=2000, permutations=2000, confidence=0.95,
+                        seed=0, processes=None, initial_year=2014, end_year=2100):
+    """ Runs bootstrap and permutation inference on the determinant regressions of one scenario database.
+
+    :param db_fpath: full path to the working SQLite database (str)
+    :param scenario: scenario name recorded in the resampling table (str)
+    :param results_fpath: optional full path to a .csv file receiving the resampling table (str)
+    :param bootstraps: number of bootstrap replicates (int)
+    :param permutations: number of permutation replicates (int)
+    :param confidence: confidence interval level (float)
+    :param seed: random number generator seed (int)
+    :param processes: number of worker processes, defaulting to the number of cores (int)
+    :param initial_year: year of the initial stand conditions (int)
+    :param end_year: year of the productivity responses (int)
+    :return: rows of the resampling table, in the order of resampling_columns (list of lists)
+    """
+
+    rows = []
+    for group in response_groups(db_fpath):
+        stand_ids, X, Y, regressors, responses = design_matrix(db_fpath, initial_year, end_year, responses=group)
+        print "Resampling determinant regressions of %s in scenario '%s' (%i stands)" % \
+              (', '.join(responses), scenario, len(stand_ids))
+        rows += resampling_table(scenario, X, Y, regressors, responses, bootstraps=bootstraps,
+                                 permutations=permutations, confidence=confidence, seed=seed, processes=processes)
+
+    if results_fpath:
+        file_obj = open(results_fpath, "wb")
+        c = csv.writer(file_obj)
+        c.writerow(resampling_columns)
+        for row in rows:
+            c.writerow(row)
+        file_obj.close()
+    return rows
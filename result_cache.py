@@ -0,0 +1,97 @@
+""" This module provides a persistent on-disk cache for simulation results, so that repeating an analysis with unchanged
+inputs (parameters, initial states, settings and random number seed) returns the stored results rather than rerunning
+the simulation.  Results are dictionaries of numpy arrays, stored one per file in compressed .npz format under a hash
+of a description of everything that determines them.  The cache is bounded in size: once its files exceed the limit,
+the least recently used results are deleted.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+
+class ResultCache(object):
+    """ Size-bounded cache of array results in a directory of .npz files, with least recently used eviction.  File
+    modification times record use, so the cache persists across sessions and can be shared by processes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256*1024*1024):
+        """
+        :param cache_dir: directory holding the cached results (str)
+        :param max_bytes: limit on the total size of cached results, bytes (int)
+        """
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, description):
+        """ Computes the cache key of a result, as a hash of a JSON-serializable description of its inputs.
+
+        :param description: inputs determining the result, including a version number of the code producing it (dict)
+        :return: hexadecimal digest (str)
+        """
+
+        return hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def load(self, key):
+        """ Looks up a cached result, marking it as recently used.
+
+        :param key: cache key (str)
+        :return: cached result, or None if there is none (dict of arrays)
+        """
+
+        fpath = self.path(key)
+        try:
+            cached = np.load(fpath)
+            result = dict((name, cached[name]) for name in cached.files)
+            cached.close()
+            os.utime(fpath, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return result
+
+    def store(self, key, result):
+        """ Stores a result, then evicts the least recently used results beyond the size limit.  The result is written
+        to a temporary file and renamed, so readers never see a partially written file.
+
+        :param key: cache key (str)
+        :param result: result to cache (dict of arrays)
+        :return:
+        """
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        temporary_fpath = os.path.join(self.cache_dir, '%s.%i.tmp' % (key, os.getpid()))
+        file_obj = open(temporary_fpath, 'wb')
+        np.savez_compressed(file_obj, **result)
+        file_obj.close()
+        os.rename(temporary_fpath, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """ Deletes the least recently used results until the cache is within its size limit.
+
+        :return:
+        """
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                fpath = os.path.join(self.cache_dir, name)
+                try:
+                    entries.append((os.path.getmtime(fpath), os.path.getsize(fpath), fpath))
+                except OSError:
+                    pass
+        total = sum(size for used, size, fpath in entries)
+        for used, size, fpath in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fpath)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,217 @@
+""" This module performs a variance-based global sensitivity analysis of the landscape carbon deficit and biogenic
+impact ratio with respect to the 3-PG model parameters and the landscape disturbance settings.  Sample matrices are
+generated with the Saltelli (2010) radial scheme, the vectorized landscape model (landscape.py) is evaluated for every
+sample in batches spread across a multiprocessing pool, and first-order (Saltelli 2010) and total-order (Jansen 1999)
+Sobol indices are computed along with bootstrap confidence intervals.  A sample size of N with D factors requires
+N*(D+2) landscape evaluations.
+"""
+
+import copy
+import csv
+import multiprocessing
+import numpy as np
+from landscape import landscape_analysis, landscape_settings
+
+
+# sensitivity factors in structure [str(name), float(lower bound), float(upper bound)]; factors named after a key of
+# the dynamics.params dictionary perturb that 3-PG parameter, all others perturb the landscape disturbance settings
+sobol_factors = [['age_max', 100, 200],
+                 ['n_age', 2, 6],
+                 ['phi_s', 4.5, 6.5],
+                 ['f_DT', 0.4, 0.7],
+                 ['sigma_f', 2.5, 4.0],
+                 ['beers_k', 0.3, 0.6],
+                 ['microbial_efficiency', 0.15, 0.35],
+                 ['fire_frequency', 100, 300],
+                 ['infest_probability', 0.5, 1.0],
+                 ['infest_duration', 5, 20]   # years, infestation window beginning at infest_start
+                 ]
+
+# model outputs for which sensitivity indices are computed
+sobol_outputs = ['final_deficit', 'biogenic_impact_ratio']
+
+
+def saltelli_sample(factors, N, seed=None):
+    """ Generates the Saltelli sample matrix: N rows of base matrix A, N rows of base matrix B, then for each factor i
+    N rows of matrix AB_i (A with column i taken from B).
+
+    :param factors: sensitivity factor definitions in the sobol_factors structure (list)
+    :param N: base sample size (int)
+    :param seed: random number generator seed (int)
+    :return: sample matrix of shape (N*(D+2), D) in factor units (array of float)
+    """
+
+    D = len(factors)
+    rng = np.random.RandomState(seed)
+    base = rng.random_sample((N, 2*D))
+    A = base[:, :D]
+    B = base[:, D:]
+    blocks = [A, B]
+    for i in range(D):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        blocks.append(AB)
+    unit_samples = np.vstack(blocks)
+
+    lower = np.array([factor[1] for factor in factors], dtype=float)
+    upper = np.array([factor[2] for factor in factors], dtype=float)
+    return lower + unit_samples * (upper - lower)
+
+
+def apply_sample(params, settings, factors, row):
+    """ Creates copies of the parameter and landscape settings dictionaries with the factor values of one sample row.
+
+    :return: updated parameter dictionary (dict); updated landscape settings dictionary (dict)
+    """
+
+    sample_params = copy.deepcopy(params)
+    sample_settings = dict(settings)
+    for factor, value in zip(factors, row):
+        name = factor[0]
+        if name in sample_params:
+            sample_params[name][0] = value
+        elif name == 'infest_duration':
+            sample_settings['infest_end'] = sample_settings['infest_start'] + int(round(value))
+        else:
+            sample_settings[name] = value
+    return sample_params, sample_settings
+
+
+def _evaluate_batch(arguments):
+    """ Worker routine evaluating the landscape model for a batch of sample rows.  Every sample is run with the same
+    seed, so that differences between samples reflect the factor values rather than stochastic disturbance draws.
+    """
+
+    params, states, settings, factors, rows, seed = arguments
+    outputs = np.zeros((len(rows), len(sobol_outputs)))
+    for r, row in enumerate(rows):
+        sample_params, sample_settings = apply_sample(params, settings, factors, row)
+        results = landscape_analysis(sample_params, states, settings=sample_settings, seed=seed, streaming=True)
+        outputs[r, 0] = results['final_deficit']
+        outputs[r, 1] = results['biogenic_impact_ratio']
+    return outputs
+
+
+def evaluate_samples(params, states, samples, factors, settings=None, seed=0, processes=None, batch_size=50):
+    """ Evaluates the landscape model for every row of a sample matrix, in batches distributed across a pool of worker
+    processes.
+
+    :param samples: sample matrix from saltelli_sample() (array of float)
+    :param settings: landscape settings overriding those in landscape_settings (dict)
+    :param seed: random number generator seed shared by all evaluations (int)
+    :param processes: number of worker processes, defaulting to the number of cores (int)
+    :param batch_size: number of samples per worker task (int)
+    :return: model outputs of shape (samples, len(sobol_outputs)) (array of float)
+    """
+
+    run_settings = dict(landscape_settings)
+    if settings:
+        run_settings.update(settings)
+    batches = [(params, states, run_settings, factors, samples[i:i+batch_size], seed)
+               for i in range(0, len(samples), batch_size)]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        outputs = []
+        for b, batch_outputs in enumerate(pool.imap(_evaluate_batch, batches)):
+            print '\r   Evaluated batch %i/%i' % (b+1, len(batches)),
+            outputs.append(batch_outputs)
+        print
+    finally:
+        pool.close()
+        pool.join()
+    return np.vstack(outputs)
+
+
+def sobol_indices(Y, D, bootstrap=1000, confidence=0.95, seed=None):
+    """ Computes first-order and total-order Sobol indices from model outputs ordered as in saltelli_sample(), with
+    percentile bootstrap confidence intervals.  Samples yielding non-finite outputs are excluded.
+
+    :param Y: model outputs for a single output variable (array of float)
+    :param D: number of factors (int)
+    :param bootstrap: number of bootstrap resamples (int)
+    :param confidence: confidence interval level (float)
+    :param seed: random number generator seed for bootstrap resampling (int)
+    :return: dictionary of 'S1', 'S1_low', 'S1_high', 'ST', 'ST_low', 'ST_high' arrays of length D (dict)
+    """
+
+    N = len(Y) / (D + 2)
+    blocks = np.reshape(Y, (D + 2, N))
+    valid = np.all(np.isfinite(blocks), axis=0)
+    blocks = blocks[:, valid]
+    f_A = blocks[0]
+    f_B = blocks[1]
+    f_AB = blocks[2:]
+
+    def estimate(index):
+        a = f_A[..., index]
+        b = f_B[..., index]
+        ab = f_AB[:, index]
+        variance = np.var(np.concatenate([a, b], axis=-1), axis=-1)
+        S1 = np.mean(b * (ab - a), axis=-1) / variance
+        ST = 0.5 * np.mean((a - ab)**2, axis=-1) / variance
+        return S1, ST
+
+    n_valid = f_A.shape[0]
+    S1, ST = estimate(np.arange(n_valid))
+
+    # bootstrap by resampling base sample rows; every factor is evaluated against each resample in a single operation
+    rng = np.random.RandomState(seed)
+    resamples = rng.randint(0, n_valid, size=(bootstrap, n_valid))
+    S1_boot = np.zeros((bootstrap, D))
+    ST_boot = np.zeros((bootstrap, D))
+    for k in range(bootstrap):
+        S1_boot[k], ST_boot[k] = estimate(resamples[k])
+    tail = 100 * (1 - confidence) / 2
+
+    return {'S1': S1,
+            'S1_low': np.percentile(S1_boot, tail, axis=0),
+            'S1_high': np.percentile(S1_boot, 100 - tail, axis=0),
+            'ST': ST,
+            'ST_low': np.percentile(ST_boot, tail, axis=0),
+            'ST_high': np.percentile(ST_boot, 100 - tail, axis=0)}
+
+
+def sobol_analysis(params, states, N=256, runs=200, factors=None, seed=0, processes=None, csv_fpath='sobol.csv'):
+    """ Runs a complete Sobol sensitivity analysis of the landscape model, printing the resulting indices and writing
+    them to a .csv file.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param N: base sample size (int)
+    :param runs: number of stands simulated per landscape evaluation (int)
+    :param factors: sensitivity factor definitions, defaulting to sobol_factors (list)
+    :param seed: seed for sampling and for the landscape disturbance draws (int)
+    :param processes: number of worker processes, defaulting to the number of cores (int)
+    :param csv_fpath: path of .csv file to receive the results table, or '' to skip writing (str)
+    :return: dictionary of sobol_indices() results keyed by output name (dict)
+    """
+
+    if factors is None:
+        factors = sobol_factors
+    D = len(factors)
+    print "Running Sobol sensitivity analysis: %i factors, N=%i, %i landscape evaluations of %i stands" % \
+          (D, N, N*(D+2), runs)
+
+    samples = saltelli_sample(factors, N, seed=seed)
+    Y = evaluate_samples(params, states, samples, factors, settings={'runs': runs}, seed=seed, processes=processes)
+
+    indices = {}
+    table = [['output', 'factor', 'S1', 'S1_low', 'S1_high', 'ST', 'ST_low', 'ST_high']]
+    for k, output in enumerate(sobol_outputs):
+        indices[output] = sobol_indices(Y[:, k], D, seed=seed)
+        print
+        print "Sobol indices for %s:" % output
+        print "   %-22s %8s %19s %8s %19s" % ('factor', 'S1', 'S1 95% CI', 'ST', 'ST 95% CI')
+        for i, factor in enumerate(factors):
+            row = [indices[output][key][i] for key in ('S1', 'S1_low', 'S1_high', 'ST', 'ST_low', 'ST_high')]
+            print "   %-22s %8.3f  (%7.3f, %7.3f) %8.3f  (%7.3f, %7.3f)" % tuple([factor[0]] + row)
+            table.append([output, factor[0]] + row)
+
+    if csv_fpath:
+        file_obj = open(csv_fpath, "wb")
+        c = csv.writer(file_obj)
+        c.writerows(table)
+        file_obj.close()
+
+    return indices
@@ -0,0 +1,178 @@
+""" This module extends the landscape simulation in landscape.py to a spatially explicit landscape, in which stands are
+cells of a raster grid (or polygons) connected by a sparse neighbour graph stored as a CSR adjacency matrix.  Fire
+ignites in each stand with the fuel-dependent risk used by dynamics.land(), and then spreads to neighbouring stands with
+a probability scaled by the receiving stand's surface fuel load; beetle infestation likewise spreads from stands
+infested in the previous year.  All spread calculations are sparse matrix-vector products over the whole landscape, so
+grids of 10^5-10^6 cells remain tractable over multi-century simulations.
+"""
+
+import numpy as np
+from scipy import sparse
+from landscape import pools, landscape_settings, initial_stands, three_PG_step, fire_step, infestation_step, \
+    carbon_accounting
+
+
+# default contagion settings for fire and beetle spread between neighbouring stands
+spread_settings = {'fire_spread': 0.1,   # per-neighbour spread probability into a stand at the reference fuel load
+                   'reference_fuel': 20.0,   # surface fuel load (w_l + 1.1*w_c) for the base spread probability, Mg/ha
+                   'max_spread_steps': 100,   # limit on fire spread iterations within a single year
+                   'beetle_spread': 0.1   # per-neighbour probability of infestation from a stand infested last year
+                   }
+
+
+def grid_adjacency(rows, columns, diagonal=False):
+    """ Builds the symmetric neighbour graph of a rectangular raster grid, with cells numbered in row-major order.
+
+    :param rows: number of grid rows (int)
+    :param columns: number of grid columns (int)
+    :param diagonal: include diagonal (queen's case) neighbours in addition to edge (rook's case) neighbours (bool)
+    :return: adjacency matrix of shape (rows*columns, rows*columns) (scipy.sparse.csr_matrix)
+    """
+
+    cells = np.arange(rows * columns).reshape(rows, columns)
+    offsets = [(0, 1), (1, 0)]
+    if diagonal:
+        offsets += [(1, 1), (1, -1)]
+
+    pairs = []
+    for d_row, d_column in offsets:
+        source = cells[max(0, -d_row):rows-max(0, d_row), max(0, -d_column):columns-max(0, d_column)]
+        target = cells[max(0, d_row):rows+min(0, d_row), max(0, d_column):columns+min(0, d_column)]
+        pairs.append(np.column_stack([source.ravel(), target.ravel()]))
+    return adjacency_from_pairs(rows * columns, np.vstack(pairs))
+
+
+def adjacency_from_pairs(n, pairs):
+    """ Builds a symmetric neighbour graph from a list of neighbouring stand index pairs, e.g. shared polygon edges.
+
+    :param n: number of stands (int)
+    :param pairs: array of shape (edges, 2) of neighbouring stand indices (array of int)
+    :return: adjacency matrix of shape (n, n) (scipy.sparse.csr_matrix)
+    """
+
+    pairs = np.asarray(pairs)
+    rows = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    columns = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    adjacency = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(n, n))
+    adjacency.data[:] = 1.0   # collapse any duplicate pairs
+    return adjacency
+
+
+def simulate_spatial_scenario(params, states, settings, harvest, rng, adjacency, spread=None):
+    """ Spatially explicit equivalent of landscape.simulate_scenario().  Each year, infestation is drawn first with a
+    probability raised by the number of neighbours infested the previous year; fires then ignite in non-infested stands
+    and spread outward front by front until no further stands ignite.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param settings: landscape time and disturbance settings in the landscape_settings structure (dict)
+    :param harvest: whether infested stands are salvage-harvested (bool)
+    :param rng: random number generator (numpy.random.RandomState)
+    :param adjacency: neighbour graph with one row per stand (scipy.sparse.csr_matrix)
+    :param spread: contagion settings overriding those in spread_settings (dict)
+    :return: dictionary of landscape-total time-series in the simulate_scenario() structure, plus 'spread_fires'
+        counting stands burned by spread rather than ignition (dict of arrays)
+    """
+
+    spread_params = dict(spread_settings)
+    if spread:
+        spread_params.update(spread)
+    runs = adjacency.shape[0]
+    start_year = int(settings['start_year'])
+    simulation_length = int(settings['simulation_length'])
+    infest_start = settings['infest_start']
+    infest_end = settings['infest_end']
+    fire_frequency = settings['fire_frequency']
+    infest_risk = settings['infest_probability'] / (infest_end - infest_start)
+    adjacency = sparse.csr_matrix(adjacency, dtype=float)
+
+    age, current = initial_stands(states, runs)
+    infested = np.zeros(runs, dtype=bool)
+
+    totals = dict((pool, np.zeros(simulation_length+1)) for pool in pools)
+    for pool, values in zip(pools, current):
+        totals[pool][0] = values.sum()
+    fires = np.zeros(simulation_length+1)
+    spread_fires = np.zeros(simulation_length+1)
+    infestations = np.zeros(simulation_length+1)
+    harvests = np.zeros(simulation_length+1)
+
+    for j in range(simulation_length):
+        year = start_year + j
+        infest_draw = rng.random_sample(runs)
+        fire_draw = rng.random_sample(runs)
+
+        # beetle infestation, with pressure from neighbours infested in the previous year
+        if infest_start <= year <= infest_end:
+            infested_neighbours = adjacency.dot(infested.astype(float))
+            infest_probability = 1 - (1 - infest_risk) * (1 - spread_params['beetle_spread'])**infested_neighbours
+            infested = infest_draw <= infest_probability
+        else:
+            infested = np.zeros(runs, dtype=bool)
+
+        # fire ignition, then contagious spread into unburned, uninfested neighbours of the most recent fire front
+        fuel = current[3] + (current[4] * 1.1)
+        burned = ~infested & (fire_draw <= (1.0/fire_frequency) * (fuel/20))
+        ignitions = burned.sum()
+        spread_probability = np.clip(spread_params['fire_spread'] * fuel / spread_params['reference_fuel'], 0.0, 1.0)
+        front = burned
+        for step in range(int(spread_params['max_spread_steps'])):
+            burning_neighbours = adjacency.dot(front.astype(float))
+            exposed = np.nonzero((burning_neighbours > 0) & ~burned & ~infested)[0]
+            if not len(exposed):
+                break
+            catch_probability = 1 - (1 - spread_probability[exposed])**burning_neighbours[exposed]
+            front = np.zeros(runs, dtype=bool)
+            front[exposed[rng.random_sample(len(exposed)) < catch_probability]] = True
+            burned |= front
+        grown = ~(infested | burned)
+
+        grown_pools = three_PG_step(age, params, *current)
+        burned_pools = fire_step(params, *current)
+        infested_pools, removed = infestation_step(params, harvest, *current)
+        current = [np.where(infested, i, np.where(burned, b, g))
+                   for g, b, i in zip(grown_pools, burned_pools, infested_pools)]
+        age = np.where(grown, age + 1, np.where(burned, 1, 0))
+
+        fires[j] = burned.sum()
+        spread_fires[j] = fires[j] - ignitions
+        infestations[j] = infested.sum()
+        harvests[j] = -removed[infested].sum()
+        for pool, values in zip(pools, current):
+            totals[pool][j+1] = values.sum()
+
+    totals['fires'] = fires
+    totals['spread_fires'] = spread_fires
+    totals['infestations'] = infestations
+    totals['harvests'] = harvests
+    return totals
+
+
+def spatial_landscape_analysis(params, states, rows=100, columns=100, adjacency=None, settings=None, spread=None,
+                               seed=None, basis=100):
+    """ Spatially explicit counterpart of landscape.landscape_analysis(), returning the same results structure.  The
+    landscape is a rows x columns raster grid unless an adjacency matrix (e.g. for a polygon landscape) is given.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param rows: number of grid rows (int)
+    :param columns: number of grid columns (int)
+    :param adjacency: neighbour graph overriding the raster grid (scipy.sparse.csr_matrix)
+    :param settings: landscape settings overriding those in landscape_settings (dict)
+    :param spread: contagion settings overriding those in spread_settings (dict)
+    :param seed: random number generator seed (int)
+    :param basis: GWPbio time horizon, years (int)
+    :return: dictionary of landscape analysis results (dict)
+    """
+
+    if adjacency is None:
+        adjacency = grid_adjacency(rows, columns)
+    run_settings = dict(landscape_settings)
+    if settings:
+        run_settings.update(settings)
+    run_settings['runs'] = adjacency.shape[0]
+    rng = np.random.RandomState(seed)
+
+    scenarios = [simulate_spatial_scenario(params, states, run_settings, harvest, rng, adjacency, spread=spread)
+                 for harvest in (False, True)]
+    return carbon_accounting(scenarios, run_settings, basis)
@@ -0,0 +1,143 @@
+""" This module solves for the quasi-steady-state distribution of stand ages and carbon pools under a given parameter
+set and fire regime, so that landscape simulations can start from equilibrium instead of from arbitrary initial pools
+followed by a discarded burn-in period.  Rather than simulating stands through centuries of transient, the
+expected-value transition operator in markov.py is iterated on the landscape state distribution until it stops
+changing, starting from an analytical first guess (a single stand's growth trajectory weighted by the stationary age
+distribution of the fire regime), and the equilibrium landscape is then sampled into per-stand initial states.
+
+The spin-up fire regime applies the constant hazard 1/fire_frequency, i.e. the risk at the reference fuel load, because
+with purely fuel-driven fire this model has no non-trivial equilibrium: stands that escape fire senesce, lose their
+fuel and stop burning altogether.  Results are memoized on disk, keyed by a hash of everything that determines them.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+from landscape import pools, landscape_settings, initial_stands, three_PG_step
+from markov import fuel_bin_edges, initial_mass, markov_step
+
+
+# version of the spin-up procedure, included in cache keys so that stale results are never reused
+spinup_version = 1
+
+
+def spinup_key(params, states, fire_frequency, runs, seed, n_ages, fuel_bins, tolerance):
+    """ Computes the cache key of a spin-up, as a hash of the parameter values and all spin-up settings.
+
+    :return: hexadecimal digest (str)
+    """
+
+    description = {'version': spinup_version,
+                   'params': dict((key, float(params[key][0])) for key in params),
+                   'states': dict((key, np.asarray(states[key][0]).tolist()) for key in ['age'] + pools),
+                   'fire_frequency': float(fire_frequency),
+                   'runs': int(runs),
+                   'seed': seed,
+                   'n_ages': int(n_ages),
+                   'fuel_bins': np.asarray(fuel_bins).tolist(),
+                   'tolerance': float(tolerance)}
+    return hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+
+
+def equilibrium_distribution(params, states, fire_frequency, n_ages=1000, fuel_bins=fuel_bin_edges, tolerance=1e-9,
+                             max_years=20000):
+    """ Iterates the expected-value transition operator under the fire regime alone (no infestation) until the
+    landscape state distribution converges.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param fire_frequency: mean fire return interval, years (float)
+    :param n_ages: number of age classes; older stands share the last class (int)
+    :param fuel_bins: upper edges of the surface fuel load bins, Mg/ha (array of float)
+    :param tolerance: convergence threshold on the total absolute change in age class probabilities and expected carbon
+        pools per stand over one year (float)
+    :param max_years: limit on the number of iterations (int)
+    :return: equilibrium state distribution in the markov.initial_mass() structure (array of float); number of years
+        iterated (int)
+    """
+
+    # first guess: the exact stationary age distribution under a constant fire hazard h, in which burned stands restart
+    # at age 1 and a stand of age a has probability h*(1-h)^(a-1) (the oldest class holding the remaining tail), with
+    # the pools of each age taken from one stand grown undisturbed from the initial state
+    hazard = 1.0 / fire_frequency
+    ages = np.arange(1, n_ages)
+    age, current = initial_stands(states, 1)
+    trajectory = np.zeros((len(ages), len(pools)))
+    for a in range(len(ages)):
+        trajectory[a] = [values[0] for values in current]
+        current = three_PG_step(age + a, params, *current)
+    weights = hazard * (1 - hazard)**(ages - 1)
+    weights[-1] = (1 - hazard)**(n_ages - 2)
+    guess = dict((pool, [trajectory[:, k]]) for k, pool in enumerate(pools))
+    guess['age'] = [ages]
+    mass = initial_mass(guess, n_ages, fuel_bins, weights=weights)
+
+    # the distribution across fuel bins within an age class never settles exactly, since bins pool stands with
+    # different fuel loads, so convergence is judged on the age distribution and the expected carbon pools
+    n_bins = len(fuel_bins) + 1
+    for year in range(1, max_years+1):
+        new_mass, burned, infested, removed = markov_step(mass, params, n_ages, fuel_bins, 0.0, fire_frequency, False,
+                                                          fuel_driven=False)
+        change = np.abs(new_mass[:, 0].reshape(n_ages, n_bins).sum(axis=1) -
+                        mass[:, 0].reshape(n_ages, n_bins).sum(axis=1)).sum() + \
+            np.abs(new_mass[:, 1:].sum(axis=0) - mass[:, 1:].sum(axis=0)).sum()
+        mass = new_mass
+        if change < tolerance:
+            return mass, year
+    print "WARNING- spin-up did not converge within %i years (final change %.2e)" % (max_years, change)
+    return mass, max_years
+
+
+def equilibrium_states(params, states, settings=None, seed=0, n_ages=1000, fuel_bins=fuel_bin_edges, tolerance=1e-9,
+                       cache_dir='spinup_cache'):
+    """ Returns per-stand initial states sampled from the equilibrium landscape under the fire regime in settings, in
+    the dynamics.states dictionary structure with one array of values per stand in place of each scalar initial value.
+    The result can be passed as the states argument of any of the landscape engines.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary from which the spin-up starts (dict of lists)
+    :param settings: landscape settings overriding those in landscape_settings; 'runs' sets the number of stands
+        sampled and 'fire_frequency' the mean fire return interval (dict)
+    :param seed: random number generator seed for sampling stands (int)
+    :param n_ages: number of age classes; older stands share the last class (int)
+    :param fuel_bins: upper edges of the surface fuel load bins, Mg/ha (array of float)
+    :param tolerance: convergence threshold passed to equilibrium_distribution() (float)
+    :param cache_dir: directory holding memoized spin-up results, or '' to disable caching (str)
+    :return: equilibrium initial state variable dictionary (dict of lists of arrays)
+    """
+
+    run_settings = dict(landscape_settings)
+    if settings:
+        run_settings.update(settings)
+    runs = int(run_settings['runs'])
+    fire_frequency = run_settings['fire_frequency']
+
+    key = spinup_key(params, states, fire_frequency, runs, seed, n_ages, fuel_bins, tolerance)
+    cache_fpath = os.path.join(cache_dir, key + '.npz')
+    if cache_dir and os.path.exists(cache_fpath):
+        cached = np.load(cache_fpath)
+        stand_values = dict((name, cached[name]) for name in ['age'] + pools)
+    else:
+        mass, years = equilibrium_distribution(params, states, fire_frequency, n_ages=n_ages, fuel_bins=fuel_bins,
+                                               tolerance=tolerance)
+        print "Spin-up converged after %i simulated years" % years
+
+        # sample stands from the equilibrium distribution, each taking the expected pools of its discrete state
+        occupied = np.nonzero(mass[:, 0] > 0)[0]
+        probabilities = mass[occupied, 0] / mass[occupied, 0].sum()
+        rng = np.random.RandomState(seed)
+        chosen = occupied[rng.choice(len(occupied), size=runs, p=probabilities)]
+        stand_values = {'age': (chosen // (len(fuel_bins) + 1)).astype(float)}
+        for k, pool in enumerate(pools):
+            stand_values[pool] = mass[chosen, k+1] / mass[chosen, 0]
+
+        if cache_dir:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            np.savez(cache_fpath, **stand_values)
+
+    equilibrium = dict((name, [stand_values[name]]) for name in ['age'] + pools)
+    equilibrium['LAI'] = [np.zeros(runs)]
+    equilibrium['interception'] = [np.zeros(runs)]
+    return equilibrium
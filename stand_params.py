@@ -0,0 +1,119 @@
+""" This module sets up heterogeneous landscapes for the vectorized landscape engine in landscape.py, in which every
+stand carries its own parameter values instead of the single global dynamics.params set.  Per-stand parameters are
+stored as struct-of-arrays columns: the dynamics.params dictionary structure, with an array of one value per stand in
+place of each scalar value that varies between stands, so that the engine's stand update broadcasts over them.
+
+Site-dependent parameters are derived from the FVS site table (Aspect, Slope, ElevFt) loaded into the working SQLite
+database by FVS.upload_convert_filter_process(), so that the real Colorado State Forest stand list is simulated in one
+vectorized pass.  The derivations are deliberately simple first-order adjustments of the global parameter values, with
+coefficients in site_coefficients:
+    * incoming short-wave radiation (phi_s) is raised on south-facing and lowered on north-facing slopes, in proportion
+      to the sine of the slope angle and the cosine of the aspect's departure from due south
+    * the temperature/moisture modifier (f_DT) declines linearly with elevation above a reference elevation
+    * the maximum stand age (age_max) rises linearly with elevation above the reference elevation
+The radiation and temperature/moisture adjustments are also kept as relative site factors, which scale the yearly
+values of time-varying climate drivers (see climate.ClimateDrivers.year_params()).
+"""
+
+import sqlite3
+import numpy as np
+from climate import site_factor_bounds
+from landscape import landscape_analysis
+
+
+# coefficients deriving stand parameters from site data, in the dynamics.params structure
+site_coefficients = {'reference_elevation': [9500, 'ft', 'elevation at which the global parameter values apply'],
+                     'phi_s_slope_aspect': [0.5, '-', 'relative radiation gain of a due-south slope per unit sine of '
+                                                      'slope angle (and loss of a due-north slope)'],
+                     'f_DT_elevation': [0.05, '1/1000 ft', 'relative decline of the temperature/moisture modifier '
+                                                           'per 1000 ft above the reference elevation'],
+                     'age_max_elevation': [0.1, '1/1000 ft', 'relative increase of the maximum stand age per 1000 ft '
+                                                             'above the reference elevation']
+                     }
+
+# site table columns used to derive stand parameters
+site_columns = ['Aspect', 'Slope', 'ElevFt']
+
+
+def read_site_table(db_fpath):
+    """ Reads the site data of every stand from the working database, leaving out stands with incomplete site data.
+
+    :param db_fpath: full path to the working SQLite database (str)
+    :return: StandIDs (list of str); dictionary of site columns, each with one value per stand in the order of the
+        StandIDs (dict of arrays of float)
+    """
+
+    con = sqlite3.connect(db_fpath)
+    with con:
+        cur = con.cursor()
+        cur.execute("SELECT StandID, %s FROM site ORDER BY StandID" % ', '.join(site_columns))
+        rows = cur.fetchall()
+    con.close()
+
+    complete = [row for row in rows if None not in row[1:]]
+    if len(complete) < len(rows):
+        print "Omitting %i of %i stands with incomplete site data" % (len(rows) - len(complete), len(rows))
+    values = np.array([row[1:] for row in complete], dtype=float).reshape(len(complete), len(site_columns))
+    return [str(row[0]) for row in complete], dict((column, values[:, c]) for c, column in enumerate(site_columns))
+
+
+def derive_stand_params(params, site, coefficients=None):
+    """ Derives per-stand parameters from site data, as struct-of-arrays columns in the dynamics.params structure.
+    Parameters not derived from site data keep their global scalar values.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param site: dictionary of 'Aspect' (degrees), 'Slope' (percent) and 'ElevFt' (ft) arrays, e.g. from
+        read_site_table() (dict of arrays of float)
+    :param coefficients: coefficients overriding those in site_coefficients (dict)
+    :return: parameter dictionary with arrays of one value per stand for 'phi_s', 'f_DT' and 'age_max', and the
+        relative site adjustments 'phi_s_site_factor' and 'f_DT_site_factor' applied to climate drivers by
+        climate.ClimateDrivers.year_params() (dict)
+    """
+
+    coefficient_values = dict((key, site_coefficients[key][0]) for key in site_coefficients)
+    if coefficients:
+        coefficient_values.update((key, coefficients[key][0]) for key in coefficients)
+
+    slope_angle = np.arctan(np.asarray(site['Slope'], dtype=float) / 100.0)
+    southness = np.cos(np.radians(np.asarray(site['Aspect'], dtype=float) - 180.0))
+    elevation = (np.asarray(site['ElevFt'], dtype=float) - coefficient_values['reference_elevation']) / 1000.0
+
+    site_factors = {'phi_s': 1 + coefficient_values['phi_s_slope_aspect'] * np.sin(slope_angle) * southness,
+                    'f_DT': 1 - coefficient_values['f_DT_elevation'] * elevation}
+
+    stand_params = dict(params)
+    for name in ('phi_s', 'f_DT'):
+        low, high = site_factor_bounds[name]
+        stand_params[name] = [np.clip(params[name][0] * site_factors[name], low, high)] + list(params[name][1:])
+        stand_params[name + '_site_factor'] = [site_factors[name], '-', 'relative site adjustment of %s' % name]
+    stand_params['age_max'] = [np.maximum(params['age_max'][0] * (1 + coefficient_values['age_max_elevation'] *
+                                                                  elevation), 1.0)] + list(params['age_max'][1:])
+    return stand_params
+
+
+def heterogeneous_landscape_analysis(params, states, db_fpath, coefficients=None, settings=None, seed=None,
+                                     **kwargs):
+    """ Runs the landscape analysis on the stand list of an FVS working database, each stand with its own
+    site-derived parameters.
+
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param db_fpath: full path to the working SQLite database holding the site table (str)
+    :param coefficients: coefficients overriding those in site_coefficients (dict)
+    :param settings: landscape settings overriding those in landscape.landscape_settings; 'runs' is set to the number of
+        stands (dict)
+    :param seed: random number generator seed (int)
+    :param kwargs: further keyword arguments of landscape.landscape_analysis(), e.g. climate, whose drivers are
+        scaled by the site factor of each stand (dict)
+    :return: dictionary of landscape analysis results, as from landscape.landscape_analysis(), with the 'stand_ids' and
+        per-stand 'stand_params' simulated (dict)
+    """
+
+    stand_ids, site = read_site_table(db_fpath)
+    stand_params = derive_stand_params(params, site, coefficients)
+    run_settings = dict(settings or {})
+    run_settings['runs'] = len(stand_ids)
+    results = landscape_analysis(stand_params, states, settings=run_settings, seed=seed, **kwargs)
+    results['stand_ids'] = stand_ids
+    results['stand_params'] = stand_params
+    return results
@@ -0,0 +1,55 @@
+""" Checks that compressed FVS results files are read like their plain .csv counterparts, whatever their line endings.
+Skipped when the analysis_tools and db_tools modules FVS.py depends on are not installed.
+"""
+
+import csv
+import gzip
+import os
+import sqlite3
+import pytest
+
+FVS = pytest.importorskip('FVS')
+
+
+rows = [['StandID', 'Year', 'Aboveground_Total_Live'],
+        ['T1_MedBow_LS1', '2014', '41.5'],
+        ['T1_MedBow_LS2', '2014', '"38.25"'],
+        ['T1_MedBow_LS3', '2019', '']]
+
+
+def write_results(directory, newline):
+    # write the same results as a plain and a gzip-compressed .csv file
+    text = newline.join(','.join(row) for row in rows) + newline
+    plain_fpath = os.path.join(str(directory), 'results.csv')
+    with open(plain_fpath, 'wb') as file_obj:
+        file_obj.write(text)
+    with gzip.open(plain_fpath + '.gz', 'wb') as file_obj:
+        file_obj.write(text)
+    return plain_fpath
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n', '\r'])
+@pytest.mark.parametrize('block_size', [1, 7, 4*1024*1024])
+def test_compressed_lines_match_plain(tmpdir, newline, block_size):
+    plain_fpath = write_results(tmpdir, newline)
+    plain = FVS.open_results_file(plain_fpath)
+    compressed = FVS.open_results_file(plain_fpath + '.gz', block_size=block_size)
+    try:
+        assert list(csv.reader(compressed)) == list(csv.reader(plain))
+    finally:
+        plain.close()
+        compressed.close()
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r'])
+def test_compressed_upload_matches_plain(tmpdir, newline):
+    plain_fpath = write_results(tmpdir, newline)
+    db_fpath = os.path.join(str(tmpdir), 'results.db')
+    FVS.type_assignment_bulk_convert_upload(plain_fpath, db_fpath, 'plain')
+    FVS.type_assignment_bulk_convert_upload(plain_fpath + '.gz', db_fpath, 'compressed')
+    con = sqlite3.connect(db_fpath)
+    plain = con.execute("SELECT * FROM plain").fetchall()
+    compressed = con.execute("SELECT * FROM compressed").fetchall()
+    con.close()
+    assert len(plain) == len(rows) - 1
+    assert compressed == plain
@@ -0,0 +1,59 @@
+""" Checks that time-varying climate drivers combine with site-derived per-stand parameters: constant drivers equal to
+the global parameter values must leave homogeneous and heterogeneous landscape analyses unchanged.
+"""
+
+import numpy as np
+import pytest
+from climate import ClimateDrivers
+from landscape import landscape_analysis
+from stand_params import derive_stand_params
+
+
+params = {'age_max': [150, 'years', 'estimated maximum stand age'],
+          'n_age': [4, '-', 'hydraulic conductivity age modifier exponent'],
+          'phi_s': [5.5, 'kWh/m2/day', 'annually-averaged incoming short-wave radiation'],
+          'f_DT': [0.55, '-', 'annually-averaged temperature/moisture modifier value'],
+          'sigma_f': [3.2, 'm2/kg', 'specific leaf area'],
+          'beers_k': [0.4, '-', 'Beers Law light extinction coefficient'],
+          'microbial_efficiency': [0.25, '-', 'Fraction of C entering soil that gets stabilized']
+          }
+
+states = {'age': [0], 'w_f': [0.1], 'w_s': [0.1], 'w_r': [0.1], 'w_l': [0.1], 'w_c': [0.1], 'w_o': [40], 'LAI': [0],
+          'interception': [0]}
+
+runs = 200
+settings = {'runs': runs}
+
+
+def random_sites(seed=0):
+    rng = np.random.RandomState(seed)
+    return {'Aspect': rng.uniform(0, 360, runs), 'Slope': rng.uniform(0, 80, runs),
+            'ElevFt': rng.uniform(8500, 11000, runs)}
+
+
+def constant_drivers(stands=None):
+    shape = (200,) if stands is None else (200, stands)
+    return ClimateDrivers(1915, {'phi_s': np.full(shape, params['phi_s'][0]),
+                                 'f_DT': np.full(shape, params['f_DT'][0])})
+
+
+def test_constant_drivers_homogeneous():
+    reference = landscape_analysis(params, states, settings=settings, seed=5)
+    results = landscape_analysis(params, states, settings=settings, seed=5, climate=constant_drivers())
+    np.testing.assert_array_equal(results['cumulative_deficit'], reference['cumulative_deficit'])
+
+
+@pytest.mark.parametrize('stands', [None, runs])
+def test_constant_drivers_heterogeneous(stands):
+    stand_params = derive_stand_params(params, random_sites())
+    reference = landscape_analysis(stand_params, states, settings=settings, seed=5)
+    results = landscape_analysis(stand_params, states, settings=settings, seed=5, climate=constant_drivers(stands))
+    np.testing.assert_array_equal(results['cumulative_deficit'], reference['cumulative_deficit'])
+    np.testing.assert_array_equal(results['cumulative_harvest'], reference['cumulative_harvest'])
+
+
+def test_per_stand_values_without_site_factor():
+    stand_params = dict(params)
+    stand_params['phi_s'] = [np.linspace(5.0, 6.0, runs)] + params['phi_s'][1:]
+    with pytest.raises(ValueError):
+        landscape_analysis(stand_params, states, settings=settings, seed=5, climate=constant_drivers())
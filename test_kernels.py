@@ -0,0 +1,45 @@
+""" Checks that the compiled landscape backend in kernels.py matches the NumPy engine in landscape.py, for every sampling
+mode, when both are given the same seed.  Skipped when Numba is not installed.
+"""
+
+import os
+import tempfile
+
+# keep Numba's on-disk compilation cache out of the source tree; must be set before Numba is imported
+os.environ.setdefault('NUMBA_CACHE_DIR', tempfile.mkdtemp(prefix='numba_cache'))
+
+import numpy as np
+import pytest
+import kernels
+from landscape import landscape_analysis, sampling_modes
+
+
+params = {'age_max': [150, 'years', 'estimated maximum stand age'],
+          'n_age': [4, '-', 'hydraulic conductivity age modifier exponent'],
+          'phi_s': [5.5, 'kWh/m2/day', 'annually-averaged incoming short-wave radiation'],
+          'f_DT': [0.55, '-', 'annually-averaged temperature/moisture modifier value'],
+          'sigma_f': [3.2, 'm2/kg', 'specific leaf area'],
+          'beers_k': [0.4, '-', 'Beers Law light extinction coefficient'],
+          'microbial_efficiency': [0.25, '-', 'Fraction of C entering soil that gets stabilized']
+          }
+
+states = {'age': [0], 'w_f': [0.1], 'w_s': [0.1], 'w_r': [0.1], 'w_l': [0.1], 'w_c': [0.1], 'w_o': [40], 'LAI': [0],
+          'interception': [0]}
+
+settings = {'runs': 60}
+
+
+@pytest.mark.skipif(not kernels.numba_available, reason="Numba is not installed")
+@pytest.mark.parametrize('sampling', sampling_modes)
+def test_backends_match(sampling):
+    reference = landscape_analysis(params, states, settings=settings, seed=11, sampling=sampling, backend='numpy')
+    compiled = landscape_analysis(params, states, settings=settings, seed=11, sampling=sampling, backend='jit')
+
+    for key in ('plot_years', 'cumulative_deficit', 'cumulative_harvest', 'nee_difference', 'simulated_forcing',
+                'biogenic_CO2eq', 'biogenic_impact_ratio'):
+        np.testing.assert_allclose(compiled[key], reference[key], rtol=1e-9, atol=1e-6, err_msg=key)
+    for s in (0, 1):
+        assert set(compiled['scenarios'][s]) == set(reference['scenarios'][s])
+        for key in reference['scenarios'][s]:
+            np.testing.assert_allclose(compiled['scenarios'][s][key], reference['scenarios'][s][key], rtol=1e-9,
+                                       atol=1e-6, err_msg='scenario %i %s' % (s, key))
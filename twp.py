@@ -0,0 +1,288 @@
+""" This module provides vectorized Technology Warming Potential (TWP) calculations for emission libraries in the
+structure used by LCA.LCA(), i.e. {variable: [name_string, color_map, [[species1, [timeseries1]], ...]]}, without the
+per-flux decay loops and plotting of that routine.  The forcing of every flux in a species' emission series is the
+convolution of the series with the species' forcing response to a unit emission, so the net forcing of a library is a
+batch of convolutions, and the cumulative forcing and TWP for every time horizon follow from cumulative sums.  Unlike
+LCA.py, this module can be imported without running an analysis.
+
+The impulse-response and radiative efficiency parameters of each greenhouse gas or aerosol species are read from the
+species registry ghg_species.csv, so that species can be added without code changes.  Many supply-chain pathway
+variants, defined in a pathway table such as pathways.csv, can be evaluated and ranked together with batch_twp().
+"""
+
+import csv
+import figures
+import os
+import numpy as np
+
+
+def load_species(fpath=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ghg_species.csv')):
+    """ Reads the species registry, a CSV file with one row per decay term of each species and the columns species,
+    fraction, lifetime (years, 0 for a persistent fraction), radiative_efficiency (W/m2*ppb) and mass_conversion
+    (ppbv/Mg).
+
+    :param fpath: registry file path (str)
+    :return: decay parameters in the ghg_decay_params structure (dict); forcing parameters in the ghg_forcing_params
+        structure (dict)
+    """
+
+    decay_params = {}
+    forcing_params = {}
+    for row in csv.DictReader(open(fpath, 'rU')):
+        species = row['species']
+        decay_params.setdefault(species, []).append((float(row['fraction']), float(row['lifetime'])))
+        forcing_params[species] = (float(row['radiative_efficiency']), float(row['mass_conversion']))
+    return decay_params, forcing_params
+
+
+# format, as in LCA.LCA(): [(a0, t0), (a1, t1)...] for c(t) = a0 * exp((-1.0*t)/t0) + a1 * exp((-1.0*t)/t1) + ...,
+# with a lifetime of 0 denoting a persistent fraction; and (radiative forcing alpha term in W/m2*ppb, emission mass to
+# atmospheric conversion constant in ppbv/Mg)
+ghg_decay_params, ghg_forcing_params = load_species()
+
+# forcing responses already computed, keyed by (species, duration)
+_responses = {}
+
+# columns of the array returned by twp_sweep()
+twp_sweep_columns = ['horizon', 'bioenergy_forcing', 'reference_forcing', 'cumulative_bioenergy_forcing',
+                     'cumulative_reference_forcing', 'TWP', 'cumulative_TWP']
+
+
+def forcing_response(species, duration):
+    """ Radiative forcing in each year following a unit emission of a species, in the units of LCA.LCA().  Responses
+    are computed once per species and duration and cached.
+
+    :param species: species name, a key of ghg_decay_params and ghg_forcing_params (str)
+    :param duration: number of years (int)
+    :return: forcing, uWh/m2 per g/MJ emitted (read-only array of float)
+    """
+
+    key = (species, int(duration))
+    if key not in _responses:
+        _responses[key] = _species_response(species, duration)
+        _responses[key].flags.writeable = False
+    return _responses[key]
+
+
+def _species_response(species, duration):
+    """ Computes the forcing response of forcing_response() from the species registry parameters. """
+
+    years = np.arange(duration)
+    remaining = np.zeros(duration)
+    for a_i, t_i in ghg_decay_params[species]:
+        if t_i:
+            remaining += a_i * np.exp((-1.0*years)/t_i)
+        else:
+            remaining += a_i
+    alpha, mass_conc = ghg_forcing_params[species]
+    return remaining * mass_conc * alpha * (24*365) * 1E-6   # uWh/m2
+
+
+def emission_matrix(library, TWP_length):
+    """ Arranges the emission series of an emissions library as the rows of a matrix, padded with zeros or truncated
+    to TWP_length years.
+
+    :param library: emissions library in the LCA.LCA() structure (dict)
+    :param TWP_length: number of years (int)
+    :return: (source key, species) label of each row (list of tuples); emissions, g/MJ (array of float)
+    """
+
+    labels = []
+    rows = []
+    for key in sorted(library):
+        for species, flux_timeseries in library[key][2]:
+            fluxes = np.zeros(TWP_length)
+            values = np.asarray(flux_timeseries[:TWP_length], dtype=float)
+            fluxes[:len(values)] = values
+            labels.append((key, species))
+            rows.append(fluxes)
+    return labels, np.array(rows).reshape(len(rows), TWP_length)
+
+
+def batch_forcing(emissions, species, TWP_length):
+    """ Forcing of many emission series at once, as the product of their Fourier transforms with those of the
+    corresponding species responses (a batched linear convolution).
+
+    :param emissions: emission series, one per row, g/MJ (array of float)
+    :param species: species emitted in each row (list of str)
+    :param TWP_length: number of years (int)
+    :return: forcing of each row in each year, uWh/MJ (array of float)
+    """
+
+    size = 2 * TWP_length   # padded so that the circular convolution does not wrap around
+    responses = np.array([forcing_response(name, TWP_length) for name in species]).reshape(len(species), TWP_length)
+    spectra = np.fft.rfft(emissions, size, axis=-1) * np.fft.rfft(responses, size, axis=-1)
+    return np.fft.irfft(spectra, size, axis=-1)[..., :TWP_length]
+
+
+def library_forcing(library, TWP_length, by_source=False):
+    """ Net forcing of every emission source in an emissions library, equal to the 'Net forcing' series plotted by
+    LCA.LCA().  Emission series longer than TWP_length are truncated.
+
+    :param library: emissions library in the LCA.LCA() structure (dict)
+    :param TWP_length: number of years (int)
+    :param by_source: also return the forcing of each (source key, species) emission series (bool)
+    :return: net forcing in each year, uWh/MJ (array of float); if by_source, also the row labels and per-row forcing
+        of emission_matrix() (list of tuples, array of float)
+    """
+
+    labels, emissions = emission_matrix(library, TWP_length)
+    forcing = batch_forcing(emissions, [species for key, species in labels], TWP_length)
+    if by_source:
+        return forcing.sum(axis=0), labels, forcing
+    return forcing.sum(axis=0)
+
+
+def twp_sweep(bioenergy_emissions, reference_emissions, max_horizon=300):
+    """ Evaluates the forcing of the bioenergy and reference emission libraries and their Technology Warming Potential
+    for every time horizon from 1 to max_horizon years in a single pass.  TWP is the ratio of the bioenergy to the
+    reference net forcing in the final year of the horizon, as plotted by LCA.LCA(); cumulative_TWP is the ratio of
+    the forcings integrated over the horizon.
+
+    :param bioenergy_emissions: bioenergy emissions library in the LCA.LCA() structure (dict)
+    :param reference_emissions: reference emissions library in the LCA.LCA() structure (dict)
+    :param max_horizon: longest time horizon, years (int)
+    :return: array of shape (max_horizon, 7), one row per horizon with the values listed in twp_sweep_columns (array
+        of float)
+    """
+
+    bioenergy = library_forcing(bioenergy_emissions, max_horizon)
+    reference = library_forcing(reference_emissions, max_horizon)
+    cumulative_bioenergy = np.cumsum(bioenergy)
+    cumulative_reference = np.cumsum(reference)
+    return np.column_stack([np.arange(1, max_horizon + 1), bioenergy, reference, cumulative_bioenergy,
+                            cumulative_reference, bioenergy / reference, cumulative_bioenergy / cumulative_reference])
+
+
+# cases of the emission libraries making up each pathway
+pathway_cases = ['bioenergy', 'reference']
+
+
+def read_pathways(fpath):
+    """ Reads bioenergy pathway definitions from a CSV table with one row per emission series and the columns pathway,
+    case ('bioenergy' or 'reference'), source, species, and either emissions (annual emissions in g/MJ, separated by
+    spaces, starting in the year of fuel production) or emissions_file (path of a file with one annual emission per
+    line, such as the fluxes.csv written by the dynamics.py 'uncert' command).
+
+    :param fpath: pathway table file path (str)
+    :return: pathway names in table order (list of str); bioenergy and reference emission libraries of each pathway in
+        the LCA.LCA() structure (dict of lists of dict)
+    """
+
+    names = []
+    pathways = {}
+    files = {}
+    for row in csv.DictReader(open(fpath, 'rU')):
+        name = row['pathway']
+        if name not in pathways:
+            names.append(name)
+            pathways[name] = [{} for case in pathway_cases]
+        if row.get('emissions_file'):
+            emissions_fpath = row['emissions_file']
+            if emissions_fpath not in files:
+                files[emissions_fpath] = [float(line[0]) for line in csv.reader(open(emissions_fpath, 'rU'))]
+            series = files[emissions_fpath]
+        else:
+            series = [float(value) for value in row['emissions'].split()]
+        library = pathways[name][pathway_cases.index(row['case'])]
+        library.setdefault(row['source'], [row['source'], 'Greys', []])[2].append([row['species'], series])
+    return names, pathways
+
+
+def pathway_forcing(names, pathways, TWP_length=300):
+    """ Net forcing of the bioenergy and reference libraries of many pathways.  The emission series of all pathways are
+    stacked into one matrix and convolved with the cached species responses in a single batch, and the forcing of each
+    series is then summed into its pathway and case.
+
+    :param names: pathway names (list of str)
+    :param pathways: emission libraries of each pathway, as returned by read_pathways() (dict of lists of dict)
+    :param TWP_length: number of years (int)
+    :return: net forcing of each pathway (rows) and case (pathway_cases order) in each year, uWh/MJ (array of float)
+    """
+
+    rows = []
+    species = []
+    targets = []
+    for p, name in enumerate(names):
+        for c, library in enumerate(pathways[name]):
+            labels, emissions = emission_matrix(library, TWP_length)
+            rows.append(emissions)
+            species += [label[1] for label in labels]
+            targets += [(p, c)] * len(labels)
+    forcing = batch_forcing(np.vstack(rows), species, TWP_length)
+
+    nets = np.zeros((len(names), len(pathway_cases), TWP_length))
+    targets = np.array(targets).reshape(len(targets), 2)
+    np.add.at(nets, (targets[:, 0], targets[:, 1]), forcing)
+    return nets
+
+
+def plot_pathway(name, nets, fpath):
+    """ Plots the net bioenergy and reference forcing and the Technology Warming Potential of one pathway, in the
+    layout of the TWP.png figure rendered by LCA.LCA().
+
+    :param name: pathway name, used as the figure title (str)
+    :param nets: net forcing of the pathway in each case, as one row of pathway_forcing() (array of float)
+    :param fpath: output image file path (str)
+    """
+
+    import matplotlib.pyplot as plt
+
+    TWP_length = nets.shape[-1]
+    years = range(TWP_length)
+    fig, axes = plt.subplots(3, sharex=True)
+    for c, title in enumerate(['Forcing- biomass harvest, biofuel production & use',
+                               'Forcing- reference gasoline production & use']):
+        axes[c].plot(years, nets[c], color='k', linewidth=3.0)
+        axes[c].plot([0, TWP_length-1], [0, 0], linestyle='--', color='k', linewidth=2.0)
+        axes[c].set_title(title)
+        axes[c].set_ylabel('uWh/MJ')
+    axes[2].plot(years, nets[0] / nets[1], color='k', linewidth=3.0)
+    axes[2].plot([0, TWP_length-1], [1, 1], linestyle='--', color='k', linewidth=2.0)
+    axes[2].set_title('Technology Warming Potential')
+    axes[2].set_xlim(0, TWP_length)
+    axes[2].set_ylabel('ratio')
+    axes[2].set_xlabel('Time elapsed after stand harvest, fuel production & use')
+    axes[2].grid()
+    fig.suptitle(name)
+    plt.savefig(fpath, dpi=300)
+    plt.close()
+
+
+def batch_twp(pathways_fpath='pathways.csv', results_fpath='pathway_TWP.csv', TWP_length=300,
+              horizons=(20, 50, 100, 300), plot_pathways=()):
+    """ Computes net forcing and the TWP curve for every pathway in a pathway table, writes the TWP and cumulative TWP
+    of each pathway at the requested horizons to a results table, and renders figures only for the pathways named in
+    plot_pathways.
+
+    :param pathways_fpath: pathway table file path, in the read_pathways() format (str)
+    :param results_fpath: results table file path (str)
+    :param TWP_length: number of years (int)
+    :param horizons: time horizons tabulated, each no longer than TWP_length, years (tuple of int)
+    :param plot_pathways: names of the pathways to plot, each to TWP_<name>.png; the figures are rendered and written
+        in the background, and figures.wait() returns once they are all written (tuple of str)
+    :return: pathway names (list of str); net forcing of each pathway and case, as from pathway_forcing() (array of
+        float)
+    """
+
+    names, pathways = read_pathways(pathways_fpath)
+    nets = pathway_forcing(names, pathways, TWP_length)
+    cumulative = np.cumsum(nets, axis=-1)
+
+    file_obj = open(results_fpath, "wb")
+    c = csv.writer(file_obj)
+    header = ['pathway']
+    for horizon in horizons:
+        header += ['TWP_%i' % horizon, 'cumulative_TWP_%i' % horizon]
+    c.writerow(header)
+    for p, name in enumerate(names):
+        row = [name]
+        for horizon in horizons:
+            row += [nets[p, 0, horizon-1] / nets[p, 1, horizon-1],
+                    cumulative[p, 0, horizon-1] / cumulative[p, 1, horizon-1]]
+        c.writerow(row)
+    file_obj.close()
+
+    for name in plot_pathways:
+        figures.submit(plot_pathway, name, nets[names.index(name)], 'TWP_%s.png' % name)
+    return names, nets
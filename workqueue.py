@@ -0,0 +1,422 @@
+""" This module distributes landscape ensembles and FVS scenario batches across the nodes of a cluster that share a
+filesystem but have no scheduler service.  A coordinator writes task descriptors to a work queue held in a SQLite
+database on the shared disk: either a range of landscape analysis iterations with its random number seed, simulated
+with landscape.landscape_analysis(), or an RX/control file prefix pair, processed as in FVS.CSF_analysis().  Any number
+of worker processes, on any node, claim tasks from the queue and write their results back to it.
+
+A claimed task is leased to its worker for a limited time, which a background thread of the worker keeps renewing
+while the task runs.  If the worker dies, its lease expires and the task is claimed again by another worker; a task
+whose attempts all fail is marked as failed with the error raised.  Because result writes are only accepted from the
+worker currently holding the lease, a task is never completed twice.  Claims are made within immediate (write-locking)
+SQLite transactions, and the database keeps the default rollback journal, since write-ahead logging does not work on
+network filesystems.
+
+Workers are started on each node with "python workqueue.py <queue database> [worker name]", and run_local_workers()
+starts a set of them on the local machine, e.g. to test a batch before sending it to the cluster.
+"""
+
+import cPickle
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import numpy as np
+
+
+# work queue settings
+queue_settings = {'lease_seconds': 600,   # time a worker holds a task without renewing its lease
+                  'max_attempts': 3,   # claims of a task before it is marked as failed
+                  'poll_seconds': 5,   # wait between claims of an idle worker
+                  'busy_timeout': 60   # seconds to wait for another process's lock on the queue database
+                  }
+
+
+class WorkQueue(object):
+    """ Queue of task descriptors and their results in a SQLite database, with leases on claimed tasks.
+    """
+
+    def __init__(self, db_fpath, settings=None):
+        """
+        :param db_fpath: full path to the queue database, created if it does not exist (str)
+        :param settings: work queue settings overriding those in queue_settings (dict)
+        """
+
+        self.db_fpath = db_fpath
+        self.settings = dict(queue_settings)
+        if settings:
+            self.settings.update(settings)
+        con = self.connect()
+        con.execute(""" CREATE TABLE IF NOT EXISTS tasks (TaskID INTEGER PRIMARY KEY, Kind TEXT, Descriptor TEXT,
+                                                          Status TEXT, Worker TEXT, LeaseExpires REAL,
+                                                          Attempts INTEGER, Result BLOB, Error TEXT, Finished REAL)""")
+        con.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (Status, LeaseExpires)")
+        con.close()
+
+    def connect(self):
+        # autocommit connection; transactions that must be atomic are opened explicitly
+        return sqlite3.connect(self.db_fpath, timeout=self.settings['busy_timeout'], isolation_level=None)
+
+    def submit(self, kind, descriptors):
+        """ Adds tasks to the queue.
+
+        :param kind: task kind, a key of task_handlers (str)
+        :param descriptors: task descriptors (list of JSON-serializable dict)
+        :return: TaskIDs of the new tasks (list of int)
+        """
+
+        if kind not in task_handlers:
+            raise ValueError("Unknown task kind '%s'" % kind)
+        con = self.connect()
+        task_ids = []
+        con.execute("BEGIN IMMEDIATE")
+        for descriptor in descriptors:
+            cur = con.execute("INSERT INTO tasks (Kind, Descriptor, Status, Attempts) VALUES (?, ?, 'pending', 0)",
+                              (kind, json.dumps(descriptor, sort_keys=True)))
+            task_ids.append(cur.lastrowid)
+        con.execute("COMMIT")
+        con.close()
+        return task_ids
+
+    def claim(self, worker):
+        """ Leases the oldest task that is pending, or whose lease has expired, to a worker.
+
+        :param worker: worker name (str)
+        :return: TaskID (int), task kind (str) and task descriptor (dict), or None if no task is available (tuple)
+        """
+
+        now = time.time()
+        con = self.connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            row = con.execute(""" SELECT TaskID, Kind, Descriptor, Attempts FROM tasks
+                                  WHERE Status='pending' OR (Status='leased' AND LeaseExpires<?)
+                                  ORDER BY TaskID LIMIT 1 """, (now,)).fetchone()
+            if row is None:
+                con.execute("COMMIT")
+                return None
+            task_id, kind, descriptor, attempts = row
+            if attempts >= self.settings['max_attempts']:
+                # the last worker to claim this task died without reporting; give up on it
+                con.execute("UPDATE tasks SET Status='failed', Error=?, Finished=? WHERE TaskID=?",
+                            ('lease expired on final attempt', now, task_id))
+                con.execute("COMMIT")
+                return self.claim(worker)
+            con.execute("UPDATE tasks SET Status='leased', Worker=?, LeaseExpires=?, Attempts=? WHERE TaskID=?",
+                        (worker, now + self.settings['lease_seconds'], attempts + 1, task_id))
+            con.execute("COMMIT")
+        finally:
+            con.close()
+        return task_id, str(kind), json.loads(descriptor)
+
+    def renew(self, task_id, worker):
+        """ Extends a worker's lease on a task.
+
+        :return: whether the worker still holds the lease (bool)
+        """
+
+        con = self.connect()
+        cur = con.execute("UPDATE tasks SET LeaseExpires=? WHERE TaskID=? AND Status='leased' AND Worker=?",
+                          (time.time() + self.settings['lease_seconds'], task_id, worker))
+        con.close()
+        return cur.rowcount == 1
+
+    def complete(self, task_id, worker, result):
+        """ Writes the result of a task, provided the worker still holds its lease.
+
+        :param result: task result (picklable object)
+        :return: whether the result was accepted (bool)
+        """
+
+        con = self.connect()
+        cur = con.execute(""" UPDATE tasks SET Status='done', Result=?, Error=NULL, Finished=?
+                              WHERE TaskID=? AND Status='leased' AND Worker=? """,
+                          (sqlite3.Binary(cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)), time.time(), task_id,
+                           worker))
+        con.close()
+        return cur.rowcount == 1
+
+    def fail(self, task_id, worker, error):
+        """ Reports a task that raised an error, returning it to the queue unless its attempts are used up.
+
+        :param error: error message or traceback (str)
+        :return:
+        """
+
+        con = self.connect()
+        con.execute(""" UPDATE tasks SET Status=CASE WHEN Attempts>=? THEN 'failed' ELSE 'pending' END, Error=?,
+                                         Finished=?
+                        WHERE TaskID=? AND Status='leased' AND Worker=? """,
+                    (self.settings['max_attempts'], error, time.time(), task_id, worker))
+        con.close()
+
+    def progress(self):
+        """ Counts the tasks in each status.
+
+        :return: dictionary of task counts keyed by 'pending', 'leased', 'done' and 'failed' (dict of int)
+        """
+
+        counts = dict((status, 0) for status in ('pending', 'leased', 'done', 'failed'))
+        con = self.connect()
+        for status, count in con.execute("SELECT Status, COUNT(*) FROM tasks GROUP BY Status"):
+            counts[str(status)] = count
+        con.close()
+        return counts
+
+    def results(self, kind):
+        """ Reads the descriptors and results of the completed tasks of one kind.
+
+        :param kind: task kind (str)
+        :return: (descriptor, result) pairs in the order the tasks were submitted (list of tuples)
+        """
+
+        con = self.connect()
+        rows = con.execute("SELECT Descriptor, Result FROM tasks WHERE Kind=? AND Status='done' ORDER BY TaskID",
+                           (kind,)).fetchall()
+        con.close()
+        return [(json.loads(descriptor), cPickle.loads(str(result))) for descriptor, result in rows]
+
+    def errors(self):
+        """ Reads the errors of the failed tasks.
+
+        :return: (TaskID, descriptor, error) of every failed task (list of tuples)
+        """
+
+        con = self.connect()
+        rows = con.execute(""" SELECT TaskID, Descriptor, Error FROM tasks
+                               WHERE Status='failed' ORDER BY TaskID """).fetchall()
+        con.close()
+        return [(task_id, json.loads(descriptor), error) for task_id, descriptor, error in rows]
+
+
+def landscape_task(descriptor):
+    """ Runs the landscape analysis iterations of a 'landscape' task, iteration i drawing from seed+i.
+
+    :param descriptor: dictionary of 'params' (dynamics.params structure), 'states' (dynamics.states structure, with
+        scalar initial values), 'settings' (landscape_settings overrides), 'first_iteration', 'last_iteration'
+        (exclusive), 'seed' and, optionally, 'climate', the path to climate drivers read with
+        climate.load_climate_drivers() (dict)
+    :return: dictionary of 'iterations' and, for every iteration, 'cumulative_deficit', 'cumulative_harvest',
+        'biogenic_impact_ratio' (dict of arrays); and 'plot_years' (array of int)
+    """
+
+    from climate import load_climate_drivers
+    from landscape import landscape_analysis
+    climate = load_climate_drivers(descriptor['climate']) if descriptor.get('climate') else None
+    iterations = range(descriptor['first_iteration'], descriptor['last_iteration'])
+    deficits = []
+    harvests = []
+    ratios = []
+    for i in iterations:
+        results = landscape_analysis(descriptor['params'], descriptor['states'], settings=descriptor['settings'],
+                                     seed=descriptor['seed'] + i, climate=climate)
+        deficits.append(results['cumulative_deficit'])
+        harvests.append(results['cumulative_harvest'])
+        ratios.append(results['biogenic_impact_ratio'])
+    return {'iterations': np.array(iterations),
+            'plot_years': results['plot_years'],
+            'cumulative_deficit': np.array(deficits),
+            'cumulative_harvest': np.array(harvests),
+            'biogenic_impact_ratio': np.array(ratios)}
+
+
+def fvs_task(descriptor):
+    """ Loads, checks and plots one FVS scenario of an 'fvs' task, as in FVS.CSF_analysis().
+
+    :param descriptor: dictionary of 'working_path', 'db_file', 'rx_control_prefixes', 'site_file' and, optionally,
+        'filter_string', 'fvs_db_file', 'exclude_stands' (list) and 'qc_thresholds', as in CSF_analysis() (dict)
+    :return: dictionary of 'archive_path' (str) and 'passed' quality control (bool) (dict)
+    """
+
+    import figures
+    import FVS
+    exclude_stands = descriptor.get('exclude_stands')
+    try:
+        archive_path, stand_C_dictionary = FVS.upload_convert_filter_process(
+            descriptor['working_path'], descriptor['db_file'], descriptor['rx_control_prefixes'],
+            descriptor['site_file'], filter_string=descriptor.get('filter_string', ''),
+            fvs_db_file=descriptor.get('fvs_db_file', ''),
+            exclude_stands=set(exclude_stands) if exclude_stands else None)
+        database_fpath = archive_path + descriptor['db_file']
+        passed = FVS.summarize_data(database_fpath, descriptor.get('qc_thresholds'))
+        if passed:
+            FVS.plot_deficit_detail(stand_C_dictionary, archive_path)
+            FVS.plot_all_deficits(stand_C_dictionary, database_fpath, archive_path)
+            FVS.plot_stand_dynamics(stand_C_dictionary, database_fpath, archive_path)
+    except Exception:
+        # wait on the figures queued before the failure, so that they (and their errors) are not left in the shared
+        # writer for the next task, then re-raise the task's own error
+        error = sys.exc_info()
+        try:
+            figures.wait()
+        except Exception:
+            pass
+        raise error[0], error[1], error[2]
+    figures.wait()   # the task is only complete once its figures are on disk
+    return {'archive_path': archive_path, 'passed': passed}
+
+
+# task kinds and the functions running them in the workers
+task_handlers = {'landscape': landscape_task,
+                 'fvs': fvs_task}
+
+
+def submit_landscape_ensemble(queue, params, states, iterations, iterations_per_task=5, seed=0, settings=None,
+                              climate_path=''):
+    """ Splits a landscape ensemble into tasks of consecutive iterations.
+
+    :param queue: work queue (WorkQueue)
+    :param params: model parameter dictionary in the dynamics.params structure (dict)
+    :param states: initial state variable dictionary in the dynamics.states structure (dict of lists)
+    :param iterations: number of landscape analyses (int)
+    :param iterations_per_task: number of landscape analyses per task (int)
+    :param seed: base random number generator seed (int)
+    :param settings: landscape settings overriding those in landscape_settings (dict)
+    :param climate_path: optional path, on the shared disk, to climate drivers for every task (str)
+    :return: TaskIDs (list of int)
+    """
+
+    descriptors = [{'params': params,
+                    'states': states,
+                    'settings': settings or {},
+                    'first_iteration': first,
+                    'last_iteration': min(first + iterations_per_task, iterations),
+                    'seed': seed,
+                    'climate': climate_path}
+                   for first in range(0, iterations, iterations_per_task)]
+    return queue.submit('landscape', descriptors)
+
+
+def collect_landscape_ensemble(queue):
+    """ Gathers the completed landscape ensemble iterations in iteration order.
+
+    :param queue: work queue (WorkQueue)
+    :return: dictionary in the landscape_task() structure covering every completed iteration (dict of arrays)
+    """
+
+    results = [result for descriptor, result in queue.results('landscape')]
+    if not results:
+        return None
+    ensemble = {'plot_years': results[0]['plot_years']}
+    for name in ('iterations', 'cumulative_deficit', 'cumulative_harvest', 'biogenic_impact_ratio'):
+        ensemble[name] = np.concatenate([result[name] for result in results])
+    order = np.argsort(ensemble['iterations'])
+    for name in ('iterations', 'cumulative_deficit', 'cumulative_harvest', 'biogenic_impact_ratio'):
+        ensemble[name] = ensemble[name][order]
+    return ensemble
+
+
+def submit_fvs_scenarios(queue, working_path, db_file, rx_control_file_prefix_set, site_file, filter_string='',
+                         fvs_db_file='', exclude_stands=None, qc_thresholds=None):
+    """ Adds one task per RX/control file prefix pair of an FVS scenario batch, with the arguments of CSF_analysis().
+
+    :return: TaskIDs (list of int)
+    """
+
+    descriptors = [{'working_path': working_path,
+                    'db_file': db_file,
+                    'rx_control_prefixes': list(prefixes),
+                    'site_file': site_file,
+                    'filter_string': filter_string,
+                    'fvs_db_file': fvs_db_file,
+                    'exclude_stands': sorted(exclude_stands) if exclude_stands else None,
+                    'qc_thresholds': qc_thresholds or {}}
+                   for prefixes in rx_control_file_prefix_set]
+    return queue.submit('fvs', descriptors)
+
+
+class LeaseKeeper(threading.Thread):
+    """ Background thread renewing a worker's lease on its task until stopped.
+    """
+
+    def __init__(self, queue, task_id, worker):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.queue = queue
+        self.task_id = task_id
+        self.worker = worker
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.queue.settings['lease_seconds'] / 3.0):
+            if not self.queue.renew(self.task_id, self.worker):
+                print "WARNING- worker %s lost its lease on task %i" % (self.worker, self.task_id)
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(db_fpath, worker=None, exit_when_idle=True, settings=None):
+    """ Claims and runs tasks from a work queue until none remain pending or leased (or, with exit_when_idle=False,
+    indefinitely), writing each result or error back to the queue.
+
+    :param db_fpath: full path to the queue database (str)
+    :param worker: worker name, defaulting to <host>-<process ID> (str)
+    :param exit_when_idle: return once the queue holds no pending or leased tasks (bool)
+    :param settings: work queue settings overriding those in queue_settings (dict)
+    :return: number of tasks completed by this worker (int)
+    """
+
+    queue = WorkQueue(db_fpath, settings)
+    if worker is None:
+        worker = '%s-%i' % (socket.gethostname(), os.getpid())
+    completed = 0
+    while True:
+        task = queue.claim(worker)
+        if task is None:
+            counts = queue.progress()
+            if exit_when_idle and counts['pending'] == 0 and counts['leased'] == 0:
+                return completed
+            time.sleep(queue.settings['poll_seconds'])
+            continue
+
+        task_id, kind, descriptor = task
+        print "Worker %s running %s task %i" % (worker, kind, task_id)
+        keeper = LeaseKeeper(queue, task_id, worker)
+        keeper.start()
+        try:
+            result = task_handlers[kind](descriptor)
+        except Exception:
+            keeper.stop()
+            queue.fail(task_id, worker, traceback.format_exc())
+            print "Worker %s: task %i failed" % (worker, task_id)
+            continue
+        keeper.stop()
+        if queue.complete(task_id, worker, result):
+            completed += 1
+        else:
+            print "WARNING- worker %s discarded the result of task %i, whose lease had passed to another worker" % \
+                  (worker, task_id)
+
+
+def run_local_workers(db_fpath, processes=None, settings=None):
+    """ Runs a set of workers on the local machine until the queue is drained.  Workers are separate (non-daemonic)
+    processes, so that tasks may start process pools of their own, e.g. the figure writer in figures.py.
+
+    :param db_fpath: full path to the queue database (str)
+    :param processes: number of worker processes, defaulting to the number of cores (int)
+    :param settings: work queue settings overriding those in queue_settings (dict)
+    :return: task counts by status once the workers have finished, as from WorkQueue.progress() (dict of int)
+    """
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    workers = [multiprocessing.Process(target=run_worker,
+                                       args=(db_fpath, '%s-local%i' % (socket.gethostname(), w)),
+                                       kwargs={'settings': settings})
+               for w in range(processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    return WorkQueue(db_fpath, settings).progress()
+
+
+if __name__ == '__main__':
+    run_worker(sys.argv[1], *sys.argv[2:3])